@@ -1,22 +1,155 @@
 # app.py (Version avec CRUD complet et API Présence/Documents)
 
 import os
+import sys
 import sqlite3
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Config, Request, request, jsonify, render_template, send_from_directory, g, Response, stream_with_context, has_request_context
 import json
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge, NotFound
 import time
 import datetime
 import calendar
+import base64
+import csv
+import io
+import zipfile
+import hashlib
+import hmac
+import tempfile
+import re
+import mimetypes
+import multiprocessing
+import threading
+import bisect
+import itertools
+import shutil
+import collections
+import contextvars
+from concurrent.futures import ProcessPoolExecutor
+import click
+from contextlib import closing, contextmanager
+from functools import wraps
+# Miniatures : Pillow pour les images, PyMuPDF (facultatif) pour la première page des PDF
+try: from PIL import Image, ImageOps
+except ImportError: Image = None
+try: import pymupdf
+except ImportError: pymupdf = None
+# Statistiques par enfant : grilles en tableaux NumPy (facultatif : sans NumPy, même résultat par des boucles Python)
+try: import numpy as np
+except ImportError: np = None
+
+# --- Téléversements : écrits sur disque au fil de la réception, hachés en même temps ---
+class HashingSpool:
+    """Fichier temporaire (dans uploads/tmp) qui calcule SHA-256 et taille pendant que Werkzeug y écrit la requête.
+    La limite de taille est vérifiée à chaque bloc : un fichier trop gros est abandonné sans être lu en entier."""
+    def __init__(self, directory, limit):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part'); self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256(); self.size = 0; self.limit = limit
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit: self.close(); raise RequestEntityTooLarge(f"Fichier trop volumineux (maximum {self.limit // (1024 * 1024)} Mo)")
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name): return getattr(self.file, name)
+
+    def close(self):
+        """Ferme le fichier et supprime le temporaire s'il n'a pas été rangé par store_upload."""
+        self.file.close()
+        if os.path.exists(self.path):
+            try: os.remove(self.path)
+            except OSError as e: print(f"Erreur suppression du fichier temporaire {self.path}: {e}")
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpool(os.path.join(app.config['UPLOAD_FOLDER'], 'tmp'), app.config['MAX_UPLOAD_MB'] * 1024 * 1024)
+
+# --- Multi-centres : chemins propres au centre servi ---
+# En mode multi-centres (TENANTS_FOLDER), chaque garderie a son dossier TENANTS_FOLDER/<centre>/ avec ces fichiers et dossiers
+TENANT_PATHS = {'DATABASE': 'daycare.db', 'UPLOAD_FOLDER': 'uploads', 'BACKUP_FOLDER': 'backups', 'ARCHIVE_FOLDER': 'archives'}
+TENANT_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,62}$')
+# Centre imposé hors requête (fils d'arrière-plan, rapport consolidé) : voir tenant_context
+_tenant_override = contextvars.ContextVar('garderie_tenant', default=None)
+
+def current_tenant():
+    """Centre servi : celui de tenant_context, sinon celui de la requête (TenantMiddleware), sinon TENANT (commandes flask)."""
+    tenant = _tenant_override.get()
+    if tenant is None and has_request_context(): return request.environ.get('garderie.tenant')
+    return tenant or dict.get(app.config, 'TENANT')
+
+@contextmanager
+def tenant_context(tenant):
+    token = _tenant_override.set(tenant)
+    try: yield
+    finally: _tenant_override.reset(token)
+
+class TenantConfig(Config):
+    """Configuration dont les chemins de TENANT_PATHS désignent, en mode multi-centres, ceux du centre servi : connexions,
+    caches par base (clés app.config['DATABASE']), téléversements, sauvegardes et archives suivent le centre sans le connaître."""
+    def __getitem__(self, key):
+        if key in TENANT_PATHS and dict.get(self, 'TENANTS_FOLDER'):
+            tenant = current_tenant()
+            if tenant: return os.path.join(dict.__getitem__(self, 'TENANTS_FOLDER'), tenant, TENANT_PATHS[key])
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
 
 # --- Configuration de Flask ---
-app = Flask(__name__, template_folder='.', static_folder='uploads')
+# Pas de dossier statique : /uploads/ est servi par uploaded_file (arborescence adressée par contenu)
+app = Flask(__name__, template_folder='.', static_folder=None)
+app.request_class = UploadRequest
+app.config = TenantConfig(app.root_path, app.config)
 app.config['DATABASE'] = 'daycare.db'
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['MAX_UPLOAD_MB'] = 25  # taille maximale d'un fichier téléversé, vérifiée pendant la réception
+# Derrière un proxy : USE_X_SENDFILE (Apache, lighttpd) ou UPLOADS_X_ACCEL_PREFIX (nginx, ex. '/protected-uploads/',
+# location « internal » pointant sur uploads/) laissent le proxy envoyer le fichier ; sinon sendfile via wsgi.file_wrapper
+app.config['USE_X_SENDFILE'] = False
+app.config['UPLOADS_X_ACCEL_PREFIX'] = None  # en multi-centres, la location pointe sur TENANTS_FOLDER : <préfixe>/<centre>/uploads/...
+app.config['UPLOADS_MAX_AGE'] = 365 * 24 * 3600  # fichiers adressés par contenu : jamais modifiés à la même adresse
+app.config['THUMBNAIL_SIZE'] = 320  # côté maximal des miniatures (px)
+app.config['THUMBNAIL_WORKERS'] = 2  # processus du pool de miniatures (la commande build-thumbnails utilise tous les cœurs)
+# Réglages SQLite appliqués à chaque connexion (voir _connect)
+app.config['DB_BUSY_TIMEOUT_MS'] = 5000
+app.config['DB_SYNCHRONOUS'] = 'NORMAL'  # sûr en mode WAL, évite un fsync par commit
+app.config['DB_CACHE_SIZE_KIB'] = 16384
+app.config['MAX_PAGE_SIZE'] = 1000  # plafond de ?limit= pour les listes paginées
+app.config['METRICS_ENABLED'] = True  # latence par route et par requête SQL, exposée sur /metrics
+app.config['SLOW_QUERY_MS'] = None  # ex. 100 : journalise les instructions SQL plus lentes que ce seuil
+# Sauvegardes (voir create_snapshot) : un instantané toutes les BACKUP_INTERVAL_HOURS heures pendant que le serveur tourne
+# (None : seulement « flask backup »), les BACKUP_KEEP plus récents sont conservés
+app.config['BACKUP_FOLDER'] = 'backups'
+app.config['BACKUP_INTERVAL_HOURS'] = 24
+app.config['BACKUP_KEEP'] = 14
+app.config['BACKUP_PAGES_PER_STEP'] = 1024  # pages copiées par étape de l'API de sauvegarde (4 Mo avec des pages de 4 Kio)
+app.config['BACKUP_STEP_SLEEP'] = 0.005  # pause (s) entre deux étapes
+# Alertes (voir evaluate_alerts) : réévaluées en arrière-plan toutes les ALERT_INTERVAL_SECONDS secondes (None : seulement « flask check-alerts »)
+app.config['ALERT_INTERVAL_SECONDS'] = 60
+app.config['ALERT_LEAD_DAYS'] = 30  # préavis avant l'expiration de l'assurance ou un changement de tranche d'âge
+# Documents obligatoires : type (trouvé dans le type du document, sans tenir compte de la casse) -> âge maximal en mois
+app.config['ALERT_REQUIRED_DOCUMENTS'] = {'first aid': 36}
+# Années clôturées par « flask close-year » : une base par année, attachée en lecture seule quand une période l'atteint
+app.config['ARCHIVE_FOLDER'] = 'archives'
+# Multi-centres (voir TenantMiddleware) : un processus sert les garderies de TENANTS_FOLDER (ex. 'centres'), choisies par
+# sous-domaine (<centre>.TENANT_DOMAIN) ou, sans TENANT_DOMAIN, par préfixe d'URL (/t/<centre>/...). None : un seul centre.
+app.config['TENANTS_FOLDER'] = None
+app.config['TENANT_DOMAIN'] = None
+app.config['TENANT'] = None  # centre visé par les commandes flask en mode multi-centres (GARDERIE_TENANT=<centre>)
+# Jeton exigé par le rapport consolidé /api/centres/summary (en-tête Authorization: Bearer <jeton>) ; None : rapport désactivé
+app.config['CENTRES_SUMMARY_TOKEN'] = None
+# Connexions réutilisées d'une requête à l'autre (voir ConnectionPool)
+app.config['DB_POOL_DATABASES'] = 32  # bases gardées ouvertes avec leurs caches ; la moins récemment servie est fermée
+app.config['DB_POOL_IDLE'] = 2  # connexions inactives gardées par base
 app.json.ensure_ascii = False
+# Variables d'environnement GARDERIE_<CLÉ> (ex. GARDERIE_DATABASE, GARDERIE_BACKUP_KEEP=30) : valables pour le serveur et les commandes flask
+app.config.from_prefixed_env('GARDERIE')
 
-# Créer le dossier uploads s'il n'existe pas
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
+# Créer le dossier uploads s'il n'existe pas (en multi-centres : à la création de chaque centre)
+if not app.config['TENANTS_FOLDER'] and not os.path.exists(app.config['UPLOAD_FOLDER']):
     try:
         os.makedirs(app.config['UPLOAD_FOLDER'])
         print(f"Dossier créé : {app.config['UPLOAD_FOLDER']}")
@@ -24,123 +157,988 @@ if not os.path.exists(app.config['UPLOAD_FOLDER']):
         print(f"Erreur lors de la création du dossier {app.config['UPLOAD_FOLDER']}: {e}")
         exit(1)
 
+# --- Métriques (latence par route, instructions SQL), exposées au format texte Prometheus sur /metrics ---
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_HELP = {
+    'http_request_duration_seconds': ('histogram', "Durée de traitement des requêtes HTTP par route (hors diffusion du corps)"),
+    'http_requests_total': ('counter', "Requêtes HTTP par route, méthode et statut"),
+    'sqlite_statement_duration_seconds': ('histogram', "Durée d'exécution des instructions SQL (préparation et première étape) par route et instruction"),
+    'sqlite_rows_returned_total': ('counter', "Lignes lues par route et instruction"),
+    'sqlite_connections_opened_total': ('counter', "Connexions SQLite ouvertes"),
+    'sqlite_pool_evictions_total': ('counter', "Bases fermées par le pool de connexions (la moins récemment servie)"),
+}
+# Instruction réduite à son verbe et sa table (« SELECT income ») : un nombre de séries borné
+SQL_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE|EXISTS)\s+(\w+)', re.IGNORECASE)
+
+class Metrics:
+    """Compteurs et histogrammes du processus, protégés par un verrou (serveur multithread).
+    Chaque série est identifiée par (nom, tuple de paires (étiquette, valeur))."""
+    def __init__(self):
+        self.lock = threading.Lock(); self.counters = {}; self.histograms = {}
+
+    def inc(self, name, labels=(), amount=1):
+        with self.lock: self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None: histogram = self.histograms[(name, labels)] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+            histogram[0][bisect.bisect_left(LATENCY_BUCKETS, value)] += 1; histogram[1] += value
+
+    def render(self):
+        """Format d'exposition texte de Prometheus (version 0.0.4)."""
+        with self.lock:
+            series = {**{key: value for key, value in self.counters.items()}, **{key: (list(buckets), total) for key, (buckets, total) in self.histograms.items()}}
+        format_labels = lambda labels: '{' + ','.join(f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in labels) + '}' if labels else ''
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (metric, labels), value in sorted(series.items()):
+                if metric != name: continue
+                if kind == 'counter': lines.append(f"{name}{format_labels(labels)} {value}"); continue
+                buckets, total = value; cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                    cumulative += count; lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines += [f"{name}_sum{format_labels(labels)} {total}", f"{name}_count{format_labels(labels)} {cumulative}"]
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def _statement_labels(sql):
+    verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else '?'
+    match = SQL_TABLE.search(sql) if verb in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH') else None
+    return (('endpoint', (request.endpoint or 'inconnu') if has_request_context() else 'hors_requete'), ('statement', f"{verb} {match.group(1)}" if match else verb))
+
+class TimedCursor(sqlite3.Cursor):
+    """Curseur qui mesure chaque instruction et compte les lignes lues ; journalise les instructions lentes.
+    Les lignes sont cumulées sur le curseur et versées au compteur une seule fois (instruction suivante ou fin du curseur)."""
+    def __init__(self, connection):
+        super().__init__(connection); self.labels = None; self.rows = 0
+
+    def _flush(self):
+        if self.rows and self.labels: metrics.inc('sqlite_rows_returned_total', self.labels, self.rows)
+        self.rows = 0
+
+    def _record(self, sql, started):
+        elapsed = time.perf_counter() - started; self.labels = _statement_labels(sql)
+        metrics.observe('sqlite_statement_duration_seconds', self.labels, elapsed)
+        if app.config['SLOW_QUERY_MS'] is not None and elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+            print(f"Requête SQL lente ({elapsed * 1000:.1f} ms, {self.labels[0][1]}) : {' '.join(sql.split())[:500]}")
+
+    def execute(self, sql, parameters=()):
+        self._flush(); started = time.perf_counter()
+        try: return super().execute(sql, parameters)
+        finally: self._record(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush(); started = time.perf_counter()
+        try: return super().executemany(sql, seq_of_parameters)
+        finally: self._record(sql, started)
+
+    def fetchone(self):
+        row = super().fetchone(); self.rows += row is not None; return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size); self.rows += len(rows); return rows
+
+    def fetchall(self):
+        rows = super().fetchall(); self.rows += len(rows); return rows
+
+    def __next__(self):
+        row = super().__next__(); self.rows += 1; return row
+
+    def __del__(self):
+        self._flush()
+
+class TimedConnection(sqlite3.Connection):
+    """Connexion dont tous les curseurs, y compris ceux des raccourcis execute(), sont des TimedCursor."""
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Pour une réponse diffusée, mesure jusqu'au retour de la vue (le corps est produit ensuite)
+    if app.config['METRICS_ENABLED'] and 'request_started' in g:
+        labels = (('endpoint', request.endpoint or 'inconnu'), ('method', request.method))
+        metrics.observe('http_request_duration_seconds', labels, time.perf_counter() - g.request_started)
+        metrics.inc('http_requests_total', labels + (('status', response.status_code),))
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# --- Multi-centres : choix du centre de la requête ---
+TENANT_PREFIX = re.compile(r'^/t/([^/]+)(/.*)?$')
+# Routes communes à tous les centres (aucune base de centre ouverte)
+TENANT_FREE_ENDPOINTS = {'prometheus_metrics', 'get_centres_summary'}
+
+class TenantMiddleware:
+    """Intergiciel WSGI : en mode multi-centres, lit le centre dans le sous-domaine (<centre>.TENANT_DOMAIN) ou, sans
+    TENANT_DOMAIN, dans le préfixe /t/<centre>/ retiré du chemin et ajouté à SCRIPT_NAME (url_for et request.script_root
+    le gardent). Le centre est rangé dans environ['garderie.tenant'], lu par current_tenant."""
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if app.config['TENANTS_FOLDER']:
+            domain = app.config['TENANT_DOMAIN']; tenant = None
+            if domain:
+                host = environ.get('HTTP_HOST', '').split(':')[0].lower()
+                if host.endswith('.' + domain.lower()): tenant = host[:-len(domain) - 1]
+            else:
+                match = TENANT_PREFIX.match(environ.get('PATH_INFO', ''))
+                if match:
+                    tenant = match.group(1); environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/t/' + tenant; environ['PATH_INFO'] = match.group(2) or '/'
+            if tenant and TENANT_NAME.match(tenant): environ['garderie.tenant'] = tenant
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = TenantMiddleware(app.wsgi_app)
+
+@app.before_request
+def check_tenant():
+    if not app.config['TENANTS_FOLDER'] or request.endpoint in TENANT_FREE_ENDPOINTS: return None
+    tenant = current_tenant()
+    if not tenant or not TENANT_NAME.match(tenant) or not os.path.isdir(os.path.join(app.config['TENANTS_FOLDER'], tenant)):
+        return jsonify({"error": "Centre inconnu"}), 404
+    return None
+
+def list_tenants():
+    """Centres servis : les dossiers de TENANTS_FOLDER au nom valide, ou [None] en centre unique."""
+    root = app.config['TENANTS_FOLDER']
+    if not root: return [None]
+    if not os.path.isdir(root): return []
+    return sorted(name for name in os.listdir(root) if TENANT_NAME.match(name) and os.path.isdir(os.path.join(root, name)))
+
+def connect_read_only(database=None):
+    """Connexion en lecture seule, hors pool (rapport consolidé, état des centres) : n'écrit ni ne migre rien."""
+    db = sqlite3.connect(f"file:{os.path.abspath(database or app.config['DATABASE'])}?mode=ro", uri=True, timeout=app.config['DB_BUSY_TIMEOUT_MS'] / 1000)
+    db.row_factory = sqlite3.Row
+    return db
+
+def run_for_each_tenant(task, label):
+    """Exécute `task()` dans le contexte de chaque centre (une seule fois en centre unique) ; l'erreur d'un centre
+    n'arrête pas les suivants. Sont sautés les centres dont la base n'existe pas ou n'est pas encore à niveau
+    (migrations faites à la première requête ou par « flask create-tenant »)."""
+    for tenant in list_tenants():
+        with tenant_context(tenant):
+            try:
+                if tenant:
+                    if not os.path.exists(app.config['DATABASE']): continue
+                    with closing(connect_read_only()) as db:
+                        if db.execute("PRAGMA user_version").fetchone()[0] < MIGRATIONS[-1][0]: continue
+                task()
+            except Exception as e: print(f"Erreur {label}{f' (centre {tenant})' if tenant else ''} : {e}")
+            finally:
+                # Centre que seules les tâches d'arrière-plan ont ouvert : ses entrées de cache ne restent pas, le pool
+                # reste seul à décider quels centres sont résidents
+                if tenant and app.config['DATABASE'] not in pool: forget_database(app.config['DATABASE'])
+
 # --- Fonctions de Base de Données ---
 
+# Bases déjà passées en journal WAL (le mode est persistant dans le fichier, on ne le règle qu'une fois)
+_wal_configured = set()
+
+def _connect(database=None):
+    """Ouvre une connexion configurée (clés étrangères, délai d'attente, cache, WAL) sur `database` ou la base configurée."""
+    database = database or app.config['DATABASE']
+    # IMMEDIATE : la transaction implicite ouverte avant une écriture prend le verrou d'écriture d'emblée, en attendant
+    # (busy_timeout) qu'un autre processus le libère ; une transaction DEFERRED promue en écriture échouerait aussitôt
+    # (« database is locked ») si un autre worker a écrit depuis sa première lecture
+    # uri=True : les archives sont attachées par URI (file:...?mode=ro), un chemin ordinaire reste accepté ;
+    # check_same_thread=False : le pool passe une connexion d'un fil à l'autre, jamais à deux requêtes à la fois
+    conn = sqlite3.connect(database, timeout=app.config['DB_BUSY_TIMEOUT_MS'] / 1000, isolation_level='IMMEDIATE', uri=True, check_same_thread=False,
+                           factory=TimedConnection if app.config['METRICS_ENABLED'] else sqlite3.Connection)
+    if app.config['METRICS_ENABLED']: metrics.inc('sqlite_connections_opened_total')
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA busy_timeout = {int(app.config['DB_BUSY_TIMEOUT_MS'])}")
+    conn.execute(f"PRAGMA synchronous = {app.config['DB_SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA cache_size = -{int(app.config['DB_CACHE_SIZE_KIB'])}")
+    if database not in _wal_configured:
+        conn.execute("PRAGMA journal_mode = WAL")
+        _wal_configured.add(database)
+    return conn
+
+class ConnectionPool:
+    """Connexions inactives gardées d'une requête à l'autre, par base (au plus DB_POOL_IDLE chacune) : ni réouverture ni
+    perte du cache de pages entre deux requêtes. Au plus DB_POOL_DATABASES bases sont gardées ; la moins récemment servie
+    est fermée et ses entrées des caches par base (paramètres, rapports, statistiques) oubliées : la mémoire reste bornée
+    quel que soit le nombre de centres."""
+    def __init__(self):
+        self.lock = threading.Lock(); self.databases = collections.OrderedDict()
+
+    def acquire(self, database):
+        evicted = []
+        with self.lock:
+            idle = self.databases.get(database)
+            if idle is None:
+                idle = self.databases[database] = []
+                while len(self.databases) > app.config['DB_POOL_DATABASES']: evicted.append(self.databases.popitem(last=False))
+            else: self.databases.move_to_end(database)
+            conn = idle.pop() if idle else None
+        for name, connections in evicted:
+            for old in connections: old.close()
+            forget_database(name)
+            if app.config['METRICS_ENABLED']: metrics.inc('sqlite_pool_evictions_total')
+        return conn or _connect(database)
+
+    def release(self, database, conn):
+        if conn.in_transaction: conn.rollback()
+        with self.lock:
+            idle = self.databases.get(database)
+            if idle is not None and len(idle) < app.config['DB_POOL_IDLE']: idle.append(conn); return
+        conn.close()
+
+    def __contains__(self, database):
+        with self.lock: return database in self.databases
+
+    def clear(self):
+        """Ferme toutes les connexions gardées (avant un fork : une connexion SQLite ne doit pas passer au processus enfant)."""
+        with self.lock: databases = list(self.databases.values()); self.databases.clear()
+        for connections in databases:
+            for conn in connections: conn.close()
+
+def forget_database(database):
+    """Oublie les entrées d'une base dans les caches du processus (base évincée du pool)."""
+    _settings_cache.pop(database, None); _wal_configured.discard(database); _schema_checked.discard(database)
+    for cache in (_report_cache, _child_stats_cache):
+        for key in [key for key in list(cache) if key[0] == database]: cache.pop(key, None)
+
+pool = ConnectionPool()
+# Multi-centres : bases dont le schéma a été vérifié (et mis à niveau si besoin) depuis leur entrée dans le pool
+_schema_checked = set()
+
 def get_db():
-    """Établit une connexion à la base de données."""
-    try:
-        conn = sqlite3.connect(app.config['DATABASE'])
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON")
-        return conn
-    except sqlite3.Error as e:
-        print(f"Erreur de connexion à la base de données : {e}")
-        raise
+    """Retourne la connexion de la requête courante (une seule par contexte d'application, rendue au pool au teardown).
+    En mode multi-centres, la première connexion d'un centre met son schéma à niveau si besoin (migrations à la demande)."""
+    if 'db' not in g:
+        database = app.config['DATABASE']
+        try:
+            g.db = pool.acquire(database); g.db_path = database
+        except sqlite3.Error as e:
+            print(f"Erreur de connexion à la base de données : {e}")
+            raise
+        if app.config['TENANTS_FOLDER'] and database not in _schema_checked:
+            # Deux requêtes simultanées peuvent toutes deux migrer : init_db re-vérifie la version sous le verrou d'écriture
+            if g.db.execute("PRAGMA user_version").fetchone()[0] < MIGRATIONS[-1][0]: init_db()
+            _schema_checked.add(database)
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exception=None):
+    """Rend la connexion de la requête au pool ; annule une transaction laissée ouverte par une erreur."""
+    # Une réponse diffusée lit encore la connexion après la vue : elle sera rendue au teardown
+    # du contexte que stream_with_context repousse pendant la diffusion
+    if g.pop('db_streaming', False): return
+    db = g.pop('db', None)
+    if db is not None: pool.release(g.pop('db_path'), db)
+
+# --- Migrations du schéma (version suivie par PRAGMA user_version) ---
+
+def _migration_1_base_schema(cursor):
+    """Tables de base et paramètres par défaut (idempotent : les bases existantes les ont déjà)."""
+    # Table Enfants
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS children (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, first_name TEXT NOT NULL, last_name TEXT NOT NULL, dob TEXT,
+            parent_id INTEGER, emergency_contact TEXT, allergies TEXT, notes TEXT,
+            status TEXT DEFAULT 'active' CHECK(status IN ('active', 'inactive')),
+            FOREIGN KEY (parent_id) REFERENCES parents (id) ON DELETE SET NULL )
+    ''')
+    # Table Parents
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parents ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+            phone TEXT, email TEXT UNIQUE, address TEXT )
+    ''')
+    # Table Revenus
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS income ( id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
+            source TEXT NOT NULL, amount REAL NOT NULL CHECK(amount >= 0), related_child_id INTEGER,
+            related_parent_id INTEGER, description TEXT, bc_month TEXT,
+            FOREIGN KEY (related_child_id) REFERENCES children (id) ON DELETE SET NULL,
+            FOREIGN KEY (related_parent_id) REFERENCES parents (id) ON DELETE SET NULL )
+    ''')
+    # Table Dépenses
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expenses ( id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
+            category TEXT NOT NULL, amount REAL NOT NULL CHECK(amount >= 0), vendor TEXT, description TEXT,
+            receipt_filename TEXT,
+            is_personal INTEGER DEFAULT 0 CHECK(is_personal IN (0, 1)) )
+    ''')
+    # Table Présences
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance ( id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
+            child_id INTEGER NOT NULL, status TEXT NOT NULL, notes TEXT, UNIQUE(date, child_id),
+            FOREIGN KEY (child_id) REFERENCES children (id) ON DELETE CASCADE )
+    ''')
+    # Table Documents
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS documents ( id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL,
+            description TEXT, upload_date TEXT NOT NULL, filename TEXT NOT NULL UNIQUE, filepath TEXT NOT NULL )
+    ''')
+    # Table Paramètres
+    cursor.execute(''' CREATE TABLE IF NOT EXISTS settings ( key TEXT PRIMARY KEY, value TEXT ) ''')
+    # Paramètres par défaut
+    default_settings = { 'daycare_name': 'اسم الحضانة الافتراضي', 'daycare_type': 'rsge', 'home_usage': '80', 'car_usage': '20', 'neq_number': '', 'insurance_policy_number': '', 'insurance_expiry_date': '' }
+    for key, value in default_settings.items():
+         cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+def _migration_2_indexes(cursor):
+    """Index sur les dates (filtres, tris, tableau de bord) et sur les clés étrangères."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_income_date_amount ON income(date, amount)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_personal_date_amount ON expenses(is_personal, date, amount)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_child_date ON attendance(child_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_children_parent ON children(parent_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_income_child ON income(related_child_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_income_parent ON income(related_parent_id)")
+
+def _migration_3_monthly_totals(cursor):
+    """Agrégats mensuels des revenus/dépenses tenus à jour par triggers."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_totals ( month TEXT NOT NULL, kind TEXT NOT NULL CHECK(kind IN ('income', 'expense')),
+            key TEXT NOT NULL, is_personal INTEGER NOT NULL DEFAULT 0, total REAL NOT NULL DEFAULT 0, entries INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, kind, key, is_personal) ) WITHOUT ROWID
+    ''')
+    # Chaque trigger ajoute (+) ou retire (-) une ligne de l'agrégat de son mois, puis purge les agrégats vidés
+    add = """INSERT INTO monthly_totals(month, kind, key, is_personal, total, entries) VALUES(substr({r}.date, 1, 7), '{kind}', {r}.{key}, {personal}, {sign}{r}.amount, {sign}1)
+                 ON CONFLICT(month, kind, key, is_personal) DO UPDATE SET total = total + excluded.total, entries = entries + excluded.entries;"""
+    purge = "DELETE FROM monthly_totals WHERE month = substr(OLD.date, 1, 7) AND entries = 0;"
+    for table, kind, key, personal in (('income', 'income', 'source', '0'), ('expenses', 'expense', 'category', '{r}.is_personal')):
+        plus = add.format(r='NEW', kind=kind, key=key, personal=personal.format(r='NEW'), sign='')
+        minus = add.format(r='OLD', kind=kind, key=key, personal=personal.format(r='OLD'), sign='-')
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_totals_insert AFTER INSERT ON {table} BEGIN {plus} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_totals_delete AFTER DELETE ON {table} BEGIN {minus} {purge} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_totals_update AFTER UPDATE OF date, {key}, amount{', is_personal' if table == 'expenses' else ''} ON {table} BEGIN {minus} {plus} {purge} END")
+    rebuild_monthly_totals(cursor)
+
+def _migration_4_report_versions(cursor):
+    """Compteur de version par année fiscale, incrémenté par triggers, pour invalider le cache des rapports."""
+    cursor.execute("CREATE TABLE IF NOT EXISTS report_versions ( year TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0 ) WITHOUT ROWID")
+    bump = "INSERT INTO report_versions(year, version) VALUES(substr({r}.date, 1, 4), 1) ON CONFLICT(year) DO UPDATE SET version = version + 1;"
+    for table in ('income', 'expenses'):
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_report_insert AFTER INSERT ON {table} BEGIN {bump.format(r='NEW')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_report_delete AFTER DELETE ON {table} BEGIN {bump.format(r='OLD')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_report_update AFTER UPDATE ON {table} BEGIN {bump.format(r='OLD')} {bump.format(r='NEW')} END")
+    # Le parent d'un enfant sert à attribuer ses paiements : un changement touche toutes les années
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS trg_children_report_parent AFTER UPDATE OF parent_id ON children BEGIN UPDATE report_versions SET version = version + 1; END")
+
+# Tables dont les réponses GET portent un ETag faible dérivé de leur compteur (voir versioned)
+VERSIONED_TABLES = ('children', 'parents', 'income', 'expenses', 'attendance', 'documents', 'settings')
+
+def _migration_5_table_versions(cursor):
+    """Compteur de modifications par table, incrémenté par triggers, pour les ETag et les réponses 304."""
+    cursor.execute("CREATE TABLE IF NOT EXISTS table_versions ( name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0 ) WITHOUT ROWID")
+    for table in VERSIONED_TABLES:
+        cursor.execute("INSERT OR IGNORE INTO table_versions(name, version) VALUES(?, 0)", (table,))
+        for event in ('insert', 'update', 'delete'):
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event} AFTER {event.upper()} ON {table} BEGIN UPDATE table_versions SET version = version + 1 WHERE name = '{table}'; END")
+
+def _migration_6_blobs(cursor):
+    """Fichiers téléversés adressés par contenu (SHA-256), partagés entre dépenses et documents avec compteur de références."""
+    cursor.execute("CREATE TABLE IF NOT EXISTS blobs ( path TEXT PRIMARY KEY, sha256 TEXT, size INTEGER, refcount INTEGER NOT NULL DEFAULT 0 ) WITHOUT ROWID")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_blobs_sha256 ON blobs(sha256)")
+    for table, column in (('expenses', 'receipt_filename'), ('documents', 'filepath')):
+        plus = f"UPDATE blobs SET refcount = refcount + 1 WHERE path = NEW.{column};"; minus = f"UPDATE blobs SET refcount = refcount - 1 WHERE path = OLD.{column};"
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_blob_insert AFTER INSERT ON {table} WHEN NEW.{column} IS NOT NULL BEGIN {plus} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_blob_delete AFTER DELETE ON {table} WHEN OLD.{column} IS NOT NULL BEGIN {minus} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_blob_update AFTER UPDATE OF {column} ON {table} WHEN OLD.{column} IS NOT NEW.{column} BEGIN {minus} {plus} END")
+    # Les fichiers déjà présents (dossier plat) sont enregistrés à leur emplacement actuel, sans déplacement
+    legacy = cursor.execute("SELECT receipt_filename FROM expenses WHERE receipt_filename IS NOT NULL UNION SELECT filepath FROM documents").fetchall()
+    for (path,) in legacy:
+        full_path = os.path.join(app.config['UPLOAD_FOLDER'], path); sha256 = size = None
+        if os.path.isfile(full_path):
+            digest = hashlib.sha256()
+            with open(full_path, 'rb') as source:
+                for block in iter(lambda: source.read(1024 * 1024), b''): digest.update(block)
+            sha256 = digest.hexdigest(); size = os.path.getsize(full_path)
+        cursor.execute("INSERT OR IGNORE INTO blobs(path, sha256, size) VALUES(?, ?, ?)", (path, sha256, size))
+    cursor.execute("UPDATE blobs SET refcount = (SELECT COUNT(*) FROM expenses WHERE receipt_filename = blobs.path) + (SELECT COUNT(*) FROM documents WHERE filepath = blobs.path)")
+
+def _migration_7_thumbnails(cursor):
+    """Miniature de chaque fichier (NULL : pas encore traitée, '' : format sans aperçu), exposée en thumbnail_url."""
+    cursor.execute("ALTER TABLE blobs ADD COLUMN thumbnail TEXT")
+    # Une miniature prête change les listes de dépenses et de documents : leurs ETag doivent changer aussi
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS trg_blobs_thumbnail AFTER UPDATE OF thumbnail ON blobs BEGIN UPDATE table_versions SET version = version + 1 WHERE name IN ('expenses', 'documents'); END")
+
+# Index plein texte : (code dans le rowid, type, titre, texte) par table. rowid = id * 8 + code, unique toutes tables confondues.
+SEARCH_SOURCES = {
+    'children': (1, 'child', "{r}.first_name || ' ' || {r}.last_name", "COALESCE({r}.allergies, '') || ' ' || COALESCE({r}.notes, '') || ' ' || COALESCE({r}.emergency_contact, '')"),
+    'parents': (2, 'parent', "{r}.name", "COALESCE({r}.email, '') || ' ' || COALESCE({r}.phone, '') || ' ' || COALESCE({r}.address, '')"),
+    'income': (3, 'income', "COALESCE({r}.description, '')", "{r}.source || ' ' || {r}.date || ' ' || {r}.amount"),
+    'expenses': (4, 'expense', "COALESCE({r}.vendor, '')", "COALESCE({r}.description, '') || ' ' || {r}.category || ' ' || {r}.date || ' ' || {r}.amount"),
+    'documents': (5, 'document', "COALESCE({r}.description, '')", "{r}.type || ' ' || {r}.filename"),
+}
+
+def _migration_8_search_index(cursor):
+    """Index plein texte FTS5 (accents ignorés, préfixes indexés) des enfants, parents, revenus, dépenses et documents."""
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(kind UNINDEXED, entity_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+    # Classement bm25 : le titre (nom, fournisseur, description) pèse plus que le reste
+    cursor.execute("INSERT INTO search_index(search_index, rank) VALUES('rank', 'bm25(0.0, 0.0, 10.0, 1.0)')")
+    for table, (code, kind, title, body) in SEARCH_SOURCES.items():
+        values = lambda r: f"{r}.id * 8 + {code}, '{kind}', {r}.id, {title.format(r=r)}, {body.format(r=r)}"
+        cursor.execute(f"INSERT INTO search_index(rowid, kind, entity_id, title, body) SELECT {values(table)} FROM {table}")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_search_insert AFTER INSERT ON {table} BEGIN INSERT INTO search_index(rowid, kind, entity_id, title, body) VALUES({values('NEW')}); END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_search_delete AFTER DELETE ON {table} BEGIN DELETE FROM search_index WHERE rowid = OLD.id * 8 + {code}; END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_search_update AFTER UPDATE ON {table} BEGIN DELETE FROM search_index WHERE rowid = OLD.id * 8 + {code}; INSERT INTO search_index(rowid, kind, entity_id, title, body) VALUES({values('NEW')}); END")
+
+# Tables alimentées par l'import en lot (voir import_rows) : leurs triggers d'insertion sont suspendus pendant un chargement
+BULK_TABLES = ('children', 'parents', 'income', 'expenses')
+
+def _migration_9_bulk_load(cursor):
+    """Import en lot : triggers d'insertion (agrégats, versions, index de recherche) suspendus tant que bulk_load contient une ligne."""
+    # La ligne n'existe que dans la transaction de l'import : les autres connexions ne la voient jamais
+    cursor.execute("CREATE TABLE IF NOT EXISTS bulk_load ( name TEXT PRIMARY KEY ) WITHOUT ROWID")
+    for table in BULK_TABLES:
+        for trigger in ('totals', 'report', 'version', 'search'):
+            row = cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f"trg_{table}_{trigger}_insert",)).fetchone()
+            if row is None: continue
+            cursor.execute(f"DROP TRIGGER {row[0]}")
+            cursor.execute(row[1].replace(f" ON {table} BEGIN ", f" ON {table} WHEN NOT EXISTS (SELECT 1 FROM bulk_load) BEGIN ", 1))
+
+# Journal des modifications lues par les règles d'alerte : (table, source du journal, sujet, colonnes surveillées par UPDATE).
+# Le sujet est l'enfant concerné (enfants, revenus), la clé du paramètre ou le type du document en minuscules.
+ALERT_SOURCES = (
+    ('children', 'child', "{r}.id", 'first_name, last_name, dob, status'),
+    ('income', 'child', "{r}.related_child_id", 'date, related_child_id'),
+    ('settings', 'settings', "{r}.key", 'value'),
+    ('documents', 'documents', "lower({r}.type)", 'type, upload_date'),
+)
+
+def _migration_10_alerts(cursor):
+    """Alertes calculées en arrière-plan (table alerts) et journal des lignes modifiées depuis la dernière évaluation (alert_changes)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alerts ( id INTEGER PRIMARY KEY AUTOINCREMENT, rule TEXT NOT NULL, subject TEXT NOT NULL,
+            severity TEXT NOT NULL CHECK(severity IN ('info', 'warning', 'urgent')), message TEXT NOT NULL, due_date TEXT,
+            created_at TEXT NOT NULL, UNIQUE(rule, subject) )
+    ''')
+    # Dernière évaluation de chaque règle : séquence du journal déjà traitée, paramètres utilisés (changés -> réévaluation complète)
+    cursor.execute("CREATE TABLE IF NOT EXISTS alert_rules ( rule TEXT PRIMARY KEY, last_seq INTEGER NOT NULL DEFAULT 0, params TEXT, last_run TEXT ) WITHOUT ROWID")
+    # Sujets à réévaluer à une date donnée même sans modification (échéance qui approche, nouveau mois)
+    cursor.execute("CREATE TABLE IF NOT EXISTS alert_checks ( rule TEXT NOT NULL, subject TEXT NOT NULL, next_check TEXT NOT NULL, PRIMARY KEY (rule, subject) ) WITHOUT ROWID")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alert_checks_next ON alert_checks(next_check)")
+    cursor.execute("CREATE TABLE IF NOT EXISTS alert_changes ( source TEXT NOT NULL, subject TEXT NOT NULL, seq INTEGER NOT NULL, PRIMARY KEY (source, subject) ) WITHOUT ROWID")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alert_changes_seq ON alert_changes(seq)")
+    # Revenus d'un enfant sur un mois (règle missing_income) : l'index sur (enfant, date) remplace celui sur l'enfant seul
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_income_child_date ON income(related_child_id, date)")
+    cursor.execute("DROP INDEX IF EXISTS idx_income_child")
+    cursor.execute("INSERT OR IGNORE INTO table_versions(name, version) VALUES('alerts', 0)")
+    for event in ('insert', 'update', 'delete'):
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_alerts_version_{event} AFTER {event.upper()} ON alerts BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'alerts'; END")
+    # Une ligne par sujet : une modification ne fait qu'avancer sa séquence
+    log = """INSERT INTO alert_changes(source, subject, seq) SELECT '{source}', {subject}, (SELECT COALESCE(MAX(seq), 0) + 1 FROM alert_changes) WHERE {subject} IS NOT NULL
+                 ON CONFLICT(source, subject) DO UPDATE SET seq = excluded.seq;"""
+    for table, source, subject, columns in ALERT_SOURCES:
+        new, old = log.format(source=source, subject=subject.format(r='NEW')), log.format(source=source, subject=subject.format(r='OLD'))
+        # Lignes d'un import en lot journalisées en une fois par finish_bulk_load
+        guard = " WHEN NOT EXISTS (SELECT 1 FROM bulk_load)" if table in BULK_TABLES else ''
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_alerts_insert AFTER INSERT ON {table}{guard} BEGIN {new} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_alerts_delete AFTER DELETE ON {table} BEGIN {old} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_alerts_update AFTER UPDATE OF {columns} ON {table} BEGIN {old} {new} END")
+
+# Années fiscales clôturées (voir close_fiscal_year) : ces tables y sont déplacées, une base d'archive par année
+ARCHIVED_TABLES = ('income', 'expenses', 'attendance')
+MAX_ATTACHED_ARCHIVES = 10  # SQLITE_MAX_ATTACHED par défaut (bases attachées à une connexion)
+# Présence saisie après la clôture pour un jour archivé : la ligne active remplace l'archivée (comme à la clôture suivante)
+ARCHIVE_OVERRIDE_KEYS = {'attendance': ('date', 'child_id')}
+
+def _migration_11_archives(cursor):
+    """Années fiscales clôturées, déplacées dans des bases d'archive (table archives)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archives ( year TEXT PRIMARY KEY, filename TEXT NOT NULL, sha256 TEXT NOT NULL, size INTEGER NOT NULL,
+            income INTEGER NOT NULL, expenses INTEGER NOT NULL, attendance INTEGER NOT NULL, closed_at TEXT NOT NULL ) WITHOUT ROWID
+    ''')
+    # Lignes déplacées vers une archive : monthly_totals garde leurs montants (tableau de bord, rapports) et leurs reçus restent
+    # référencés. Ces triggers de suppression sont suspendus, comme ceux d'insertion pendant un import, tant que bulk_load a une ligne.
+    for name in ('trg_income_totals_delete', 'trg_expenses_totals_delete', 'trg_expenses_blob_delete'):
+        sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()[0]
+        head, body = sql.split(' BEGIN ', 1)
+        guard = ' AND NOT EXISTS (SELECT 1 FROM bulk_load)' if ' WHEN ' in head else ' WHEN NOT EXISTS (SELECT 1 FROM bulk_load)'
+        cursor.execute(f"DROP TRIGGER {name}"); cursor.execute(f"{head}{guard} BEGIN {body}")
+
+# Migrations ordonnées (version, fonction). Une migration publiée ne se modifie plus : on en ajoute une nouvelle.
+MIGRATIONS = [
+    (1, _migration_1_base_schema),
+    (2, _migration_2_indexes),
+    (3, _migration_3_monthly_totals),
+    (4, _migration_4_report_versions),
+    (5, _migration_5_table_versions),
+    (6, _migration_6_blobs),
+    (7, _migration_7_thumbnails),
+    (8, _migration_8_search_index),
+    (9, _migration_9_bulk_load),
+    (10, _migration_10_alerts),
+    (11, _migration_11_archives),
+]
 
 def init_db():
-    """Initialise le schéma de la base de données (crée les tables)."""
-    db = None
+    """Crée ou met à niveau le schéma : applique chaque migration plus récente que PRAGMA user_version."""
+    db = get_db(); cursor = db.cursor()
+    for version, migration in MIGRATIONS:
+        if version <= cursor.execute("PRAGMA user_version").fetchone()[0]: continue
+        try:
+            # Verrou d'écriture pris d'emblée, puis re-vérification : un autre processus a pu migrer entre-temps
+            cursor.execute("BEGIN IMMEDIATE")
+            if version <= cursor.execute("PRAGMA user_version").fetchone()[0]: db.rollback(); continue
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+            db.commit()
+            print(f"Migration {version} appliquée : {migration.__doc__}")
+        except sqlite3.Error as e:
+            print(f"Erreur lors de la migration {version} de la base de données : {e}")
+            db.rollback(); raise
+    cursor.execute("PRAGMA optimize")
+    load_settings(db)
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Crée ou met à niveau le schéma de la base de données."""
+    init_db()
+
+@app.cli.command('create-tenant')
+@click.argument('name')
+def create_tenant_command(name):
+    """Crée un centre (mode multi-centres) : son dossier dans TENANTS_FOLDER et sa base au schéma courant."""
+    if not app.config['TENANTS_FOLDER']: raise click.ClickException("Mode multi-centres non activé (GARDERIE_TENANTS_FOLDER)")
+    if not TENANT_NAME.match(name): raise click.ClickException("Nom de centre invalide : minuscules, chiffres, - et _ (63 caractères au plus)")
+    with tenant_context(name):
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True); init_db()
+        print(f"Centre {name} prêt : {os.path.dirname(app.config['DATABASE'])}")
+
+# --- Cache des paramètres (partagé par le processus, converti une seule fois) ---
+# Paramètres convertis au chargement ; les autres restent des chaînes. Vide ou invalide -> None.
+SETTING_TYPES = {'home_usage': float, 'car_usage': float, 'insurance_expiry_date': datetime.date.fromisoformat}
+# Par base : (version de la table settings dans table_versions, valeurs brutes, valeurs typées)
+_settings_cache = {}
+
+def _coerce_setting(key, value):
+    if key not in SETTING_TYPES: return value
+    try: return SETTING_TYPES[key](value) if value else None
+    except ValueError: print(f"Paramètre {key} invalide : {value!r}"); return None
+
+def load_settings(db):
+    """(Re)charge le cache des paramètres depuis la base, dans la transaction éventuelle de l'appelant."""
+    version = db.execute("SELECT version FROM table_versions WHERE name = 'settings'").fetchone()[0]
+    raw = {row['key']: row['value'] for row in db.execute("SELECT key, value FROM settings")}
+    entry = (version, raw, {key: _coerce_setting(key, value) for key, value in raw.items()})
+    _settings_cache[app.config['DATABASE']] = entry
+    return entry
+
+def cached_settings(db):
+    """Renvoie (valeurs brutes, valeurs typées) sans relire la table tant que son compteur n'a pas bougé.
+    Le compteur est incrémenté par trigger : l'écriture d'un autre processus est vue dès la requête suivante.
+    Les dictionnaires renvoyés sont partagés : ne pas les modifier."""
+    entry = _settings_cache.get(app.config['DATABASE'])
+    if entry is None or entry[0] != db.execute("SELECT version FROM table_versions WHERE name = 'settings'").fetchone()[0]:
+        entry = load_settings(db)
+    return entry[1], entry[2]
+
+# --- Agrégats mensuels (monthly_totals) ---
+
+def rebuild_monthly_totals(cursor, kept_years=()):
+    """Recalcule entièrement monthly_totals depuis income et expenses (dans la transaction de l'appelant).
+    Les mois des années de `kept_years` (années archivées, dont les lignes ne sont plus dans la base) sont conservés."""
+    kept = f"substr({{}}, 1, 4) NOT IN ({', '.join('?' * len(kept_years))})" if kept_years else "1"
+    cursor.execute(f"DELETE FROM monthly_totals WHERE {kept.format('month')}", kept_years)
+    cursor.execute(f'''
+        INSERT INTO monthly_totals(month, kind, key, is_personal, total, entries)
+        SELECT substr(date, 1, 7), 'income', source, 0, SUM(amount), COUNT(*) FROM income WHERE {kept.format('date')} GROUP BY 1, 3
+        UNION ALL
+        SELECT substr(date, 1, 7), 'expense', category, is_personal, SUM(amount), COUNT(*) FROM expenses WHERE {kept.format('date')} GROUP BY 1, 3, 4
+    ''', kept_years * 2)
+
+@app.cli.command('rebuild-totals')
+def rebuild_totals_command():
+    """Recalcule monthly_totals et signale les écarts avec les agrégats incrémentaux."""
+    db = get_db(); cursor = db.cursor()
+    snapshot = "SELECT month, kind, key, is_personal, ROUND(total, 2), entries FROM monthly_totals"
+    before = set(map(tuple, cursor.execute(snapshot).fetchall()))
+    cursor.execute("BEGIN IMMEDIATE")
+    # Années archivées : leurs lignes ne sont plus dans la base, leurs agrégats restent ceux de la clôture
+    kept_years = tuple(row[0] for row in cursor.execute("SELECT year FROM archives"))
+    rebuild_monthly_totals(cursor, kept_years); db.commit()
+    after = set(map(tuple, cursor.execute(snapshot).fetchall()))
+    for row in sorted(before ^ after): print(f"{'avant' if row in before else 'après'} : {row}")
+    print(f"Agrégats recalculés : {len(after)} lignes, {len(before ^ after)} écart(s)" + (f" (années archivées conservées : {', '.join(kept_years)})." if kept_years else "."))
+
+def parse_month_range(date_from, date_to):
+    """Convertit des bornes 'YYYY' ou 'YYYY-MM' en mois 'YYYY-MM' inclusifs (mois courant par défaut)."""
+    current_month = datetime.date.today().strftime('%Y-%m')
+    def to_month(value, year_suffix):
+        if len(value) == 4: value = f"{value}-{year_suffix}"
+        datetime.datetime.strptime(value, '%Y-%m')  # ValueError si le format est invalide
+        return value
+    month_from = to_month(date_from or date_to or current_month, '01')
+    month_to = to_month(date_to or date_from or current_month, '12')
+    return month_from, month_to
+
+# --- Archives des années fiscales clôturées (archives/<année>_<horodatage>.db, attachées en lecture seule) ---
+# « flask close-year » déplace les revenus, dépenses et présences d'une année terminée dans sa base d'archive : la base
+# active ne garde que les années ouvertes. Une requête dont la période atteint une année archivée lit la réunion des deux.
+
+def archive_path(filename):
+    return os.path.join(app.config['ARCHIVE_FOLDER'], filename)
+
+def attach_archives(db, date_from=None, date_to=None):
+    """Attache (une fois par connexion) les archives des années que la période [date_from, date_to] touche ; renvoie leurs
+    années. Sans borne : aucune (années ouvertes seulement). ATTACH est impossible dans une transaction : à appeler avant
+    BEGIN. ValueError si la période demande plus d'archives que SQLite n'en attache à la fois."""
+    if not date_from and not date_to: return []
+    archives = db.execute("SELECT year, filename FROM archives WHERE year BETWEEN substr(?, 1, 4) AND substr(?, 1, 4) ORDER BY year",
+                          (date_from or '0000', date_to or '9999')).fetchall()
+    if not archives: return []
+    if len(archives) > MAX_ATTACHED_ARCHIVES: raise ValueError(f"Période trop longue : au plus {MAX_ATTACHED_ARCHIVES} années archivées par requête")
+    # La connexion vient du pool : elle garde les archives attachées par les requêtes précédentes. Détache celles dont le
+    # fichier a changé depuis (année clôturée à nouveau) et, faute de place, celles dont cette période n'a pas besoin
+    wanted = {f"archive_{year}": os.path.abspath(archive_path(filename)) for year, filename in archives}
+    attached = {row[1]: row[2] for row in db.execute("PRAGMA database_list") if row[1].startswith('archive_')}
+    for name, path in list(attached.items()):
+        if (name in wanted and path != wanted[name]) or (name not in wanted and len(attached.keys() | wanted.keys()) > MAX_ATTACHED_ARCHIVES):
+            db.execute(f"DETACH DATABASE {name}"); del attached[name]
+    missing = [(year, filename) for year, filename in archives if f"archive_{year}" not in attached]
+    for year, filename in missing:
+        # immutable : une archive n'est jamais modifiée (une nouvelle clôture de l'année écrit un nouveau fichier)
+        db.execute(f"ATTACH DATABASE ? AS archive_{year}", (f"file:{os.path.abspath(archive_path(filename))}?mode=ro&immutable=1",))
+    return [year for year, _ in archives]
+
+def archive_source(db, table, date_from=None, date_to=None):
+    """Source SQL de `table` pour la période : le nom de la table tant qu'aucune année archivée n'est concernée,
+    sinon une sous-requête UNION ALL de la table active et de celle de chaque archive touchée (à aliaser par l'appelant).
+    Les lignes archivées remplacées dans la table active (ARCHIVE_OVERRIDE_KEYS) sont écartées."""
+    years = attach_archives(db, date_from, date_to)
+    if not years: return table
+    columns = [row[1] for row in db.execute(f"PRAGMA main.table_info({table})")]
+    keys = ARCHIVE_OVERRIDE_KEYS.get(table)
+    overridden = f" WHERE NOT EXISTS (SELECT 1 FROM main.{table} live WHERE {' AND '.join(f'live.{key} = archived.{key}' for key in keys)})" if keys else ''
+    parts = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+    for year in years:
+        # Colonnes ajoutées au schéma après la clôture : NULL dans l'archive
+        present = {row[1] for row in db.execute(f"PRAGMA archive_{year}.table_info({table})")}
+        parts.append(f"SELECT {', '.join(f'archived.{column}' if column in present else f'NULL AS {column}' for column in columns)} FROM archive_{year}.{table} archived{overridden}")
+    return f"({' UNION ALL '.join(parts)})"
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''): digest.update(block)
+    return digest.hexdigest()
+
+def close_fiscal_year(db, year):
+    """Déplace les revenus, dépenses et présences de `year` dans une nouvelle base d'archive (avec celles d'une clôture
+    précédente de la même année), puis les supprime de la base active. Le verrou d'écriture est tenu du début de la copie
+    jusqu'à la suppression : aucune ligne de l'année ne peut être ajoutée entre les deux. Les agrégats mensuels et les
+    reçus des lignes déplacées sont conservés (triggers suspendus par bulk_load). Renvoie la ligne de la table archives."""
+    first_day, last_day = f"{year}-01-01", f"{year}-12-31"
+    os.makedirs(app.config['ARCHIVE_FOLDER'], exist_ok=True)
+    stamp = datetime.datetime.now().strftime(SNAPSHOT_NAME_FORMAT); filename = f"{year}_{stamp}.db"; suffix = 1
+    # Nouvelle clôture dans la même seconde : autre nom, l'archive précédente reste attachée aux connexions du pool et n'est pas effacée en cas d'échec
+    while os.path.exists(archive_path(filename)): filename = f"{year}_{stamp}-{suffix}.db"; suffix += 1
+    target = archive_path(filename); partial = target + '.partial'
+    db.execute("BEGIN IMMEDIATE")
     try:
-        db = get_db()
-        cursor = db.cursor()
-        # Table Enfants
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS children (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, first_name TEXT NOT NULL, last_name TEXT NOT NULL, dob TEXT,
-                parent_id INTEGER, emergency_contact TEXT, allergies TEXT, notes TEXT,
-                status TEXT DEFAULT 'active' CHECK(status IN ('active', 'inactive')),
-                FOREIGN KEY (parent_id) REFERENCES parents (id) ON DELETE SET NULL )
-        ''')
-        # Table Parents
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS parents ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
-                phone TEXT, email TEXT UNIQUE, address TEXT )
-        ''')
-        # Table Revenus
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS income ( id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
-                source TEXT NOT NULL, amount REAL NOT NULL CHECK(amount >= 0), related_child_id INTEGER,
-                related_parent_id INTEGER, description TEXT, bc_month TEXT,
-                FOREIGN KEY (related_child_id) REFERENCES children (id) ON DELETE SET NULL,
-                FOREIGN KEY (related_parent_id) REFERENCES parents (id) ON DELETE SET NULL )
-        ''')
-        # Table Dépenses
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses ( id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
-                category TEXT NOT NULL, amount REAL NOT NULL CHECK(amount >= 0), vendor TEXT, description TEXT,
-                receipt_filename TEXT,
-                is_personal INTEGER DEFAULT 0 CHECK(is_personal IN (0, 1)) )
-        ''')
-        # Table Présences
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS attendance ( id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
-                child_id INTEGER NOT NULL, status TEXT NOT NULL, notes TEXT, UNIQUE(date, child_id),
-                FOREIGN KEY (child_id) REFERENCES children (id) ON DELETE CASCADE )
-        ''')
-        # Table Documents
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS documents ( id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL,
-                description TEXT, upload_date TEXT NOT NULL, filename TEXT NOT NULL UNIQUE, filepath TEXT NOT NULL )
-        ''')
-        # Table Paramètres
-        cursor.execute(''' CREATE TABLE IF NOT EXISTS settings ( key TEXT PRIMARY KEY, value TEXT ) ''')
-        # Paramètres par défaut
-        default_settings = { 'daycare_name': 'اسم الحضانة الافتراضي', 'daycare_type': 'rsge', 'home_usage': '80', 'car_usage': '20', 'neq_number': '', 'insurance_policy_number': '', 'insurance_expiry_date': '' }
-        for key, value in default_settings.items():
-             cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, value))
+        previous = db.execute("SELECT filename FROM archives WHERE year = ?", (str(year),)).fetchone()
+        counts = {}
+        with closing(sqlite3.connect(partial, uri=True, isolation_level=None)) as archive:
+            archive.execute("PRAGMA journal_mode = OFF")
+            archive.execute("ATTACH DATABASE ? AS live", (f"file:{os.path.abspath(app.config['DATABASE'])}?mode=ro",))
+            if previous: archive.execute("ATTACH DATABASE ? AS previous", (f"file:{os.path.abspath(archive_path(previous['filename']))}?mode=ro",))
+            archive.execute("BEGIN")
+            for table in ARCHIVED_TABLES:
+                archive.execute(db.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0])
+                columns = [row[1] for row in db.execute(f"PRAGMA main.table_info({table})")]
+                if previous:
+                    present = {row[1] for row in archive.execute(f"PRAGMA previous.table_info({table})")}
+                    archive.execute(f"INSERT INTO main.{table}({', '.join(columns)}) SELECT {', '.join(column if column in present else 'NULL' for column in columns)} FROM previous.{table}")
+                # Lignes saisies dans l'année après une clôture précédente : la version active l'emporte (présence du même jour)
+                moved = archive.execute(f"INSERT OR REPLACE INTO main.{table}({', '.join(columns)}) SELECT {', '.join(columns)} FROM live.{table} WHERE date BETWEEN ? AND ?", (first_day, last_day)).rowcount
+                archive.execute(f"CREATE INDEX idx_{table}_date ON {table}(date)")
+                counts[table] = (moved, archive.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0])
+            archive.execute("COMMIT")
+            check = [row[0] for row in archive.execute("PRAGMA main.integrity_check")]
+            if check != ['ok']: raise sqlite3.DatabaseError(f"archive {filename} invalide : {'; '.join(check[:10])}")
+        with open(partial, 'rb+') as written: os.fsync(written.fileno())
+        os.replace(partial, target)
+        db.execute("INSERT INTO bulk_load(name) VALUES('archive')")
+        for table in ARCHIVED_TABLES:
+            deleted = db.execute(f"DELETE FROM {table} WHERE date BETWEEN ? AND ?", (first_day, last_day)).rowcount
+            if deleted != counts[table][0]: raise sqlite3.DatabaseError(f"{table} : {deleted} ligne(s) supprimée(s) pour {counts[table][0]} archivée(s)")
+        db.execute("DELETE FROM bulk_load")
+        row = db.execute('''
+            INSERT INTO archives(year, filename, sha256, size, income, expenses, attendance, closed_at) VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(year) DO UPDATE SET filename = excluded.filename, sha256 = excluded.sha256, size = excluded.size, income = excluded.income,
+                expenses = excluded.expenses, attendance = excluded.attendance, closed_at = excluded.closed_at RETURNING *
+        ''', (str(year), filename, file_sha256(target), os.path.getsize(target), counts['income'][1], counts['expenses'][1], counts['attendance'][1],
+              datetime.datetime.now().isoformat(timespec='seconds'))).fetchone()
         db.commit()
-        print("Base de données initialisée avec succès.")
-    except sqlite3.Error as e:
-        print(f"Erreur d'initialisation de la base de données : {e}")
-        if db: db.rollback()
-    finally:
-        if db: db.close()
+    except BaseException:
+        db.rollback()
+        for path in (partial, target):
+            if os.path.exists(path): os.remove(path)
+        raise
+    # L'ancienne archive n'est plus référencée (les connexions qui l'ont encore attachée la lisent jusqu'à leur fermeture)
+    if previous and previous['filename'] != filename:
+        try: os.remove(archive_path(previous['filename']))
+        except OSError as e: print(f"Ancienne archive {previous['filename']} non supprimée : {e}")
+    return dict(row)
+
+def compact_database(db):
+    """Rend au système la place libérée par une clôture : fusion des segments de l'index de recherche (les suppressions n'y
+    laissent que des marqueurs jusque-là), VACUUM, puis remise à zéro du journal WAL."""
+    db.execute("INSERT INTO search_index(search_index) VALUES('optimize')"); db.commit()
+    db.execute("VACUUM"); db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+@app.cli.command('close-year')
+@click.argument('year', type=int)
+@click.option('--no-vacuum', is_flag=True, help="Ne pas compacter la base après le déplacement.")
+def close_year_command(year, no_vacuum):
+    """Clôture une année fiscale terminée : ses revenus, dépenses et présences passent dans archives/ (lecture seule)."""
+    if year >= datetime.date.today().year: raise click.ClickException(f"L'année {year} n'est pas terminée.")
+    db = get_db(); size = os.path.getsize(app.config['DATABASE'])
+    row = close_fiscal_year(db, year)
+    if not no_vacuum: compact_database(db)
+    print(f"Année {year} archivée dans {row['filename']} : {row['income']} revenu(s), {row['expenses']} dépense(s), {row['attendance']} présence(s) ; "
+          f"base active de {size // (1024 * 1024)} Mo à {os.path.getsize(app.config['DATABASE']) // (1024 * 1024)} Mo.")
+
+# --- Listes : pagination par curseur (keyset) et flux JSON ---
+
+def encode_cursor(values):
+    """Curseur opaque (base64 d'une liste JSON) à partir des valeurs de tri de la dernière ligne."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    if not isinstance(values, list): raise ValueError("curseur invalide")
+    return values
+
+def list_response(db, query, params, keyset, descending=False, default_limit=None):
+    """Exécute `query` (terminée par une clause WHERE) et renvoie la liste JSON selon les paramètres :
+    ?limit=N[&after=curseur] -> {"items": [...], "next_cursor": ...} (pagination keyset),
+    ?stream=1 -> tableau JSON diffusé ligne par ligne depuis le curseur SQLite,
+    sinon le tableau complet comme auparavant (ou une page de `default_limit` lignes si elle est fixée).
+    `keyset` liste les colonnes de tri (expression SQL, clé de la ligne) ; la dernière doit être unique (id)."""
+    params = list(params); comparison = '<' if descending else '>'
+    columns = ', '.join(expression for expression, _ in keyset)
+    try:
+        limit = request.args.get('limit', default_limit, type=int); after = request.args.get('after')
+        if after:
+            values = decode_cursor(after)
+            if len(values) != len(keyset): raise ValueError("curseur invalide")
+            query += f" AND ({columns}) {comparison} ({', '.join('?' * len(keyset))})"; params.extend(values)
+    except (ValueError, TypeError): return jsonify({"error": "Paramètre 'after' invalide"}), 400
+    query += " ORDER BY " + ', '.join(f"{expression}{' DESC' if descending else ''}" for expression, _ in keyset)
+    if limit is not None:
+        limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+        rows = [dict(row) for row in db.execute(query + " LIMIT ?", (*params, limit)).fetchall()]
+        next_cursor = encode_cursor([rows[-1][key] for _, key in keyset]) if len(rows) == limit else None
+        return jsonify({"items": rows, "next_cursor": next_cursor})
+    cursor = db.execute(query, params)
+    if request.args.get('stream') in ('1', 'true'):
+        def generate():
+            yield '['
+            for index, row in enumerate(cursor): yield (',' if index else '') + app.json.dumps(dict(row))
+            yield ']'
+        g.db_streaming = True
+        return Response(stream_with_context(generate()), mimetype='application/json')
+    return jsonify([dict(row) for row in cursor.fetchall()])
+
+# --- Réponses conditionnelles (ETag faible dérivé de table_versions) ---
+def table_etag(db, tables):
+    """ETag de la requête courante : chemin, paramètres, date du jour (périodes par défaut) et version des tables lues."""
+    versions = db.execute(f"SELECT name, version FROM table_versions WHERE name IN ({', '.join('?' * len(tables))}) ORDER BY name", tables).fetchall()
+    key = f"{request.path}?{request.query_string.decode()}|{datetime.date.today().isoformat()}|" + ','.join(f"{row['name']}:{row['version']}" for row in versions)
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+def versioned(*tables):
+    """Vue GET dont la réponse ne dépend que de `tables` : renvoie 304 sur un If-None-Match correspondant sans lire ces tables.
+    Le compteur est lu avant la vue : une écriture concurrente donne au pire un ETag plus ancien que le corps, jamais l'inverse."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = table_etag(get_db(), tables)
+            if request.if_none_match.contains_weak(etag): response = Response(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200: return response
+            response.set_etag(etag, weak=True); response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+# --- Couche d'accès aux données (écritures en une instruction avec RETURNING) ---
+# Colonnes renvoyées au client après une écriture, par table (mêmes que les get_*_by_id).
+# RETURNING renvoie les montants REAL entiers sans conversion (10 au lieu de 10.0) : on les recaste.
+# La miniature (THUMBNAIL_URL des listes) est lue par sous-requête : RETURNING ne peut pas faire de jointure.
+RETURNING_THUMBNAIL_URL = "(SELECT '/uploads/' || NULLIF(blobs.thumbnail, '') FROM blobs WHERE blobs.path = {}) AS thumbnail_url"
+RETURNING_COLUMNS = {
+    'children': '*', 'parents': '*',
+    'income': 'id, date, source, CAST(amount AS REAL) AS amount, related_child_id, related_parent_id, description, bc_month',
+    'expenses': 'id, date, category, CAST(amount AS REAL) AS amount, vendor, description, receipt_filename, is_personal, ' + RETURNING_THUMBNAIL_URL.format('expenses.receipt_filename'),
+    'documents': 'id, type, description, upload_date, filename, filepath, ' + RETURNING_THUMBNAIL_URL.format('documents.filepath'),
+}
+
+def insert_row(db, table, values):
+    """Insère une ligne (dict colonne -> valeur), valide la transaction et renvoie la ligne créée."""
+    columns = ', '.join(values); placeholders = ', '.join('?' * len(values))
+    rows = db.execute(f"INSERT INTO {table}({columns}) VALUES({placeholders}) RETURNING {RETURNING_COLUMNS[table]}", tuple(values.values())).fetchall()
+    db.commit()
+    return dict(rows[0])
+
+def update_row(db, table, row_id, values):
+    """Met à jour la ligne `row_id`, valide la transaction et renvoie son nouvel état (None si introuvable)."""
+    assignments = ', '.join(f"{column}=?" for column in values)
+    rows = db.execute(f"UPDATE {table} SET {assignments} WHERE id=? RETURNING {RETURNING_COLUMNS[table]}", (*values.values(), row_id)).fetchall()
+    db.commit()
+    return dict(rows[0]) if rows else None
+
+# --- Stockage des fichiers adressé par contenu (uploads/ab/cd/<sha256>.ext) ---
+def store_upload(db, file):
+    """Range un fichier reçu dans l'arborescence par empreinte, dans la transaction d'écriture de l'appelant.
+    Un contenu déjà connu n'est pas recopié. Renvoie (chemin relatif, True si un nouveau fichier a été créé) ;
+    la référence est comptée par trigger à l'insertion de la ligne qui pointe dessus."""
+    spool = file.stream; digest = spool.sha256.hexdigest(); spool.file.close()
+    row = db.execute("SELECT path FROM blobs WHERE sha256 = ? LIMIT 1", (digest,)).fetchone()
+    if row: path = row['path']
+    else:
+        path = f"{digest[:2]}/{digest[2:4]}/{digest}{os.path.splitext(secure_filename(file.filename))[1].lower()}"
+        db.execute("INSERT INTO blobs(path, sha256, size) VALUES(?, ?, ?)", (path, digest, spool.size))
+    full_path = os.path.join(app.config['UPLOAD_FOLDER'], path)
+    if os.path.exists(full_path): return path, False
+    os.makedirs(os.path.dirname(full_path), exist_ok=True); os.replace(spool.path, full_path)
+    return path, True
+
+def release_upload(db, path):
+    """Après suppression d'une référence, dans la même transaction : efface le fichier s'il n'est plus référencé.
+    L'effacement a lieu avant le commit, verrou d'écriture tenu, pour ne pas croiser un téléversement du même contenu."""
+    row = db.execute("DELETE FROM blobs WHERE path = ? AND refcount <= 0 RETURNING thumbnail", (path,)).fetchone()
+    if row is None: return
+    full_path = os.path.join(app.config['UPLOAD_FOLDER'], path)
+    try: os.remove(full_path); print(f"Fichier supprimé : {path}")
+    except FileNotFoundError: print(f"Fichier non trouvé pour suppression : {path}")
+    if row['thumbnail']:
+        try: os.remove(os.path.join(app.config['UPLOAD_FOLDER'], row['thumbnail']))
+        except FileNotFoundError: pass
+
+def discard_upload(path):
+    """Efface un fichier nouvellement rangé dont la transaction a échoué."""
+    try: os.remove(os.path.join(app.config['UPLOAD_FOLDER'], path)); print(f"Fichier orphelin supprimé : {path}")
+    except OSError as e: print(f"Erreur suppression fichier orphelin {path}: {e}")
+
+# --- Miniatures (générées en arrière-plan dans un pool de processus) ---
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff')
+# URL de la miniature dans les listes : jointure sur blobs, NULL tant qu'elle n'existe pas
+THUMBNAIL_URL = "'/uploads/' || NULLIF(blobs.thumbnail, '') AS thumbnail_url"
+_thumbnail_pool = None
+_thumbnail_pool_lock = threading.Lock()
+
+def thumbnail_path(path):
+    """Chemin relatif de la miniature d'un fichier : thumbs/<chemin sans extension>.webp."""
+    return f"thumbs/{os.path.splitext(path)[0]}.webp"
+
+def make_thumbnail(source_path, target_path, size):
+    """Exécutée dans un processus du pool : écrit une miniature WebP de l'image ou de la première page du PDF.
+    Renvoie False si le format n'a pas d'aperçu possible."""
+    extension = os.path.splitext(source_path)[1].lower()
+    if Image is None: return False
+    if extension == '.pdf':
+        if pymupdf is None: return False
+        with pymupdf.open(source_path) as pdf:
+            if pdf.page_count == 0: return False
+            page = pdf[0]; pixmap = page.get_pixmap(dpi=max(12, int(72 * size / max(page.rect.width, page.rect.height))))
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    elif extension in IMAGE_EXTENSIONS:
+        image = Image.open(source_path); image.draft('RGB', (size, size))  # JPEG décodé directement à taille réduite
+        image = ImageOps.exif_transpose(image)
+    else: return False
+    image = image.convert('RGB'); image.thumbnail((size, size))
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    image.save(target_path + '.part', 'WEBP', quality=80); os.replace(target_path + '.part', target_path)
+    return True
+
+def _thumbnail_executor():
+    global _thumbnail_pool
+    with _thumbnail_pool_lock:
+        if _thumbnail_pool is None:
+            # spawn : pas de fork d'un serveur multithread ; les processus ne sont créés qu'au premier envoi
+            _thumbnail_pool = ProcessPoolExecutor(app.config['THUMBNAIL_WORKERS'], mp_context=multiprocessing.get_context('spawn'))
+    return _thumbnail_pool
+
+def _record_thumbnail(database, upload_folder, path, future):
+    """Rappel de fin de tâche (thread du pool) : enregistre la miniature, ou '' si aucun aperçu n'est possible."""
+    try: made = future.result()
+    except Exception as e: print(f"Erreur miniature {path}: {e}"); made = False
+    thumbnail = thumbnail_path(path) if made else ''
+    try:
+        with closing(_connect(database)) as conn, conn:
+            updated = conn.execute("UPDATE blobs SET thumbnail = ? WHERE path = ?", (thumbnail, path)).rowcount
+        # Fichier supprimé pendant la génération : la miniature n'a plus de propriétaire
+        if made and not updated: os.remove(os.path.join(upload_folder, thumbnail))
+    except (sqlite3.Error, OSError) as e: print(f"Erreur enregistrement miniature {path}: {e}")
+
+def schedule_thumbnail(path, executor=None):
+    """Soumet la miniature d'un fichier rangé au pool, sans attendre (à appeler après le commit). Renvoie la tâche."""
+    if Image is None: return None
+    upload_folder = app.config['UPLOAD_FOLDER']; database = app.config['DATABASE']
+    try:
+        future = (executor or _thumbnail_executor()).submit(make_thumbnail, os.path.abspath(os.path.join(upload_folder, path)),
+                                                          os.path.abspath(os.path.join(upload_folder, thumbnail_path(path))), app.config['THUMBNAIL_SIZE'])
+    except RuntimeError as e: print(f"Pool de miniatures indisponible : {e}"); return None
+    future.add_done_callback(lambda done: _record_thumbnail(database, upload_folder, path, done))
+    return future
+
+@app.cli.command('build-thumbnails')
+@click.option('--all', 'rebuild_all', is_flag=True, help="Régénère aussi les miniatures existantes et les formats déjà marqués sans aperçu.")
+def build_thumbnails_command(rebuild_all):
+    """Génère en parallèle (un processus par cœur) les miniatures des fichiers déjà téléversés."""
+    if Image is None: print("Pillow n'est pas installé : miniatures désactivées."); return
+    db = get_db(); paths = [row['path'] for row in db.execute(f"SELECT path FROM blobs {'' if rebuild_all else 'WHERE thumbnail IS NULL'}")]
+    started = time.perf_counter()
+    # La sortie du bloc attend la fin des tâches et de leurs rappels d'enregistrement
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as executor:
+        for path in paths: schedule_thumbnail(path, executor)
+    made = db.execute("SELECT COUNT(*) FROM blobs WHERE thumbnail <> ''").fetchone()[0]
+    print(f"{len(paths)} fichier(s) traité(s) en {time.perf_counter() - started:.1f} s ; {made} miniature(s) disponible(s).")
 
 # --- Helper Functions (Get by ID) ---
 def get_child_by_id(child_id):
-     db = None; conn_created = False
      try:
-         db = get_db(); conn_created=True; cursor = db.cursor(); cursor.execute("SELECT * FROM children WHERE id = ?", (child_id,)); child = cursor.fetchone(); db.close(); conn_created=False
+         cursor = get_db().cursor(); cursor.execute("SELECT * FROM children WHERE id = ?", (child_id,)); child = cursor.fetchone()
          return dict(child) if child else None
      except Exception as e: print(f"Erreur get_child_by_id: {e}"); return None
-     finally:
-         if conn_created and db: db.close()
 
 def get_parent_by_id(parent_id):
-     db = None; conn_created = False
      try:
-         db = get_db(); conn_created=True; cursor = db.cursor(); cursor.execute("SELECT * FROM parents WHERE id = ?", (parent_id,)); parent = cursor.fetchone(); db.close(); conn_created=False
+         cursor = get_db().cursor(); cursor.execute("SELECT * FROM parents WHERE id = ?", (parent_id,)); parent = cursor.fetchone()
          return dict(parent) if parent else None
      except Exception as e: print(f"Erreur get_parent_by_id: {e}"); return None
-     finally:
-         if conn_created and db: db.close()
 
 def get_income_by_id(income_id):
-     db = None; conn_created = False
      try:
-         db = get_db(); conn_created=True; cursor = db.cursor(); cursor.execute("SELECT * FROM income WHERE id = ?", (income_id,)); income = cursor.fetchone(); db.close(); conn_created=False
+         cursor = get_db().cursor(); cursor.execute("SELECT * FROM income WHERE id = ?", (income_id,)); income = cursor.fetchone()
          return dict(income) if income else None
      except Exception as e: print(f"Erreur get_income_by_id: {e}"); return None
-     finally:
-         if conn_created and db: db.close()
 
 def get_expense_by_id(expense_id):
-     db = None; conn_created = False
      try:
-         db = get_db(); conn_created=True; cursor = db.cursor(); cursor.execute("SELECT * FROM expenses WHERE id = ?", (expense_id,)); expense = cursor.fetchone(); db.close(); conn_created=False
+         cursor = get_db().cursor(); cursor.execute(f"SELECT expenses.*, {THUMBNAIL_URL} FROM expenses LEFT JOIN blobs ON blobs.path = expenses.receipt_filename WHERE id = ?", (expense_id,)); expense = cursor.fetchone()
          return dict(expense) if expense else None
      except Exception as e: print(f"Erreur get_expense_by_id: {e}"); return None
-     finally:
-         if conn_created and db: db.close()
 
 def get_document_by_id(doc_id):
-     db = None; conn_created = False
      try:
-         db = get_db(); conn_created=True; cursor = db.cursor(); cursor.execute("SELECT id, type, description, upload_date, filename FROM documents WHERE id = ?", (doc_id,)); doc = cursor.fetchone(); db.close(); conn_created=False
+         cursor = get_db().cursor(); cursor.execute(f"SELECT id, type, description, upload_date, filename, filepath, {THUMBNAIL_URL} FROM documents LEFT JOIN blobs ON blobs.path = documents.filepath WHERE id = ?", (doc_id,)); doc = cursor.fetchone()
          return dict(doc) if doc else None
      except Exception as e: print(f"Erreur get_document_by_id: {e}"); return None
-     finally:
-         if conn_created and db: db.close()
 
 # --- Routes API ---
 
@@ -149,32 +1147,125 @@ def index():
     return render_template('index.html')
 
 # --- API Résumé Dashboard ---
+def dashboard_summary(db, month_from, month_to):
+    """Totaux de revenus et dépenses entre deux mois (YYYY-MM) lus dans le cumul monthly_totals."""
+    cursor = db.execute("SELECT kind, key, is_personal, SUM(total) AS total FROM monthly_totals WHERE month BETWEEN ? AND ? GROUP BY kind, key, is_personal", (month_from, month_to))
+    summary = {"from": month_from, "to": month_to, "monthly_income": 0, "monthly_expenses": 0, "personal_expenses": 0, "income_by_source": {}, "expenses_by_category": {}}
+    for row in cursor.fetchall():
+        total = round(row['total'], 2)
+        if row['kind'] == 'income': summary['monthly_income'] += total; summary['income_by_source'][row['key']] = total
+        elif row['is_personal']: summary['personal_expenses'] += total
+        else: summary['monthly_expenses'] += total; summary['expenses_by_category'][row['key']] = total
+    for key in ('monthly_income', 'monthly_expenses', 'personal_expenses'): summary[key] = round(summary[key], 2)
+    return summary
+
 @app.route('/api/dashboard/summary', methods=['GET'])
+@versioned('income', 'expenses')
 def get_dashboard_summary():
-    db = None
+    # Période en mois (?from=2025-01&to=2025-12 ou ?from=2025), mois courant par défaut
+    try: month_from, month_to = parse_month_range(request.args.get('from'), request.args.get('to'))
+    except ValueError: return jsonify({"error": "Période invalide (format attendu : YYYY ou YYYY-MM)"}), 400
     try:
-        today = datetime.date.today()
-        first_day_str = today.replace(day=1).strftime('%Y-%m-%d')
-        last_day_num = calendar.monthrange(today.year, today.month)[1]
-        last_day_str = today.replace(day=last_day_num).strftime('%Y-%m-%d')
-        db = get_db(); cursor = db.cursor()
-        cursor.execute("SELECT SUM(amount) FROM income WHERE date >= ? AND date <= ?", (first_day_str, last_day_str))
-        monthly_income = cursor.fetchone()[0] or 0
-        cursor.execute("SELECT SUM(amount) FROM expenses WHERE date >= ? AND date <= ? AND is_personal = 0", (first_day_str, last_day_str))
-        monthly_expenses = cursor.fetchone()[0] or 0
-        db.close(); db = None
-        return jsonify({"monthly_income": monthly_income, "monthly_expenses": monthly_expenses})
+        db = get_db()
+        return jsonify(dashboard_summary(db, month_from, month_to))
     except Exception as e:
         print(f"Erreur get_dashboard_summary : {e}")
-        if db: db.close()
         return jsonify({"monthly_income": 0, "monthly_expenses": 0, "error": str(e)}), 500
 
+# --- API Rapport consolidé (multi-centres) : totaux de chaque centre, en lecture seule ---
+@app.route('/api/centres/summary', methods=['GET'])
+def get_centres_summary():
+    """Totaux du tableau de bord de chaque centre sur la période (?from=&to=, comme /api/dashboard/summary) et leur somme.
+    Chaque base est ouverte en lecture seule hors pool ; un centre illisible est signalé sans faire échouer les autres."""
+    if not app.config['TENANTS_FOLDER']: return jsonify({"error": "Mode multi-centres non activé"}), 404
+    # Données de tous les centres : réservé à l'administrateur qui détient le jeton
+    token = app.config['CENTRES_SUMMARY_TOKEN']
+    if not token: return jsonify({"error": "Rapport consolidé désactivé (CENTRES_SUMMARY_TOKEN non défini)"}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode()): return jsonify({"error": "Jeton d'administration invalide"}), 401
+    try: month_from, month_to = parse_month_range(request.args.get('from'), request.args.get('to'))
+    except ValueError: return jsonify({"error": "Période invalide (format attendu : YYYY ou YYYY-MM)"}), 400
+    centres = []; totals = {"monthly_income": 0, "monthly_expenses": 0, "personal_expenses": 0, "active_children": 0}
+    for tenant in list_tenants():
+        with tenant_context(tenant):
+            if not os.path.exists(app.config['DATABASE']): continue
+            try:
+                with closing(connect_read_only()) as db:
+                    summary = dashboard_summary(db, month_from, month_to)
+                    summary['active_children'] = db.execute("SELECT COUNT(*) FROM children WHERE status = 'active'").fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"Erreur get_centres_summary (centre {tenant}) : {e}"); centres.append({"centre": tenant, "error": str(e)}); continue
+        for key in totals: totals[key] += summary[key]
+        centres.append({"centre": tenant, **summary})
+    for key in ('monthly_income', 'monthly_expenses', 'personal_expenses'): totals[key] = round(totals[key], 2)
+    return jsonify({"from": month_from, "to": month_to, "centres": centres, "totals": totals})
+
+# --- API Démarrage : tout ce qu'affiche le premier écran en un seul aller-retour ---
+@app.route('/api/bootstrap', methods=['GET'])
+@versioned('settings', 'children', 'parents', 'attendance', 'income', 'expenses', 'alerts')
+def get_bootstrap():
+    # ?date= : jour de présence affiché par le client (sa date locale), aujourd'hui par défaut
+    attendance_date = request.args.get('date') or datetime.date.today().isoformat()
+    try: datetime.date.fromisoformat(attendance_date)
+    except ValueError: return jsonify({"error": "Date invalide (format attendu : YYYY-MM-DD)"}), 400
+    db = None
+    try:
+        db = get_db(); month_from, month_to = parse_month_range(None, None)
+        attendance_source = archive_source(db, 'attendance', attendance_date, attendance_date)  # avant BEGIN (ATTACH)
+        # Une seule transaction de lecture : toutes les sections voient le même instantané de la base
+        db.execute("BEGIN")
+        bootstrap = {
+            "settings": cached_settings(db)[0],
+            "children": [dict(row) for row in db.execute("SELECT * FROM children ORDER BY last_name, first_name, id")],
+            "parents": [dict(row) for row in db.execute("SELECT * FROM parents ORDER BY name, id")],
+            "attendance": {"date": attendance_date, "records": {row['child_id']: dict(row) for row in db.execute(f"SELECT child_id, status, notes FROM {attendance_source} WHERE date = ?", (attendance_date,))}},
+            "summary": dashboard_summary(db, month_from, month_to),
+            "alerts": list_alerts(db),
+        }
+        db.commit()
+        return jsonify(bootstrap)
+    except Exception as e:
+        if db: db.rollback()
+        print(f"Erreur get_bootstrap : {e}"); return jsonify({"error": "Erreur serveur lors du chargement initial"}), 500
+
+# --- Validation des lignes (formulaires d'ajout et import en lot : mêmes règles) ---
+# Chaque fonction reçoit les champs sous les clés du formulaire et renvoie les valeurs des colonnes ; ValueError si la ligne est invalide.
+def parse_amount(value):
+    try: amount = float(value); assert amount >= 0
+    except (TypeError, ValueError, AssertionError): raise ValueError("Montant invalide ou négatif") from None
+    return amount
+
+def parse_date(value, field='date'):
+    try: return datetime.date.fromisoformat(str(value)).isoformat()
+    except ValueError: raise ValueError(f"Date invalide ({field}, AAAA-MM-JJ attendu) : {value}") from None
+
+def child_values(data):
+    if not data or not data.get('firstName') or not data.get('lastName'): raise ValueError("Prénom et nom requis")
+    parent_id = data.get('parentId')
+    try: parent_id = int(parent_id) if parent_id else None
+    except (TypeError, ValueError): raise ValueError(f"parentId invalide : {parent_id}") from None
+    dob = parse_date(data['dob'], 'dob') if data.get('dob') else None
+    return { 'first_name': data['firstName'], 'last_name': data['lastName'], 'dob': dob, 'parent_id': parent_id, 'emergency_contact': data.get('emergencyContact'), 'allergies': data.get('allergies'), 'notes': data.get('notes'), 'status': 'active' }
+
+def parent_values(data):
+    if not data or not data.get('name'): raise ValueError("Nom du parent requis")
+    return { 'name': data['name'], 'phone': data.get('phone'), 'email': data.get('email'), 'address': data.get('address') }
+
+def income_values(data):
+    if not data or not data.get('date') or not data.get('source') or data.get('amount') is None: raise ValueError("Champs requis manquants : date, source, amount")
+    return { 'date': parse_date(data['date']), 'source': data['source'], 'amount': parse_amount(data['amount']), 'related_child_id': data.get('relatedChildId') or None, 'related_parent_id': data.get('relatedParentId') or None, 'description': data.get('description'), 'bc_month': data.get('bcMonth') }
+
+def expense_values(data):
+    if not data or not data.get('date') or not data.get('category') or data.get('amount') is None: raise ValueError("Champs requis manquants : date, category, amount")
+    is_personal = 1 if str(data.get('is_personal')).lower() in ('true', '1') else 0
+    return { 'date': parse_date(data['date']), 'category': data['category'], 'amount': parse_amount(data['amount']), 'vendor': data.get('vendor'), 'description': data.get('description'), 'receipt_filename': None, 'is_personal': is_personal }
+
 # --- API Enfants ---
 @app.route('/api/children', methods=['GET'])
+@versioned('children')
 def get_children():
     try:
-        db = get_db(); cursor = db.cursor(); cursor.execute("SELECT * FROM children ORDER BY last_name, first_name"); children = [dict(row) for row in cursor.fetchall()]; db.close()
-        return jsonify(children)
+        db = get_db()
+        return list_response(db, "SELECT * FROM children WHERE 1=1", [], [('last_name', 'last_name'), ('first_name', 'first_name'), ('id', 'id')])
     except Exception as e: print(f"Erreur get_children : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des enfants"}), 500
 
 @app.route('/api/children/<int:child_id>', methods=['GET'])
@@ -186,36 +1277,34 @@ def get_single_child(child_id):
 @app.route('/api/children', methods=['POST'])
 def add_child():
     data = request.get_json(); db = None
-    if not data or not data.get('firstName') or not data.get('lastName'): return jsonify({"error": "Prénom et nom requis"}), 400
-    parent_id = data.get('parentId'); parent_id = int(parent_id) if parent_id else None
-    sql = ''' INSERT INTO children(first_name, last_name, dob, parent_id, emergency_contact, allergies, notes, status) VALUES(?,?,?,?,?,?,?,?) '''
-    params = ( data['firstName'], data['lastName'], data.get('dob'), parent_id, data.get('emergencyContact'), data.get('allergies'), data.get('notes'), 'active' )
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit(); new_child_id = cursor.lastrowid; db.close(); db = None
-        new_child = get_child_by_id(new_child_id)
-        return jsonify(new_child if new_child else {"id": new_child_id, "message": "Enfant ajouté"}), 201
+    try: values = child_values(data)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    try:
+        db = get_db(); new_child = insert_row(db, 'children', values)
+        return jsonify(new_child), 201
     except sqlite3.IntegrityError as e:
-        if db: db.rollback(); db.close(); print(f"Erreur intégrité add_child : {e}"); return jsonify({"error": f"Donnée invalide (ex: parentId inexistant?): {e}"}), 400
+        if db: db.rollback()
+        print(f"Erreur intégrité add_child : {e}"); return jsonify({"error": f"Donnée invalide (ex: parentId inexistant?): {e}"}), 400
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur add_child : {e}"); return jsonify({"error": "Erreur serveur lors de l'ajout de l'enfant"}), 500
+        if db: db.rollback()
+        print(f"Erreur add_child : {e}"); return jsonify({"error": "Erreur serveur lors de l'ajout de l'enfant"}), 500
 
 @app.route('/api/children/<int:child_id>', methods=['PUT'])
 def update_child(child_id):
     data = request.get_json(); db = None
     if not data: return jsonify({"error": "Données manquantes"}), 400
-    parent_id = data.get('parentId'); parent_id = int(parent_id) if parent_id else None
-    sql = ''' UPDATE children SET first_name=?, last_name=?, dob=?, parent_id=?, emergency_contact=?, allergies=?, notes=? WHERE id=? '''
-    params = ( data.get('firstName'), data.get('lastName'), data.get('dob'), parent_id, data.get('emergencyContact'), data.get('allergies'), data.get('notes'), child_id )
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Enfant non trouvé"}), 404
-        db.close(); db = None
-        updated_child = get_child_by_id(child_id)
+    try: values = child_values(data); del values['status'] # Le statut se change par /status : une modification ne réactive pas l'enfant
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    try:
+        db = get_db(); updated_child = update_row(db, 'children', child_id, values)
+        if updated_child is None: return jsonify({"error": "Enfant non trouvé"}), 404
         return jsonify(updated_child), 200
     except sqlite3.IntegrityError as e:
-        if db: db.rollback(); db.close(); print(f"Erreur intégrité update_child : {e}"); return jsonify({"error": f"Donnée invalide (ex: parentId inexistant?): {e}"}), 400
+        if db: db.rollback()
+        print(f"Erreur intégrité update_child : {e}"); return jsonify({"error": f"Donnée invalide (ex: parentId inexistant?): {e}"}), 400
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur update_child : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour de l'enfant"}), 500
+        if db: db.rollback()
+        print(f"Erreur update_child : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour de l'enfant"}), 500
 
 @app.route('/api/children/<int:child_id>/status', methods=['PUT'])
 def update_child_status(child_id):
@@ -223,30 +1312,31 @@ def update_child_status(child_id):
     new_status = data.get('status')
     if new_status not in ['active', 'inactive']: return jsonify({"error": "Statut invalide"}), 400
     try:
-        db = get_db(); cursor = db.cursor(); cursor.execute("UPDATE children SET status=? WHERE id=?", (new_status, child_id)); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Enfant non trouvé"}), 404
-        db.close(); db = None
+        db = get_db()
+        if update_row(db, 'children', child_id, {'status': new_status}) is None: return jsonify({"error": "Enfant non trouvé"}), 404
         return jsonify({"message": f"Statut de l'enfant {child_id} mis à jour à {new_status}"}), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur update_child_status : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour du statut"}), 500
+        if db: db.rollback()
+        print(f"Erreur update_child_status : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour du statut"}), 500
 
 @app.route('/api/children/<int:child_id>', methods=['DELETE'])
 def delete_child(child_id):
     db = None
     try:
         db = get_db(); cursor = db.cursor(); cursor.execute("DELETE FROM children WHERE id=?", (child_id,)); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Enfant non trouvé"}), 404
-        db.close(); db = None
+        if cursor.rowcount == 0: return jsonify({"error": "Enfant non trouvé"}), 404
         return jsonify({"message": f"Enfant {child_id} supprimé"}), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur delete_child : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression de l'enfant"}), 500
+        if db: db.rollback()
+        print(f"Erreur delete_child : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression de l'enfant"}), 500
 
 # --- API Parents ---
 @app.route('/api/parents', methods=['GET'])
+@versioned('parents')
 def get_parents():
     try:
-        db = get_db(); cursor = db.cursor(); cursor.execute("SELECT * FROM parents ORDER BY name"); parents = [dict(row) for row in cursor.fetchall()]; db.close()
-        return jsonify(parents)
+        db = get_db()
+        return list_response(db, "SELECT * FROM parents WHERE 1=1", [], [('name', 'name'), ('id', 'id')])
     except Exception as e: print(f"Erreur get_parents : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des parents"}), 500
 
 @app.route('/api/parents/<int:parent_id>', methods=['GET'])
@@ -258,34 +1348,33 @@ def get_single_parent(parent_id):
 @app.route('/api/parents', methods=['POST'])
 def add_parent():
     data = request.get_json(); db = None
-    if not data or not data.get('name'): return jsonify({"error": "Nom du parent requis"}), 400
-    sql = ''' INSERT INTO parents(name, phone, email, address) VALUES(?,?,?,?) '''
-    params = (data['name'], data.get('phone'), data.get('email'), data.get('address'))
+    try: values = parent_values(data)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
     try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit(); new_parent_id = cursor.lastrowid; db.close(); db = None
-        new_parent = get_parent_by_id(new_parent_id)
-        return jsonify(new_parent if new_parent else {"id": new_parent_id, "message": "Parent ajouté"}), 201
+        db = get_db(); new_parent = insert_row(db, 'parents', values)
+        return jsonify(new_parent), 201
     except sqlite3.IntegrityError as e:
-        if db: db.rollback(); db.close(); print(f"Erreur intégrité add_parent : {e}"); return jsonify({"error": f"Impossible d'ajouter le parent. L'email existe peut-être déjà: {e}"}), 409
+        if db: db.rollback()
+        print(f"Erreur intégrité add_parent : {e}"); return jsonify({"error": f"Impossible d'ajouter le parent. L'email existe peut-être déjà: {e}"}), 409
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur add_parent : {e}"); return jsonify({"error": "Erreur serveur lors de l'ajout du parent"}), 500
+        if db: db.rollback()
+        print(f"Erreur add_parent : {e}"); return jsonify({"error": "Erreur serveur lors de l'ajout du parent"}), 500
 
 @app.route('/api/parents/<int:parent_id>', methods=['PUT'])
 def update_parent(parent_id):
     data = request.get_json(); db = None
     if not data: return jsonify({"error": "Données manquantes"}), 400
-    sql = ''' UPDATE parents SET name=?, phone=?, email=?, address=? WHERE id=? '''
-    params = ( data.get('name'), data.get('phone'), data.get('email'), data.get('address'), parent_id )
+    values = { 'name': data.get('name'), 'phone': data.get('phone'), 'email': data.get('email'), 'address': data.get('address') }
     try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Parent non trouvé"}), 404
-        db.close(); db = None
-        updated_parent = get_parent_by_id(parent_id)
+        db = get_db(); updated_parent = update_row(db, 'parents', parent_id, values)
+        if updated_parent is None: return jsonify({"error": "Parent non trouvé"}), 404
         return jsonify(updated_parent), 200
     except sqlite3.IntegrityError as e:
-        if db: db.rollback(); db.close(); print(f"Erreur intégrité update_parent : {e}"); return jsonify({"error": f"Impossible de mettre à jour. L'email existe peut-être déjà pour un autre parent: {e}"}), 409
+        if db: db.rollback()
+        print(f"Erreur intégrité update_parent : {e}"); return jsonify({"error": f"Impossible de mettre à jour. L'email existe peut-être déjà pour un autre parent: {e}"}), 409
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur update_parent : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour du parent"}), 500
+        if db: db.rollback()
+        print(f"Erreur update_parent : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour du parent"}), 500
 
 @app.route('/api/parents/<int:parent_id>', methods=['DELETE'])
 def delete_parent(parent_id):
@@ -294,28 +1383,33 @@ def delete_parent(parent_id):
         db = get_db(); cursor = db.cursor()
         cursor.execute("SELECT COUNT(*) FROM children WHERE parent_id = ?", (parent_id,))
         count = cursor.fetchone()[0]
-        if count > 0: db.close(); return jsonify({"error": "Impossible de supprimer le parent car il est lié à un ou plusieurs enfants."}), 409
+        if count > 0: return jsonify({"error": "Impossible de supprimer le parent car il est lié à un ou plusieurs enfants."}), 409
         cursor.execute("DELETE FROM parents WHERE id=?", (parent_id,)); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Parent non trouvé"}), 404
-        db.close(); db = None
+        if cursor.rowcount == 0: return jsonify({"error": "Parent non trouvé"}), 404
         return jsonify({"message": f"Parent {parent_id} supprimé"}), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur delete_parent : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression du parent"}), 500
+        if db: db.rollback()
+        print(f"Erreur delete_parent : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression du parent"}), 500
 
 
 # --- API Revenus ---
+def income_filters(args):
+    """Conditions SQL (à ajouter après 'WHERE 1=1', table aliasée i) et paramètres des filtres from/to/source."""
+    clause = ""; params = []
+    if args.get('from'): clause += " AND i.date >= ?"; params.append(args['from'])
+    if args.get('to'): clause += " AND i.date <= ?"; params.append(args['to'])
+    if args.get('source'): clause += " AND i.source = ?"; params.append(args['source'])
+    return clause, params
+
 @app.route('/api/income', methods=['GET'])
+@versioned('income', 'children')
 def get_income():
-    date_from = request.args.get('from'); date_to = request.args.get('to'); source = request.args.get('source')
-    query = "SELECT i.*, c.first_name, c.last_name FROM income i LEFT JOIN children c ON i.related_child_id = c.id WHERE 1=1"
-    params = []
-    if date_from: query += " AND i.date >= ?"; params.append(date_from)
-    if date_to: query += " AND i.date <= ?"; params.append(date_to)
-    if source: query += " AND i.source = ?"; params.append(source)
-    query += " ORDER BY i.date DESC"
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(query, params); income_records = [dict(row) for row in cursor.fetchall()]; db.close()
-        return jsonify(income_records)
+    clause, params = income_filters(request.args)
+    try:
+        db = get_db(); source = archive_source(db, 'income', request.args.get('from'), request.args.get('to'))
+        query = f"SELECT i.*, c.first_name, c.last_name FROM {source} i LEFT JOIN children c ON i.related_child_id = c.id WHERE 1=1" + clause
+        return list_response(db, query, params, [('i.date', 'date'), ('i.id', 'id')], descending=True)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
     except Exception as e: print(f"Erreur get_income : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des revenus"}), 500
 
 @app.route('/api/income/<int:income_id>', methods=['GET'])
@@ -327,62 +1421,59 @@ def get_single_income(income_id):
 @app.route('/api/income', methods=['POST'])
 def add_income():
     data = request.get_json(); db = None
-    if not data or not data.get('date') or not data.get('source') or data.get('amount') is None: return jsonify({"error": "Champs requis manquants : date, source, amount"}), 400
-    try: amount = float(data['amount']); assert amount >= 0
-    except (ValueError, AssertionError): return jsonify({"error": "Montant invalide ou négatif"}), 400
-    child_id = data.get('relatedChildId') or None; parent_id = data.get('relatedParentId') or None
-    sql = ''' INSERT INTO income(date, source, amount, related_child_id, related_parent_id, description, bc_month) VALUES(?,?,?,?,?,?,?) '''
-    params = (data['date'], data['source'], amount, child_id, parent_id, data.get('description'), data.get('bcMonth'))
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit(); new_id = cursor.lastrowid; db.close(); db = None
-        new_income = get_income_by_id(new_id)
-        return jsonify(new_income if new_income else {"id": new_id, "message": "Revenu ajouté"}), 201
+    try: values = income_values(data)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    try:
+        db = get_db(); new_income = insert_row(db, 'income', values)
+        return jsonify(new_income), 201
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur add_income : {e}"); return jsonify({"error": "Erreur serveur lors de l'ajout du revenu"}), 500
+        if db: db.rollback()
+        print(f"Erreur add_income : {e}"); return jsonify({"error": "Erreur serveur lors de l'ajout du revenu"}), 500
 
 @app.route('/api/income/<int:income_id>', methods=['PUT'])
 def update_income(income_id):
     data = request.get_json(); db = None
     if not data: return jsonify({"error": "Données manquantes"}), 400
-    try: amount = float(data['amount']); assert amount >= 0
-    except (ValueError, AssertionError): return jsonify({"error": "Montant invalide ou négatif"}), 400
-    child_id = data.get('relatedChildId') or None; parent_id = data.get('relatedParentId') or None
-    sql = ''' UPDATE income SET date=?, source=?, amount=?, related_child_id=?, related_parent_id=?, description=?, bc_month=? WHERE id=? '''
-    params = ( data.get('date'), data.get('source'), amount, child_id, parent_id, data.get('description'), data.get('bcMonth'), income_id )
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Revenu non trouvé"}), 404
-        db.close(); db = None
-        updated_income = get_income_by_id(income_id)
+    try: values = income_values(data)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    try:
+        db = get_db(); updated_income = update_row(db, 'income', income_id, values)
+        if updated_income is None: return jsonify({"error": "Revenu non trouvé"}), 404
         return jsonify(updated_income), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur update_income : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour du revenu"}), 500
+        if db: db.rollback()
+        print(f"Erreur update_income : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour du revenu"}), 500
 
 @app.route('/api/income/<int:income_id>', methods=['DELETE'])
 def delete_income(income_id):
     db = None
     try:
         db = get_db(); cursor = db.cursor(); cursor.execute("DELETE FROM income WHERE id=?", (income_id,)); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Revenu non trouvé"}), 404
-        db.close(); db = None
+        if cursor.rowcount == 0: return jsonify({"error": "Revenu non trouvé"}), 404
         return jsonify({"message": f"Revenu {income_id} supprimé"}), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur delete_income : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression du revenu"}), 500
+        if db: db.rollback()
+        print(f"Erreur delete_income : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression du revenu"}), 500
 
 
 # --- API Dépenses ---
+def expense_filters(args):
+    """Conditions SQL (à ajouter après 'WHERE 1=1') et paramètres des filtres from/to/category des dépenses."""
+    clause = ""; params = []
+    if args.get('from'): clause += " AND date >= ?"; params.append(args['from'])
+    if args.get('to'): clause += " AND date <= ?"; params.append(args['to'])
+    if args.get('category'): clause += " AND category = ?"; params.append(args['category'])
+    return clause, params
+
 @app.route('/api/expenses', methods=['GET'])
+@versioned('expenses')
 def get_expenses():
-    date_from = request.args.get('from'); date_to = request.args.get('to'); category = request.args.get('category')
-    query = "SELECT * FROM expenses WHERE 1=1"
-    params = []
-    if date_from: query += " AND date >= ?"; params.append(date_from)
-    if date_to: query += " AND date <= ?"; params.append(date_to)
-    if category: query += " AND category = ?"; params.append(category)
-    query += " ORDER BY date DESC"
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(query, params); expenses = [dict(row) for row in cursor.fetchall()]; db.close()
-        return jsonify(expenses)
+    clause, params = expense_filters(request.args)
+    try:
+        db = get_db(); source = archive_source(db, 'expenses', request.args.get('from'), request.args.get('to'))
+        query = f"SELECT expenses.*, {THUMBNAIL_URL} FROM {source} AS expenses LEFT JOIN blobs ON blobs.path = expenses.receipt_filename WHERE 1=1" + clause
+        return list_response(db, query, params, [('date', 'date'), ('id', 'id')], descending=True)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
     except Exception as e: print(f"Erreur get_expenses : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des dépenses"}), 500
 
 @app.route('/api/expenses/<int:expense_id>', methods=['GET'])
@@ -393,55 +1484,34 @@ def get_single_expense(expense_id):
 
 @app.route('/api/expenses', methods=['POST'])
 def add_expense():
-    if 'date' not in request.form or 'category' not in request.form or 'amount' not in request.form: return jsonify({"error": "Champs requis manquants : date, category, amount"}), 400
-    try: amount = float(request.form['amount']); assert amount >= 0
-    except (ValueError, AssertionError): return jsonify({"error": "Montant invalide ou négatif"}), 400
-    date = request.form['date']; category = request.form['category']; vendor = request.form.get('vendor'); description = request.form.get('description')
-    is_personal = 1 if request.form.get('is_personal') == 'true' else 0; receipt_filename = None
-    if 'receipt' in request.files:
-        file = request.files['receipt']
-        if file and file.filename:
-            try:
-                filename_base, filename_ext = os.path.splitext(file.filename); timestamp = int(time.time())
-                receipt_filename = f"{secure_filename(filename_base)}_{timestamp}{filename_ext}"
-                receipt_path = os.path.join(app.config['UPLOAD_FOLDER'], receipt_filename); file.save(receipt_path)
-                print(f"Reçu sauvegardé : {receipt_filename}")
-            except Exception as e: print(f"Erreur sauvegarde reçu : {e}"); return jsonify({"error": f"Impossible de sauvegarder le fichier reçu : {e}"}), 500
-    sql = ''' INSERT INTO expenses(date, category, amount, vendor, description, receipt_filename, is_personal) VALUES(?,?,?,?,?,?,?) '''
-    params = (date, category, amount, vendor, description, receipt_filename, is_personal); db = None
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit(); new_id = cursor.lastrowid; db.close(); db = None
-        new_expense = get_expense_by_id(new_id)
-        return jsonify(new_expense if new_expense else {"id": new_id, "message": "Dépense ajoutée"}), 201
+    try: values = expense_values(request.form)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    file = request.files.get('receipt'); db = None; created = False
+    try:
+        db = get_db(); db.execute("BEGIN IMMEDIATE")
+        if file and file.filename: values['receipt_filename'], created = store_upload(db, file)
+        new_expense = insert_row(db, 'expenses', values)
+        if created: schedule_thumbnail(values['receipt_filename'])
+        return jsonify(new_expense), 201
     except Exception as e:
         if db: db.rollback()
-        if receipt_filename: # Cleanup orphaned file
-             receipt_path_to_delete = os.path.join(app.config['UPLOAD_FOLDER'], receipt_filename)
-             if os.path.exists(receipt_path_to_delete):
-                 try: os.remove(receipt_path_to_delete); print(f"Fichier reçu orphelin supprimé: {receipt_filename}")
-                 except OSError as remove_error: print(f"Erreur suppression fichier orphelin {receipt_filename}: {remove_error}")
+        if created: discard_upload(values['receipt_filename'])
         print(f"Erreur add_expense : {e}"); return jsonify({"error": "Erreur serveur lors de l'ajout de la dépense"}), 500
-    finally:
-         if db: db.close()
 
 @app.route('/api/expenses/<int:expense_id>', methods=['PUT'])
 def update_expense(expense_id):
     # Note: This version does not handle changing the receipt file
     data = request.get_json(); db = None
     if not data: return jsonify({"error": "Données manquantes"}), 400
-    try: amount = float(data['amount']); assert amount >= 0
-    except (ValueError, AssertionError): return jsonify({"error": "Montant invalide ou négatif"}), 400
-    is_personal = 1 if data.get('is_personal') else 0 # Assuming JS sends boolean or null
-    sql = ''' UPDATE expenses SET date=?, category=?, amount=?, vendor=?, description=?, is_personal=? WHERE id=? '''
-    params = ( data.get('date'), data.get('category'), amount, data.get('vendor'), data.get('description'), is_personal, expense_id )
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Dépense non trouvée"}), 404
-        db.close(); db = None
-        updated_expense = get_expense_by_id(expense_id)
+    try: values = expense_values(data); del values['receipt_filename'] # Le justificatif déjà lié est conservé
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    try:
+        db = get_db(); updated_expense = update_row(db, 'expenses', expense_id, values)
+        if updated_expense is None: return jsonify({"error": "Dépense non trouvée"}), 404
         return jsonify(updated_expense), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur update_expense : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour de la dépense"}), 500
+        if db: db.rollback()
+        print(f"Erreur update_expense : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour de la dépense"}), 500
 
 @app.route('/api/expenses/<int:expense_id>', methods=['DELETE'])
 def delete_expense(expense_id):
@@ -450,58 +1520,106 @@ def delete_expense(expense_id):
         db = get_db(); cursor = db.cursor()
         cursor.execute("SELECT receipt_filename FROM expenses WHERE id = ?", (expense_id,)); result = cursor.fetchone()
         if result: filename_to_delete = result['receipt_filename']
-        else: db.close(); return jsonify({"error": "Dépense non trouvée"}), 404
-        cursor.execute("DELETE FROM expenses WHERE id=?", (expense_id,)); db.commit(); db.close(); db = None
-        if filename_to_delete:
-            filepath_to_delete = os.path.join(app.config['UPLOAD_FOLDER'], filename_to_delete)
-            if os.path.exists(filepath_to_delete):
-                try: os.remove(filepath_to_delete); print(f"Fichier reçu supprimé : {filename_to_delete}")
-                except OSError as e: print(f"Erreur suppression fichier reçu {filename_to_delete}: {e}")
-            else: print(f"Fichier reçu non trouvé pour suppression : {filename_to_delete}")
+        else: return jsonify({"error": "Dépense non trouvée"}), 404
+        cursor.execute("DELETE FROM expenses WHERE id=?", (expense_id,))
+        if filename_to_delete: release_upload(db, filename_to_delete)
+        db.commit()
         return jsonify({"message": f"Dépense {expense_id} supprimée"}), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur delete_expense : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression de la dépense"}), 500
+        if db: db.rollback()
+        print(f"Erreur delete_expense : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression de la dépense"}), 500
 
 # --- API Présences ---
+ATTENDANCE_STATUSES = ('present_full', 'present_am', 'present_pm', 'absent_justified', 'absent_unjustified')
+MAX_ATTENDANCE_RANGE_DAYS = 366
+
 @app.route('/api/attendance', methods=['GET'])
+@versioned('attendance')
 def get_attendance():
-    date = request.args.get('date')
-    if not date: return jsonify({"error": "Paramètre 'date' manquant"}), 400
-    db = None
+    date = request.args.get('date'); date_from = request.args.get('from'); date_to = request.args.get('to')
+    if not date and not (date_from and date_to): return jsonify({"error": "Paramètre 'date' ou 'from'/'to' manquant"}), 400
     try:
         db = get_db(); cursor = db.cursor()
-        cursor.execute("SELECT child_id, status, notes FROM attendance WHERE date = ?", (date,))
-        attendance_records = {row['child_id']: dict(row) for row in cursor.fetchall()}
-        db.close(); db = None
-        return jsonify(attendance_records)
+        if date:
+            cursor.execute(f"SELECT child_id, status, notes FROM {archive_source(db, 'attendance', date, date)} WHERE date = ?", (date,))
+            attendance_records = {row['child_id']: dict(row) for row in cursor.fetchall()}
+            return jsonify(attendance_records)
+        # Plage de dates : matrice compacte enfant x jour (un statut ou null par jour), notes à part
+        try: first_day = datetime.date.fromisoformat(date_from); last_day = datetime.date.fromisoformat(date_to)
+        except ValueError: return jsonify({"error": "Dates invalides (format attendu : YYYY-MM-DD)"}), 400
+        day_count = (last_day - first_day).days + 1
+        if not 0 < day_count <= MAX_ATTENDANCE_RANGE_DAYS: return jsonify({"error": f"Plage invalide (1 à {MAX_ATTENDANCE_RANGE_DAYS} jours)"}), 400
+        dates = [(first_day + datetime.timedelta(days=offset)).isoformat() for offset in range(day_count)]
+        matrix = {}; notes = {}
+        cursor.execute(f"SELECT child_id, date, status, notes FROM {archive_source(db, 'attendance', date_from, date_to)} WHERE date BETWEEN ? AND ?", (date_from, date_to))
+        for row in cursor.fetchall():
+            matrix.setdefault(row['child_id'], [None] * day_count)[(datetime.date.fromisoformat(row['date']) - first_day).days] = row['status']
+            if row['notes']: notes.setdefault(row['child_id'], {})[row['date']] = row['notes']
+        return jsonify({"from": date_from, "to": date_to, "dates": dates, "children": matrix, "notes": notes})
+    except ValueError as e: return jsonify({"error": str(e)}), 400
     except Exception as e:
-        if db: db.close(); print(f"Erreur get_attendance : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des présences"}), 500
+        print(f"Erreur get_attendance : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des présences"}), 500
+
+def save_attendance_records(db, records):
+    """Valide puis enregistre des présences {date, child_id, status, notes} en une transaction (executemany + UPSERT).
+    Les lignes dont le statut et les notes n'ont pas changé ne sont pas réécrites.
+    Renvoie (nombre écrit, nombre inchangé, erreurs par ligne)."""
+    known_children = {row[0] for row in db.execute("SELECT id FROM children")}
+    rows = []; errors = []
+    for index, record in enumerate(records):
+        try:
+            if not isinstance(record, dict): raise ValueError("Enregistrement invalide")
+            date = datetime.date.fromisoformat(str(record.get('date'))).isoformat()
+            child_id = int(record.get('child_id')); status = record.get('status')
+            if child_id not in known_children: raise ValueError("Enfant inexistant")
+            if status not in ATTENDANCE_STATUSES: raise ValueError(f"Statut invalide : {status}")
+            rows.append((date, child_id, status, record.get('notes') or None))
+        except (TypeError, ValueError) as e:
+            errors.append({"index": index, "date": record.get('date') if isinstance(record, dict) else None,
+                           "child_id": record.get('child_id') if isinstance(record, dict) else None, "error": str(e)})
+    cursor = db.executemany('''
+        INSERT INTO attendance (date, child_id, status, notes) VALUES (?, ?, ?, ?)
+        ON CONFLICT(date, child_id) DO UPDATE SET status = excluded.status, notes = excluded.notes
+        WHERE attendance.status IS NOT excluded.status OR attendance.notes IS NOT excluded.notes
+    ''', rows)
+    db.commit()
+    written = max(cursor.rowcount, 0)
+    return written, len(rows) - written, errors
 
 @app.route('/api/attendance', methods=['POST'])
 def save_attendance():
     data = request.get_json(); db = None
     if not data or 'date' not in data or 'attendance' not in data: return jsonify({"error": "Données manquantes : date ou attendance"}), 400
     attendance_date = data['date']; attendance_records = data['attendance']
+    # Les enfants sans statut sélectionné sont ignorés, comme auparavant
+    records = [{**record, 'date': attendance_date, 'child_id': child_id_str} for child_id_str, record in attendance_records.items() if record.get('status')]
     try:
-        db = get_db(); cursor = db.cursor()
-        for child_id_str, record in attendance_records.items():
-            try:
-                child_id = int(child_id_str); status = record.get('status'); notes = record.get('notes')
-                if not status: continue
-                cursor.execute('INSERT OR REPLACE INTO attendance (date, child_id, status, notes) VALUES (?, ?, ?, ?)', (attendance_date, child_id, status, notes))
-            except ValueError: print(f"ID enfant invalide reçu : {child_id_str}"); continue
-            except Exception as inner_e: print(f"Erreur traitement enregistrement présence pour enfant {child_id_str}: {inner_e}")
-        db.commit(); db.close(); db = None
-        return jsonify({"message": "Présences enregistrées avec succès"}), 200
+        db = get_db(); written, unchanged, errors = save_attendance_records(db, records)
+        for error in errors: print(f"Présence refusée pour l'enfant {error['child_id']} : {error['error']}")
+        return jsonify({"message": "Présences enregistrées avec succès", "saved": written, "unchanged": unchanged, "errors": errors}), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur save_attendance : {e}"); return jsonify({"error": "Erreur serveur lors de l'enregistrement des présences"}), 500
+        if db: db.rollback()
+        print(f"Erreur save_attendance : {e}"); return jsonify({"error": "Erreur serveur lors de l'enregistrement des présences"}), 500
+
+@app.route('/api/attendance/bulk', methods=['POST'])
+def save_attendance_bulk():
+    """Enregistre en une transaction les présences de plusieurs jours et enfants : {"records": [{date, child_id, status, notes}, ...]}."""
+    data = request.get_json(silent=True); db = None
+    if not data or not isinstance(data.get('records'), list): return jsonify({"error": "Liste 'records' manquante"}), 400
+    try:
+        db = get_db(); written, unchanged, errors = save_attendance_records(db, data['records'])
+        return jsonify({"saved": written, "unchanged": unchanged, "errors": errors}), 200
+    except Exception as e:
+        if db: db.rollback()
+        print(f"Erreur save_attendance_bulk : {e}"); return jsonify({"error": "Erreur serveur lors de l'enregistrement des présences"}), 500
 
 # --- API Documents ---
 @app.route('/api/documents', methods=['GET'])
+@versioned('documents')
 def get_documents():
     try:
-        db = get_db(); cursor = db.cursor(); cursor.execute("SELECT id, type, description, upload_date, filename FROM documents ORDER BY upload_date DESC"); documents = [dict(row) for row in cursor.fetchall()]; db.close()
-        return jsonify(documents)
+        db = get_db()
+        return list_response(db, f"SELECT id, type, description, upload_date, filename, filepath, {THUMBNAIL_URL} FROM documents LEFT JOIN blobs ON blobs.path = documents.filepath WHERE 1=1", [], [('upload_date', 'upload_date'), ('id', 'id')], descending=True)
     except Exception as e: print(f"Erreur get_documents : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des documents"}), 500
 
 @app.route('/api/documents/<int:doc_id>', methods=['GET'])
@@ -515,72 +1633,60 @@ def add_document():
     if 'type' not in request.form or 'document' not in request.files: return jsonify({"error": "Type de document et fichier requis"}), 400
     doc_type = request.form['type']; description = request.form.get('description'); file = request.files['document']
     if file.filename == '': return jsonify({"error": "Aucun fichier sélectionné"}), 400
-    doc_filename = None; doc_filepath_full = None
-    if file:
-        try:
-            filename_base, filename_ext = os.path.splitext(file.filename); timestamp = int(time.time())
-            doc_filename = f"doc_{secure_filename(filename_base)}_{timestamp}{filename_ext}"
-            doc_filepath_full = os.path.join(app.config['UPLOAD_FOLDER'], doc_filename); file.save(doc_filepath_full)
-            print(f"Document sauvegardé : {doc_filename}")
-        except Exception as e: print(f"Erreur sauvegarde document : {e}"); return jsonify({"error": f"Impossible de sauvegarder le fichier document : {e}"}), 500
-    upload_date = datetime.date.today().strftime('%Y-%m-%d'); filepath_relative = doc_filename
-    sql = ''' INSERT INTO documents(type, description, upload_date, filename, filepath) VALUES(?,?,?,?,?) '''
-    params = (doc_type, description, upload_date, doc_filename, filepath_relative); db = None
-    try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit(); new_id = cursor.lastrowid; db.close(); db = None
-        new_doc = get_document_by_id(new_id)
-        return jsonify(new_doc if new_doc else {"id": new_id, "message": "Document ajouté"}), 201
+    # filename reste le nom affiché (unique) ; filepath pointe vers le fichier partagé par empreinte
+    filename_base, filename_ext = os.path.splitext(file.filename); timestamp = int(time.time())
+    doc_filename = f"doc_{secure_filename(filename_base)}_{timestamp}{filename_ext}"
+    upload_date = datetime.date.today().strftime('%Y-%m-%d')
+    values = { 'type': doc_type, 'description': description, 'upload_date': upload_date, 'filename': doc_filename, 'filepath': None }; db = None; created = False
+    try:
+        db = get_db(); db.execute("BEGIN IMMEDIATE")
+        values['filepath'], created = store_upload(db, file)
+        new_doc = insert_row(db, 'documents', values)
+        if created: schedule_thumbnail(values['filepath'])
+        return jsonify(new_doc), 201
     except Exception as e:
         if db: db.rollback()
-        if doc_filepath_full and os.path.exists(doc_filepath_full):
-             try: os.remove(doc_filepath_full); print(f"Fichier document orphelin supprimé: {doc_filename}")
-             except OSError as remove_error: print(f"Erreur suppression fichier orphelin {doc_filename}: {remove_error}")
+        if created: discard_upload(values['filepath'])
         print(f"Erreur add_document : {e}"); return jsonify({"error": "Erreur serveur lors de l'ajout du document"}), 500
-    finally:
-         if db: db.close()
 
 @app.route('/api/documents/<int:doc_id>', methods=['PUT'])
 def update_document(doc_id):
     # Allows updating type and description, not the file itself
     data = request.get_json(); db = None
     if not data: return jsonify({"error": "Données manquantes"}), 400
-    sql = ''' UPDATE documents SET type=?, description=? WHERE id=? '''
-    params = ( data.get('type'), data.get('description'), doc_id )
+    values = { 'type': data.get('type'), 'description': data.get('description') }
     try:
-        db = get_db(); cursor = db.cursor(); cursor.execute(sql, params); db.commit()
-        if cursor.rowcount == 0: db.close(); return jsonify({"error": "Document non trouvé"}), 404
-        db.close(); db = None
-        updated_doc = get_document_by_id(doc_id)
+        db = get_db(); updated_doc = update_row(db, 'documents', doc_id, values)
+        if updated_doc is None: return jsonify({"error": "Document non trouvé"}), 404
         return jsonify(updated_doc), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur update_document : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour du document"}), 500
+        if db: db.rollback()
+        print(f"Erreur update_document : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour du document"}), 500
 
 @app.route('/api/documents/<int:doc_id>', methods=['DELETE'])
 def delete_document(doc_id):
     db = None; filename_to_delete = None
     try:
         db = get_db(); cursor = db.cursor()
-        cursor.execute("SELECT filename FROM documents WHERE id = ?", (doc_id,)); result = cursor.fetchone()
-        if result: filename_to_delete = result['filename']
-        else: db.close(); return jsonify({"error": "Document non trouvé"}), 404
-        cursor.execute("DELETE FROM documents WHERE id = ?", (doc_id,)); db.commit(); db.close(); db = None
-        if filename_to_delete:
-            filepath_to_delete = os.path.join(app.config['UPLOAD_FOLDER'], filename_to_delete)
-            if os.path.exists(filepath_to_delete):
-                try: os.remove(filepath_to_delete); print(f"Fichier document supprimé : {filename_to_delete}")
-                except OSError as e: print(f"Erreur lors de la suppression du fichier {filename_to_delete}: {e}")
-            else: print(f"Fichier document non trouvé pour suppression : {filename_to_delete}")
+        cursor.execute("SELECT filepath FROM documents WHERE id = ?", (doc_id,)); result = cursor.fetchone()
+        if result: filename_to_delete = result['filepath']
+        else: return jsonify({"error": "Document non trouvé"}), 404
+        cursor.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        release_upload(db, filename_to_delete)
+        db.commit()
         return jsonify({"message": "Document supprimé avec succès"}), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur delete_document : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression du document"}), 500
+        if db: db.rollback()
+        print(f"Erreur delete_document : {e}"); return jsonify({"error": "Erreur serveur lors de la suppression du document"}), 500
 
 
 # --- API Paramètres ---
 @app.route('/api/settings', methods=['GET'])
+@versioned('settings')
 def get_settings():
     try:
-        db = get_db(); cursor = db.cursor(); cursor.execute("SELECT key, value FROM settings"); settings = {row['key']: row['value'] for row in cursor.fetchall()}; db.close()
-        return jsonify(settings)
+        db = get_db()
+        return jsonify(cached_settings(db)[0])
     except Exception as e: print(f"Erreur get_settings : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des paramètres"}), 500
 
 @app.route('/api/settings', methods=['POST'])
@@ -592,21 +1698,835 @@ def update_settings():
         for key, value in data.items():
             if not isinstance(key, str) or not key.replace('_', '').isalnum(): print(f"Clé de paramètre invalide : {key}"); continue
             cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
-        db.commit(); db.close(); db = None
+        # Cache mis à jour par l'écrivain : relu dans sa transaction (verrou d'écriture tenu), il correspond exactement au commit
+        load_settings(db)
+        db.commit()
         return jsonify({"message": "Paramètres mis à jour avec succès"}), 200
     except Exception as e:
-        if db: db.rollback(); db.close(); print(f"Erreur update_settings : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour des paramètres"}), 500
+        if db: db.rollback()
+        _settings_cache.pop(app.config['DATABASE'], None)
+        print(f"Erreur update_settings : {e}"); return jsonify({"error": "Erreur serveur lors de la mise à jour des paramètres"}), 500
+
+# --- Alertes : règles évaluées en arrière-plan, seulement pour les sujets modifiés depuis leur dernière évaluation ---
+# Les triggers de la migration 10 journalisent chaque sujet modifié dans alert_changes ; chaque règle retient la dernière séquence
+# traitée et ne réévalue que les sujets journalisés depuis, plus ceux dont la date de réveil (alert_checks) est arrivée.
+# Âge (mois) -> conséquence sur le ratio d'encadrement
+ALERT_AGE_THRESHOLDS = {18: "ne compte plus parmi les poupons (au plus 2 enfants de moins de 18 mois)"}
+_alert_scheduler = None
+_alert_scheduler_lock = threading.Lock()
+
+def add_months(day, months):
+    """`day` décalé de `months` mois, ramené au dernier jour du mois d'arrivée s'il est plus court (31 janvier + 1 -> fin février)."""
+    year, month = divmod(day.month - 1 + months, 12); year += day.year; month += 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+def _active_child(db, subject):
+    return db.execute("SELECT id, first_name || ' ' || last_name AS name, dob FROM children WHERE id = ? AND status = 'active'", (subject,)).fetchone()
+
+def _required_documents():
+    return {key.lower(): months for key, months in (app.config['ALERT_REQUIRED_DOCUMENTS'] or {}).items()}
+
+# Chaque règle d'alerte reçoit (db, sujet, aujourd'hui) et renvoie ((gravité, message, échéance) ou None, prochaine réévaluation ou None).
+def _insurance_alert(db, subject, today):
+    if subject != 'insurance_expiry_date': return None, None
+    expiry = cached_settings(db)[1].get('insurance_expiry_date'); lead = datetime.timedelta(days=app.config['ALERT_LEAD_DAYS'])
+    if expiry is None: return ('info', "Date d'expiration de l'assurance non renseignée (Paramètres)", None), None
+    if expiry < today: return ('urgent', f"Assurance expirée depuis le {expiry}", expiry.isoformat()), None
+    if expiry - lead <= today: return ('warning', f"L'assurance expire le {expiry}", expiry.isoformat()), expiry + datetime.timedelta(days=1)
+    return None, expiry - lead
+
+def _child_age_alert(db, subject, today):
+    child = _active_child(db, subject)
+    try: dob = datetime.date.fromisoformat(child['dob']) if child and child['dob'] else None
+    except ValueError: dob = None
+    if dob is None: return None, None
+    lead = datetime.timedelta(days=app.config['ALERT_LEAD_DAYS'])
+    for months, consequence in sorted(ALERT_AGE_THRESHOLDS.items()):
+        birthday = add_months(dob, months)
+        if birthday < today: continue
+        if birthday - lead > today: return None, birthday - lead
+        return ('info', f"{child['name']} aura {months} mois le {birthday} : {consequence}", birthday.isoformat()), birthday + datetime.timedelta(days=1)
+    return None, None
+
+def _missing_income_alert(db, subject, today):
+    # Mois précédent sans revenu pour un enfant actif déjà facturé avant ce mois (un enfant qui vient d'arriver n'est pas signalé)
+    child = _active_child(db, subject)
+    if child is None: return None, None
+    month_start = today.replace(day=1); start = add_months(month_start, -1); end = month_start - datetime.timedelta(days=1)
+    in_month, before = db.execute("""SELECT EXISTS(SELECT 1 FROM income WHERE related_child_id = :id AND date BETWEEN :start AND :end),
+                                            EXISTS(SELECT 1 FROM income WHERE related_child_id = :id AND date < :start)""",
+                                  {"id": child['id'], "start": start.isoformat(), "end": end.isoformat()}).fetchone()
+    if in_month or not before: return None, add_months(month_start, 1)
+    return ('warning', f"Aucun revenu enregistré pour {child['name']} en {start:%Y-%m}", end.isoformat()), add_months(month_start, 1)
+
+def _document_alert(db, subject, today):
+    months = _required_documents().get(subject)
+    if months is None: return None, None
+    latest = db.execute("SELECT MAX(upload_date) FROM documents WHERE instr(lower(type), ?) > 0", (subject,)).fetchone()[0]
+    if latest is None: return ('warning', f"Aucun document « {subject} » téléversé", None), None
+    renewal = add_months(datetime.date.fromisoformat(latest[:10]), months)
+    if renewal > today: return None, renewal
+    return ('warning', f"Le document « {subject} » le plus récent date du {latest[:10]} (plus de {months} mois)", renewal.isoformat()), None
+
+# Sujets d'une règle parmi ceux modifiés (`changed`), ou tous ses sujets (changed=None)
+def _settings_subjects(db, changed):
+    return {'insurance_expiry_date'} if changed is None else changed & {'insurance_expiry_date'}
+
+def _child_subjects(db, changed):
+    return {str(row[0]) for row in db.execute("SELECT id FROM children WHERE status = 'active'")} if changed is None else changed
+
+def _document_subjects(db, changed):
+    required = set(_required_documents())
+    return required if changed is None else {key for key in required if any(key in subject for subject in changed)}
+
+# Règle -> (source du journal, sujets, évaluation, paramètres : s'ils changent, la règle est réévaluée pour tous ses sujets)
+ALERT_RULES = {
+    'insurance_expiry': ('settings', _settings_subjects, _insurance_alert, lambda: app.config['ALERT_LEAD_DAYS']),
+    'child_age': ('child', _child_subjects, _child_age_alert, lambda: [app.config['ALERT_LEAD_DAYS'], ALERT_AGE_THRESHOLDS]),
+    'missing_income': ('child', _child_subjects, _missing_income_alert, lambda: None),
+    'document_age': ('documents', _document_subjects, _document_alert, _required_documents),
+}
+
+def evaluate_alerts(db, full=False):
+    """Évalue les règles dans une transaction d'écriture. Chaque règle ne réévalue que les sujets journalisés depuis sa dernière
+    évaluation et ceux dont la date de réveil est arrivée ; tous ses sujets à sa première évaluation, quand ses paramètres changent
+    ou avec full=True. Une alerte inchangée n'est pas réécrite (l'ETag de /api/alerts ne bouge pas). Renvoie {règle: sujets évalués}."""
+    today = datetime.date.today(); now = datetime.datetime.now().isoformat(timespec='seconds'); evaluated = {}
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        last_seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM alert_changes").fetchone()[0]
+        for rule, (source, subjects, evaluate, params) in ALERT_RULES.items():
+            params = json.dumps(params(), sort_keys=True)
+            state = db.execute("SELECT last_seq, params FROM alert_rules WHERE rule = ?", (rule,)).fetchone()
+            if full or state is None or state['params'] != params:
+                # Y compris les sujets qui n'en sont plus (enfant supprimé, document retiré de la liste) pour effacer leurs alertes
+                todo = subjects(db, None) | {row[0] for row in db.execute("SELECT subject FROM alerts WHERE rule = ? UNION SELECT subject FROM alert_checks WHERE rule = ?", (rule, rule))}
+            else:
+                changed = {row[0] for row in db.execute("SELECT subject FROM alert_changes WHERE source = ? AND seq > ?", (source, state['last_seq']))}
+                todo = (subjects(db, changed) if changed else set()) | {row[0] for row in db.execute("SELECT subject FROM alert_checks WHERE rule = ? AND next_check <= ?", (rule, today.isoformat()))}
+            for subject in todo:
+                alert, next_check = evaluate(db, subject, today)
+                if alert is None: db.execute("DELETE FROM alerts WHERE rule = ? AND subject = ?", (rule, subject))
+                else:
+                    db.execute("""INSERT INTO alerts(rule, subject, severity, message, due_date, created_at) VALUES(?, ?, ?, ?, ?, ?)
+                                  ON CONFLICT(rule, subject) DO UPDATE SET severity = excluded.severity, message = excluded.message, due_date = excluded.due_date
+                                  WHERE (severity, message, due_date) IS NOT (excluded.severity, excluded.message, excluded.due_date)""", (rule, subject, *alert, now))
+                if next_check is None: db.execute("DELETE FROM alert_checks WHERE rule = ? AND subject = ?", (rule, subject))
+                else: db.execute("INSERT INTO alert_checks(rule, subject, next_check) VALUES(?, ?, ?) ON CONFLICT(rule, subject) DO UPDATE SET next_check = excluded.next_check", (rule, subject, next_check.isoformat()))
+            db.execute("""INSERT INTO alert_rules(rule, last_seq, params, last_run) VALUES(?, ?, ?, ?)
+                          ON CONFLICT(rule) DO UPDATE SET last_seq = excluded.last_seq, params = excluded.params, last_run = excluded.last_run""", (rule, last_seq, params, now))
+            evaluated[rule] = len(todo)
+        # Journal lu par toutes les règles ; les lignes de la dernière séquence restent pour que MAX(seq) + 1 ne reparte pas en arrière
+        db.execute("DELETE FROM alert_changes WHERE seq < ?", (last_seq,))
+        db.commit()
+    except Exception:
+        db.rollback(); raise
+    return evaluated
+
+def _evaluate_alerts_now():
+    # Connexion hors pool : le passage sur tous les centres ne doit pas évincer ceux que les requêtes servent
+    with closing(_connect()) as db: evaluate_alerts(db)
+
+def _alert_loop():
+    while True:
+        run_for_each_tenant(_evaluate_alerts_now, "évaluation des alertes")
+        time.sleep(app.config['ALERT_INTERVAL_SECONDS'])
+
+def start_alert_scheduler():
+    """Démarre (une fois par processus) le fil qui évalue les alertes ; entre workers, la transaction d'écriture les sérialise
+    et le second ne trouve plus rien à réévaluer."""
+    global _alert_scheduler
+    if not app.config['ALERT_INTERVAL_SECONDS']: return
+    with _alert_scheduler_lock:
+        if _alert_scheduler is None:
+            _alert_scheduler = threading.Thread(target=_alert_loop, name='alertes', daemon=True); _alert_scheduler.start()
+
+@app.cli.command('check-alerts')
+@click.option('--full', is_flag=True, help="Réévaluer tous les sujets de toutes les règles.")
+def check_alerts_command(full):
+    """Évalue les alertes maintenant (ce que fait le fil d'arrière-plan du serveur) et affiche le nombre de sujets évalués."""
+    evaluated = evaluate_alerts(get_db(), full=full)
+    print(', '.join(f"{rule} : {count}" for rule, count in evaluated.items()))
+
+def list_alerts(db):
+    """Alertes en cours, des plus graves aux moins graves puis par échéance."""
+    return [dict(row) for row in db.execute("""SELECT id, rule, subject, severity, message, due_date, created_at FROM alerts
+                                               ORDER BY CASE severity WHEN 'urgent' THEN 0 WHEN 'warning' THEN 1 ELSE 2 END, due_date IS NULL, due_date, id""")]
+
+@app.route('/api/alerts', methods=['GET'])
+@versioned('alerts')
+def get_alerts():
+    # Lecture seule d'une table tenue à jour en arrière-plan ; 304 sans la lire tant que le compteur 'alerts' n'a pas bougé
+    try:
+        db = get_db()
+        return jsonify(list_alerts(db))
+    except Exception as e: print(f"Erreur get_alerts : {e}"); return jsonify({"error": "Erreur serveur lors de la récupération des alertes"}), 500
+
+# --- Recherche plein texte ---
+SEARCH_PAGE_SIZE = 20
+
+def search_match_query(text):
+    """Requête FTS5 à partir de la saisie : chaque mot est cité (aucune syntaxe FTS5 interprétée) et cherché en préfixe."""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+@app.route('/api/search', methods=['GET'])
+@versioned(*SEARCH_SOURCES)
+def search():
+    """?q=texte[&kind=child|parent|income|expense|document][&limit=N&after=curseur] : résultats classés par pertinence (bm25), paginés par curseur."""
+    match = search_match_query(request.args.get('q', ''))
+    if not match: return jsonify({"error": "Paramètre 'q' manquant"}), 400
+    kinds = [kind for _, kind, _, _ in SEARCH_SOURCES.values()]; kind = request.args.get('kind')
+    if kind and kind not in kinds: return jsonify({"error": f"Type invalide (attendu : {', '.join(kinds)})"}), 400
+    query = '''SELECT * FROM (SELECT kind, entity_id AS id, title, snippet(search_index, -1, '«', '»', '…', 12) AS snippet, rank AS score, rowid AS search_key
+                 FROM search_index WHERE search_index MATCH ?''' + (" AND kind = ?" if kind else "") + ") WHERE 1=1"
+    try:
+        db = get_db()
+        return list_response(db, query, [match, kind] if kind else [match], [('score', 'score'), ('search_key', 'search_key')], default_limit=SEARCH_PAGE_SIZE)
+    except Exception as e: print(f"Erreur search : {e}"); return jsonify({"error": "Erreur serveur lors de la recherche"}), 500
+
+# --- Rapports : relevés 24 (RL-24) et estimation des taxes ---
+# Paramètres par année d'imposition (travailleur autonome au Québec). Une année absente utilise la plus récente connue.
+TAX_RATES = {
+    2024: {'qpp_rate': 0.128, 'qpp_exemption': 3500, 'qpp_max_earnings': 68500, 'qpip_rate': 0.00878, 'qpip_max_insurable': 94000, 'tps_rate': 0.05, 'tvq_rate': 0.09975, 'small_supplier_threshold': 30000},
+    2025: {'qpp_rate': 0.128, 'qpp_exemption': 3500, 'qpp_max_earnings': 71300, 'qpip_rate': 0.00878, 'qpip_max_insurable': 98000, 'tps_rate': 0.05, 'tvq_rate': 0.09975, 'small_supplier_threshold': 30000},
+}
+# Catégories de dépenses déductibles au prorata de l'usage de la maison / de l'auto (paramètres home_usage / car_usage)
+HOME_USAGE_CATEGORIES = ('maintenance', 'insurance', 'utilities', 'rent')
+CAR_USAGE_CATEGORIES = ('car', 'vehicle', 'fuel')
+# Résultats par (base, année) : (version de report_versions, pourcentages d'usage, données)
+_report_cache = {}
+
+def _usage_percentage(value, default=100.0):
+    try: return min(max(float(value), 0.0), 100.0)
+    except (TypeError, ValueError): return default
+
+def compute_year_report(db, year):
+    """Totaux d'une année en une seule requête groupée : paiements par parent et par enfant (RL-24)
+    et totaux par source / catégorie lus dans monthly_totals. Mis en cache jusqu'au prochain changement
+    de revenus ou dépenses de l'année (report_versions) ou des pourcentages d'usage."""
+    settings = cached_settings(db)[1]
+    usage = (_usage_percentage(settings.get('home_usage')), _usage_percentage(settings.get('car_usage')))
+    row = db.execute("SELECT version FROM report_versions WHERE year = ?", (str(year),)).fetchone()
+    version = row['version'] if row else 0
+    cache_key = (app.config['DATABASE'], year); cached = _report_cache.get(cache_key)
+    if cached and cached[0] == version and cached[1] == usage: return cached[2]
+    cursor = db.execute(f'''
+        SELECT 'parent' AS part, COALESCE(i.related_parent_id, c.parent_id) AS key, i.related_child_id AS detail, SUM(i.amount) AS total
+          FROM {archive_source(db, 'income', f"{year}-01-01", f"{year}-12-31")} i LEFT JOIN children c ON c.id = i.related_child_id
+         WHERE i.date BETWEEN ? AND ? AND i.source = 'parent_contribution' GROUP BY 2, 3
+        UNION ALL
+        SELECT kind, key, is_personal, SUM(total) FROM monthly_totals WHERE month BETWEEN ? AND ? GROUP BY kind, key, is_personal
+    ''', (f"{year}-01-01", f"{year}-12-31", f"{year}-01", f"{year}-12"))
+    report = {'year': year, 'income_total': 0.0, 'income_by_source': {}, 'expenses_by_category': {}, 'personal_expenses': 0.0, 'deductible_expenses': 0.0, 'parents': {}, 'unassigned_parent_payments': 0.0}
+    for part, key, detail, total in cursor.fetchall():
+        if part == 'parent':
+            if key is None: report['unassigned_parent_payments'] += total; continue
+            parent = report['parents'].setdefault(key, {'total': 0.0, 'children': {}})
+            parent['total'] += total; parent['children'][detail] = parent['children'].get(detail, 0.0) + total
+        elif part == 'income': report['income_total'] += total; report['income_by_source'][key] = round(total, 2)
+        elif detail: report['personal_expenses'] += total
+        else:
+            ratio = usage[0] if key in HOME_USAGE_CATEGORIES else usage[1] if key in CAR_USAGE_CATEGORIES else 100.0
+            report['expenses_by_category'][key] = {'amount': round(total, 2), 'deductible_percentage': ratio, 'deductible': round(total * ratio / 100, 2)}
+            report['deductible_expenses'] += total * ratio / 100
+    rates_year = year if year in TAX_RATES else max(TAX_RATES); rates = TAX_RATES[rates_year]
+    net = report['income_total'] - report['deductible_expenses']
+    small_supplier = report['income_total'] <= rates['small_supplier_threshold']
+    report['net_income'] = round(net, 2)
+    # Estimations à valider avec un comptable : RRQ/RQAP sur le revenu net d'entreprise, TPS/TVQ sur les revenus
+    # seulement au-delà du seuil du petit fournisseur
+    report['taxes'] = {
+        'rates_year': rates_year, 'small_supplier': small_supplier,
+        'qpp': round(max(0.0, min(net, rates['qpp_max_earnings']) - rates['qpp_exemption']) * rates['qpp_rate'], 2),
+        'qpip': round(max(0.0, min(net, rates['qpip_max_insurable'])) * rates['qpip_rate'], 2),
+        'tps': 0.0 if small_supplier else round(report['income_total'] * rates['tps_rate'], 2),
+        'tvq': 0.0 if small_supplier else round(report['income_total'] * rates['tvq_rate'], 2),
+    }
+    for key in ('income_total', 'personal_expenses', 'deductible_expenses', 'unassigned_parent_payments'): report[key] = round(report[key], 2)
+    _report_cache[cache_key] = (version, usage, report)
+    return report
+
+@app.route('/api/reports/<int:year>/taxes', methods=['GET'])
+def get_tax_report(year):
+    try:
+        report = compute_year_report(get_db(), year)
+        return jsonify({key: value for key, value in report.items() if key != 'parents'})
+    except Exception as e: print(f"Erreur get_tax_report : {e}"); return jsonify({"error": "Erreur serveur lors du calcul des taxes"}), 500
+
+@app.route('/api/reports/<int:year>/receipts', methods=['GET'])
+def get_tax_receipts(year):
+    """Données des relevés 24 de tous les parents pour l'année, en un seul appel."""
+    try:
+        db = get_db(); report = compute_year_report(db, year)
+        parents = {row['id']: dict(row) for row in db.execute("SELECT id, name, email, phone, address FROM parents")}
+        children = {row['id']: f"{row['first_name']} {row['last_name']}" for row in db.execute("SELECT id, first_name, last_name FROM children")}
+        receipts = [{**parents.get(parent_id, {'id': parent_id}), 'year': year, 'total': round(totals['total'], 2),
+                     'children': [{'child_id': child_id, 'name': children.get(child_id), 'amount': round(amount, 2)} for child_id, amount in totals['children'].items()]}
+                    for parent_id, totals in report['parents'].items()]
+        receipts.sort(key=lambda receipt: receipt.get('name') or '')
+        return jsonify({'year': year, 'receipts': receipts, 'unassigned_parent_payments': report['unassigned_parent_payments']})
+    except Exception as e: print(f"Erreur get_tax_receipts : {e}"); return jsonify({"error": "Erreur serveur lors de la génération des relevés"}), 500
+
+# --- Statistiques mensuelles par enfant (présences et revenus) ---
+# Une journée, même partielle, compte comme jour de présence
+ATTENDED_STATUSES = ('present_full', 'present_am', 'present_pm')
+# Résultats par (base, année) : (versions des données lues, statistiques)
+_child_stats_cache = {}
+
+def _ratio_grid(numerator, denominator, digits):
+    """numerator / denominator élément par élément (listes de listes), None là où le dénominateur est nul."""
+    if np is not None:
+        numerator = np.asarray(numerator, dtype=np.float64); denominator = np.asarray(denominator, dtype=np.float64)
+        quotient = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0).tolist()
+        return [[round(value, digits) if valid else None for value, valid in zip(row, valid_row)] for row, valid_row in zip(quotient, (denominator > 0).tolist())]
+    return [[round(a / b, digits) if b else None for a, b in zip(row_a, row_b)] for row_a, row_b in zip(numerator, denominator)]
+
+def compute_child_stats(db, year):
+    """Grille enfants × mois de `year` : jours par statut de présence, jours de présence, jours saisis, taux de présence,
+    revenus rattachés (related_child_id) et revenu par jour de présence, plus le total de l'année (13e colonne).
+    Chaque table est lue une seule fois, agrégée par SQLite en (enfant, mois[, statut]) ; la grille et les ratios sont
+    calculés en tableaux. Mis en cache jusqu'au prochain changement des enfants, des présences ou des revenus de l'année."""
+    versions = tuple(db.execute("""SELECT (SELECT version FROM table_versions WHERE name = 'children'), (SELECT version FROM table_versions WHERE name = 'attendance'),
+                                          (SELECT COALESCE(MAX(version), 0) FROM report_versions WHERE year = ?)""", (str(year),)).fetchone())
+    cache_key = (app.config['DATABASE'], year); cached = _child_stats_cache.get(cache_key)
+    if cached and cached[0] == versions: return cached[1]
+    first_day, last_day = f"{year}-01-01", f"{year}-12-31"; statuses = len(ATTENDANCE_STATUSES)
+    children = db.execute("SELECT id, first_name || ' ' || last_name AS name, status FROM children ORDER BY id").fetchall()
+    codes = ' '.join(f"WHEN '{status}' THEN {code}" for code, status in enumerate(ATTENDANCE_STATUSES))
+    attendance = db.execute(f"""SELECT child_id, CAST(substr(date, 6, 2) AS INTEGER) - 1, CASE status {codes} END, COUNT(*) FROM {archive_source(db, 'attendance', first_day, last_day)}
+                                WHERE date BETWEEN ? AND ? AND status IN ({', '.join('?' * statuses)}) GROUP BY 1, 2, 3""", (first_day, last_day, *ATTENDANCE_STATUSES)).fetchall()
+    income = db.execute(f"""SELECT related_child_id, CAST(substr(date, 6, 2) AS INTEGER) - 1, SUM(amount) FROM {archive_source(db, 'income', first_day, last_day)}
+                           WHERE date BETWEEN ? AND ? AND related_child_id IS NOT NULL GROUP BY 1, 2""", (first_day, last_day)).fetchall()
+    ids = [child['id'] for child in children]
+    # days[enfant][statut][mois], revenue[enfant][mois] ; colonne 12 : année entière
+    if np is not None:
+        child_ids = np.array(ids, dtype=np.int64); days = np.zeros((len(ids), statuses, 13), dtype=np.int64); revenue = np.zeros((len(ids), 13))
+        if attendance:
+            # Une archive garde les présences d'enfants supprimés après la clôture : ignorées comme les revenus
+            rows = np.array([tuple(row) for row in attendance], dtype=np.int64); rows = rows[np.isin(rows[:, 0], child_ids)]
+            days[np.searchsorted(child_ids, rows[:, 0]), rows[:, 2], rows[:, 1]] = rows[:, 3]
+        if income:
+            rows = np.array([tuple(row) for row in income], dtype=np.float64); known = np.isin(rows[:, 0], child_ids)
+            revenue[np.searchsorted(child_ids, rows[known, 0]), rows[known, 1].astype(np.int64)] = rows[known, 2]
+        days[:, :, 12] = days[:, :, :12].sum(axis=2); revenue[:, 12] = revenue[:, :12].sum(axis=1)
+        attended = days[:, :len(ATTENDED_STATUSES)].sum(axis=1); recorded = days.sum(axis=1)
+        days, revenue, attended, recorded = days.tolist(), revenue.tolist(), attended.tolist(), recorded.tolist()
+    else:
+        position = {child_id: index for index, child_id in enumerate(ids)}
+        days = [[[0] * 13 for _ in range(statuses)] for _ in ids]; revenue = [[0.0] * 13 for _ in ids]
+        for child_id, month, code, count in attendance:
+            if child_id in position: days[position[child_id]][code][month] = count; days[position[child_id]][code][12] += count
+        for child_id, month, total in income:
+            if child_id in position: revenue[position[child_id]][month] = total; revenue[position[child_id]][12] += total
+        attended = [[sum(column) for column in zip(*grid[:len(ATTENDED_STATUSES)])] for grid in days]
+        recorded = [[sum(column) for column in zip(*grid)] for grid in days]
+    revenue = [[round(total, 2) for total in row] for row in revenue]
+    rate = _ratio_grid(attended, recorded, 4); per_day = _ratio_grid(revenue, attended, 2)
+    def columns(index, part):
+        return {"days": {status: counts[part] for status, counts in zip(ATTENDANCE_STATUSES, days[index])}, "attended_days": attended[index][part],
+                "recorded_days": recorded[index][part], "attendance_rate": rate[index][part], "income": revenue[index][part], "revenue_per_attended_day": per_day[index][part]}
+    stats = {"year": year, "months": [f"{year}-{month:02d}" for month in range(1, 13)], "statuses": list(ATTENDANCE_STATUSES),
+             "children": [{"id": child['id'], "name": child['name'], "status": child['status'], **columns(index, slice(0, 12)), "year": columns(index, 12)}
+                          for index, child in enumerate(children)]}
+    _child_stats_cache[cache_key] = (versions, stats)
+    return stats
+
+@app.route('/api/stats/children', methods=['GET'])
+@versioned('children', 'attendance', 'income')
+def get_child_stats():
+    """Statistiques mensuelles de chaque enfant pour ?year= (année courante par défaut)."""
+    try: year = int(request.args.get('year') or datetime.date.today().year); assert 1900 <= year <= 9999
+    except (ValueError, AssertionError): return jsonify({"error": "Année invalide (format attendu : YYYY)"}), 400
+    db = None
+    try:
+        # Une transaction de lecture : versions du cache et données lues sur le même instantané ; les archives de l'année
+        # sont attachées avant (ATTACH est impossible dans une transaction)
+        db = get_db(); attach_archives(db, f"{year}-01-01", f"{year}-12-31"); db.execute("BEGIN")
+        stats = compute_child_stats(db, year); db.commit()
+        return jsonify(stats)
+    except Exception as e:
+        if db: db.rollback()
+        print(f"Erreur get_child_stats : {e}"); return jsonify({"error": "Erreur serveur lors du calcul des statistiques"}), 500
+
+# --- API Exports (comptable) ---
+EXPORT_FETCH_SIZE = 1000  # lignes lues par fetchmany : mémoire constante quelle que soit la taille de l'export
+
+def attendance_filters(args):
+    """Conditions SQL (après 'WHERE 1=1', table aliasée a) et paramètres des filtres from/to/child_id des présences."""
+    clause = ""; params = []
+    if args.get('from'): clause += " AND a.date >= ?"; params.append(args['from'])
+    if args.get('to'): clause += " AND a.date <= ?"; params.append(args['to'])
+    if args.get('child_id'): clause += " AND a.child_id = ?"; params.append(args['child_id'])
+    return clause, params
+
+# Requêtes d'export : (en-tête CSV, SELECT terminé par 'WHERE 1=1', fonction de filtres, tri) ; {source} : table de la
+# base active, ou réunion avec les archives quand la période en touche une (archive_source)
+EXPORTS = {
+    'income': (
+        ['id', 'date', 'source', 'amount', 'child', 'parent', 'description', 'bc_month'],
+        "SELECT i.id, i.date, i.source, i.amount, c.first_name || ' ' || c.last_name, p.name, i.description, i.bc_month FROM {source} i LEFT JOIN children c ON i.related_child_id = c.id LEFT JOIN parents p ON p.id = COALESCE(i.related_parent_id, c.parent_id) WHERE 1=1",
+        income_filters, " ORDER BY i.date, i.id"),
+    'expenses': (
+        ['id', 'date', 'category', 'amount', 'vendor', 'description', 'is_personal', 'receipt_filename'],
+        "SELECT id, date, category, amount, vendor, description, is_personal, receipt_filename FROM {source} WHERE 1=1",
+        expense_filters, " ORDER BY date, id"),
+    'attendance': (
+        ['date', 'child_id', 'child', 'status', 'notes'],
+        "SELECT a.date, a.child_id, c.first_name || ' ' || c.last_name, a.status, a.notes FROM {source} a JOIN children c ON c.id = a.child_id WHERE 1=1",
+        attendance_filters, " ORDER BY a.date, c.last_name, c.first_name"),
+}
+
+def iter_csv(cursor, header):
+    """Produit le CSV (UTF-8 avec BOM pour Excel) par blocs de EXPORT_FETCH_SIZE lignes lues depuis le curseur."""
+    buffer = io.StringIO(); writer = csv.writer(buffer)
+    buffer.write('\ufeff'); writer.writerow(header)
+    for rows in iter(lambda: cursor.fetchmany(EXPORT_FETCH_SIZE), []):
+        writer.writerows(rows); yield buffer.getvalue(); buffer.seek(0); buffer.truncate()
+    yield buffer.getvalue()
+
+@app.route('/api/export/<kind>', methods=['GET'])
+def export_csv(kind):
+    if kind not in EXPORTS: return jsonify({"error": "Export inconnu (income, expenses ou attendance)"}), 404
+    header, query, filters, order = EXPORTS[kind]
+    clause, params = filters(request.args)
+    try:
+        db = get_db(); source = archive_source(db, kind, request.args.get('from'), request.args.get('to'))
+        cursor = db.execute(query.format(source=source) + clause + order, params)
+        g.db_streaming = True
+        period = '_'.join(filter(None, (request.args.get('from'), request.args.get('to')))) or 'complet'
+        return Response(stream_with_context(iter_csv(cursor, header)), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename="{kind}_{period}.csv"'})
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    except Exception as e: print(f"Erreur export_csv {kind} : {e}"); return jsonify({"error": "Erreur serveur lors de l'export"}), 500
+
+class _ZipStream:
+    """Sortie non positionnable pour zipfile : accumule les octets écrits, que le générateur vide au fil de l'eau."""
+    def __init__(self): self.chunks = []
+    def write(self, data): self.chunks.append(bytes(data)); return len(data)
+    def flush(self): pass
+    def drain(self): data = b''.join(self.chunks); self.chunks.clear(); return data
+
+@app.route('/api/export/fiscal-year/<int:year>', methods=['GET'])
+def export_fiscal_year(year):
+    """Archive ZIP d'une année (revenus, dépenses, présences en CSV et reçus référencés), diffusée sans fichier temporaire."""
+    db = get_db(); year_args = {'from': f"{year}-01-01", 'to': f"{year}-12-31"}
+    sources = {table: archive_source(db, table, year_args['from'], year_args['to']) for table in ARCHIVED_TABLES}
+    def generate():
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for kind, (header, query, filters, order) in EXPORTS.items():
+                clause, params = filters(year_args)
+                with archive.open(f"{kind}_{year}.csv", 'w', force_zip64=True) as member:
+                    for chunk in iter_csv(db.execute(query.format(source=sources[kind]) + clause + order, params), header):
+                        member.write(chunk.encode('utf-8')); yield stream.drain()
+            receipts = db.execute(f"SELECT DISTINCT receipt_filename FROM {sources['expenses']} WHERE date BETWEEN ? AND ? AND receipt_filename IS NOT NULL", (year_args['from'], year_args['to']))
+            for (filename,) in receipts:
+                path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                if not os.path.isfile(path): print(f"Reçu manquant pour l'export {year} : {filename}"); continue
+                # Les reçus (JPEG, PDF) sont déjà compressés : stockés tels quels
+                info = zipfile.ZipInfo(f"receipts/{os.path.basename(filename)}", time.localtime(os.path.getmtime(path))[:6]); info.compress_type = zipfile.ZIP_STORED
+                with open(path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as member:
+                    for block in iter(lambda: source.read(1024 * 1024), b''): member.write(block); yield stream.drain()
+        yield stream.drain()
+    g.db_streaming = True
+    return Response(stream_with_context(generate()), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="garderie_{year}.zip"'})
+
+# --- Import en lot (historique, relevés bancaires) : CSV ou NDJSON ---
+IMPORT_BATCH_SIZE = 5000  # lignes par executemany
+IMPORT_MAX_REPORTED = 1000  # lignes en erreur / en double détaillées dans la réponse (les compteurs restent exacts)
+# Colonnes CSV / clés NDJSON acceptées en plus des clés des formulaires : noms des colonnes de la base et des exports
+IMPORT_ALIASES = {'first_name': 'firstName', 'last_name': 'lastName', 'parent_id': 'parentId', 'emergency_contact': 'emergencyContact',
+                  'related_child_id': 'relatedChildId', 'related_parent_id': 'relatedParentId', 'bc_month': 'bcMonth'}
+# Par table : (validation, clé naturelle des doublons, colonne qui borne la recherche des lignes déjà en base)
+IMPORTS = {
+    'income': (income_values, ('date', 'source', 'amount', 'description'), 'date'),
+    'expenses': (expense_values, ('date', 'amount', 'vendor'), 'date'),
+    'children': (child_values, ('first_name', 'last_name', 'dob'), 'last_name'),
+    'parents': (parent_values, ('name', 'email'), 'name'),
+}
+DECIMAL_COMMA = re.compile(r'^\d+,\d+$')  # 12,50 (exports bancaires en français)
+
+def import_records(stream, fmt):
+    """(numéro de ligne, enregistrement) pour chaque ligne d'un flux binaire : dict pour le CSV (séparateur ',', ';' ou tabulation,
+    détecté sur l'en-tête), texte JSON brut pour le NDJSON (décodé ligne par ligne par l'appelant pour isoler les erreurs)."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'ndjson':
+        yield from ((number, line) for number, line in enumerate(text, 1) if line.strip()); return
+    header = text.readline()
+    if not header.strip(): raise ValueError("En-tête CSV manquant")
+    reader = csv.DictReader(itertools.chain([header], text), delimiter=max((',', ';', '\t'), key=header.count))
+    for record in reader: yield reader.line_num, {key.strip(): value for key, value in record.items() if key}
+
+def normalize_import_record(record):
+    """Clés ramenées à celles des formulaires, champs vides -> None, virgule décimale des montants acceptée."""
+    if isinstance(record, str):
+        try: record = json.loads(record)
+        except json.JSONDecodeError as e: raise ValueError(f"JSON invalide : {e}") from None
+    if not isinstance(record, dict): raise ValueError("Objet JSON attendu")
+    data = {IMPORT_ALIASES.get(key, key): (value.strip() or None) if isinstance(value, str) else value for key, value in record.items()}
+    if isinstance(data.get('amount'), str) and DECIMAL_COMMA.match(data['amount']): data['amount'] = data['amount'].replace(',', '.')
+    return data
+
+def finish_bulk_load(db, table, after_id):
+    """Fait en une fois, pour les lignes d'id > after_id, le travail des triggers d'insertion suspendus par bulk_load
+    (agrégats mensuels, versions des rapports et de la table, index de recherche, journal des alertes), puis les réactive."""
+    new_rows = f"FROM {table} WHERE id > ?"
+    if table in ('income', 'expenses'):
+        kind, key, personal = ('income', 'source', '0') if table == 'income' else ('expense', 'category', 'is_personal')
+        db.execute(f"""INSERT INTO monthly_totals(month, kind, key, is_personal, total, entries)
+                       SELECT substr(date, 1, 7), '{kind}', {key}, {personal}, SUM(amount), COUNT(*) {new_rows} GROUP BY 1, 3, 4
+                       ON CONFLICT(month, kind, key, is_personal) DO UPDATE SET total = total + excluded.total, entries = entries + excluded.entries""", (after_id,))
+        db.execute(f"INSERT INTO report_versions(year, version) SELECT DISTINCT substr(date, 1, 4), 1 {new_rows} ON CONFLICT(year) DO UPDATE SET version = version + 1", (after_id,))
+    code, kind, title, body = SEARCH_SOURCES[table]
+    db.execute(f"INSERT INTO search_index(rowid, kind, entity_id, title, body) SELECT id * 8 + {code}, '{kind}', id, {title.format(r=table)}, {body.format(r=table)} {new_rows}", (after_id,))
+    for source_table, source, subject, _ in ALERT_SOURCES:
+        if source_table != table: continue
+        # Une seule séquence pour tout le lot
+        subject = subject.format(r=table)
+        db.execute(f"""INSERT INTO alert_changes(source, subject, seq) SELECT DISTINCT '{source}', {subject}, (SELECT COALESCE(MAX(seq), 0) + 1 FROM alert_changes) {new_rows} AND {subject} IS NOT NULL
+                       ON CONFLICT(source, subject) DO UPDATE SET seq = excluded.seq""", (after_id,))
+    db.execute("UPDATE table_versions SET version = version + 1 WHERE name = ?", (table,))
+    db.execute("DELETE FROM bulk_load")
+
+def run_import(db, table, records):
+    """Valide, écarte les doublons et insère les enregistrements par lots executemany, dans la transaction d'écriture de l'appelant.
+    Doublon : la n-ième occurrence d'une clé naturelle dans le fichier quand la base en contient déjà au moins n
+    (réimporter un relevé n'ajoute rien, deux achats identiques le même jour restent deux lignes)."""
+    validate, key_columns, scope = IMPORTS[table]
+    report = {"received": 0, "inserted": 0, "duplicates": 0, "errors": 0, "duplicate_lines": [], "error_details": []}
+    key_sql = ', '.join("CAST(amount AS REAL)" if column == 'amount' else f"COALESCE({column}, '')" for column in key_columns)
+    existing = {}; seen = {}; loaded_scopes = set()
+    def fail(line, message):
+        report['errors'] += 1
+        if len(report['error_details']) < IMPORT_MAX_REPORTED: report['error_details'].append({"line": line, "error": message})
+    def flush(batch):
+        # Occurrences déjà en base, lues une fois par valeur de `scope` et avant toute insertion de cette valeur
+        scopes = list({values[scope] for _, values in batch} - loaded_scopes); loaded_scopes.update(scopes)
+        for start in range(0, len(scopes), 500):
+            chunk = scopes[start:start + 500]
+            for row in db.execute(f"SELECT {key_sql}, COUNT(*) FROM {table} WHERE {scope} IN ({', '.join('?' * len(chunk))}) GROUP BY {key_sql}", chunk):
+                existing[tuple(row)[:-1]] = row[-1]
+        rows = []
+        for line, values in batch:
+            key = tuple('' if values[column] is None else values[column] for column in key_columns); seen[key] = seen.get(key, 0) + 1
+            if seen[key] <= existing.get(key, 0):
+                report['duplicates'] += 1
+                if len(report['duplicate_lines']) < IMPORT_MAX_REPORTED: report['duplicate_lines'].append(line)
+            else: rows.append((line, tuple(values.values())))
+        if not rows: return
+        insert = f"INSERT INTO {table}({', '.join(batch[0][1])}) VALUES({', '.join('?' * len(batch[0][1]))})"
+        db.execute("SAVEPOINT import_batch")
+        try: db.executemany(insert, [params for _, params in rows]); report['inserted'] += len(rows)
+        except sqlite3.IntegrityError:
+            # Clé étrangère inexistante, courriel déjà utilisé... : lot repris ligne par ligne pour isoler les fautives
+            db.execute("ROLLBACK TO import_batch")
+            for line, params in rows:
+                try: db.execute(insert, params); report['inserted'] += 1
+                except sqlite3.IntegrityError as e: fail(line, f"Donnée invalide : {e}")
+        db.execute("RELEASE import_batch")
+    after_id = db.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+    db.execute("INSERT INTO bulk_load(name) VALUES(?)", (table,))
+    batch = []
+    for line, record in records:
+        report['received'] += 1
+        try: batch.append((line, validate(normalize_import_record(record))))
+        except ValueError as e: fail(line, str(e))
+        if len(batch) >= IMPORT_BATCH_SIZE: flush(batch); batch = []
+    if batch: flush(batch)
+    finish_bulk_load(db, table, after_id)
+    return report
+
+@app.route('/api/import/<kind>', methods=['POST'])
+def import_rows(kind):
+    """Import en lot de revenus, dépenses, enfants ou parents : corps CSV (text/csv) ou NDJSON (application/x-ndjson),
+    ou fichier envoyé dans le champ 'file'. ?format=csv|ndjson force le format, ?dry_run=1 valide sans rien enregistrer."""
+    if kind not in IMPORTS: return jsonify({"error": "Import inconnu (income, expenses, children ou parents)"}), 404
+    upload = request.files.get('file'); name = (upload.filename or '').lower() if upload else ''
+    fmt = request.args.get('format') or ('ndjson' if 'json' in (upload.mimetype if upload else request.mimetype) or name.endswith(('.ndjson', '.jsonl')) else 'csv')
+    if fmt not in ('csv', 'ndjson'): return jsonify({"error": "Format inconnu (csv ou ndjson)"}), 400
+    dry_run = request.args.get('dry_run') in ('1', 'true'); db = None; started = time.perf_counter()
+    if upload: source = upload.stream; source.seek(0)
+    else:
+        # Corps recopié sur disque avant d'ouvrir la transaction : un client lent ne garde pas le verrou d'écriture.
+        # Même plafond que les fichiers téléversés (MAX_UPLOAD_MB), vérifié à chaque bloc par HashingSpool
+        limit = app.config['MAX_UPLOAD_MB'] * 1024 * 1024
+        if (request.content_length or 0) > limit: raise RequestEntityTooLarge(f"Fichier trop volumineux (maximum {app.config['MAX_UPLOAD_MB']} Mo)")
+        source = HashingSpool(os.path.join(app.config['UPLOAD_FOLDER'], 'tmp'), limit); shutil.copyfileobj(request.stream, source, 1024 * 1024); source.seek(0)
+    try:
+        db = get_db(); db.execute("BEGIN IMMEDIATE")
+        report = run_import(db, kind, import_records(source, fmt))
+        if dry_run: db.rollback()
+        else: db.commit()
+        return jsonify({"table": kind, "format": fmt, "dry_run": dry_run, **report, "elapsed_ms": round((time.perf_counter() - started) * 1000)}), 200
+    except (ValueError, csv.Error) as e:
+        if db: db.rollback()
+        return jsonify({"error": f"Fichier illisible : {e}"}), 400
+    except Exception as e:
+        if db: db.rollback()
+        print(f"Erreur import {kind} : {e}"); return jsonify({"error": "Erreur serveur lors de l'import"}), 500
+    finally: source.close()
 
 # --- Route pour servir les fichiers téléversés ---
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({"error": e.description}), 413
+
+# ab/cd/<sha256>.ext (et sa miniature thumbs/ab/cd/<sha256>.webp) : l'empreinte sert d'ETag fort sans lecture de la base
+CONTENT_ADDRESSED_PATH = re.compile(r'^(?:thumbs/)?[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.[\w]+)?$')
+
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
     try:
-        safe_filename = secure_filename(filename)
-        return send_from_directory(app.config['UPLOAD_FOLDER'], safe_filename, as_attachment=False)
-    except FileNotFoundError: print(f"Fichier non trouvé : {filename}"); return jsonify({"error": "Fichier non trouvé"}), 404
+        if filename.startswith('tmp/'): return jsonify({"error": "Fichier non trouvé"}), 404
+        match = CONTENT_ADDRESSED_PATH.match(filename)
+        if match: etag = match.group(1); max_age = app.config['UPLOADS_MAX_AGE']
+        else:
+            # Ancien fichier du dossier plat : empreinte enregistrée par la migration 6, revalidé à chaque ouverture
+            row = get_db().execute("SELECT sha256 FROM blobs WHERE path = ?", (filename,)).fetchone()
+            etag = row['sha256'] if row and row['sha256'] else True; max_age = 0
+        if app.config['UPLOADS_X_ACCEL_PREFIX'] and isinstance(etag, str):
+            # nginx lit le fichier et gère lui-même Range ; on ne répond qu'aux revalidations
+            if request.if_none_match.contains(etag): response = Response(status=304)
+            else:
+                if not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], filename)): raise NotFound()
+                response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+                tenant = f"{current_tenant()}/{TENANT_PATHS['UPLOAD_FOLDER']}/" if app.config['TENANTS_FOLDER'] else ''
+                response.headers['X-Accel-Redirect'] = app.config['UPLOADS_X_ACCEL_PREFIX'].rstrip('/') + '/' + tenant + filename
+            response.set_etag(etag); response.cache_control.public = True; response.cache_control.max_age = max_age
+            if max_age: response.cache_control.immutable = True
+            return response
+        # send_file : If-None-Match (304), Range (206), X-Sendfile si activé, sinon sendfile via wsgi.file_wrapper ;
+        # send_from_directory refuse toute sortie du dossier
+        response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=False, etag=etag, max_age=max_age, conditional=True)
+        response.cache_control.public = True
+        if max_age: response.cache_control.immutable = True
+        else: response.cache_control.no_cache = True
+        return response
+    except (FileNotFoundError, NotFound): print(f"Fichier non trouvé : {filename}"); return jsonify({"error": "Fichier non trouvé"}), 404
     except Exception as e: print(f"Erreur service fichier {filename}: {e}"); return jsonify({"error": "Erreur lors de la récupération du fichier"}), 500
 
+# --- Sauvegardes : instantanés en ligne de la base, copie incrémentale des téléversements ---
+# backups/snapshots/<AAAAMMJJ-HHMMSS>/ : daycare.db + manifest.json ; backups/files/ab/cd/<sha256>.ext : magasin partagé,
+# chaque contenu n'y est copié qu'une fois, quel que soit le nombre d'instantanés qui le référencent.
+SNAPSHOT_NAME_FORMAT = '%Y%m%d-%H%M%S'
+BACKUP_LOCK_STALE_SECONDS = 6 * 3600
+_backup_scheduler = None
+_backup_scheduler_lock = threading.Lock()
+
+def backup_database(target_path, pages=None, sleep=None):
+    """Copie en ligne de la base vers `target_path` avec l'API de sauvegarde de SQLite, par étapes de `pages` pages.
+    Une transaction de lecture reste ouverte sur la source pendant toute la copie : en mode WAL les écritures des autres
+    connexions continuent (elles ne sont jamais bloquées) et ne font pas recommencer la copie ; l'instantané est celui du début."""
+    source = _connect(); target = sqlite3.connect(target_path)
+    try:
+        source.execute("BEGIN"); source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages or app.config['BACKUP_PAGES_PER_STEP'], sleep=app.config['BACKUP_STEP_SLEEP'] if sleep is None else sleep)
+        # Fichier autonome (sans -wal) dans l'instantané
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally: source.close(); target.close()
+
+def backup_store_path(sha256, path):
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{os.path.splitext(path)[1].lower()}"
+
+def copy_verified(source, target, sha256):
+    """Copie `source` vers `target` (via un .part renommé) en vérifiant l'empreinte ; ValueError si le contenu ne correspond pas."""
+    os.makedirs(os.path.dirname(target), exist_ok=True); digest = hashlib.sha256(); partial = target + '.part'
+    with open(source, 'rb') as reader, open(partial, 'wb') as writer:
+        for block in iter(lambda: reader.read(1024 * 1024), b''): digest.update(block); writer.write(block)
+    if digest.hexdigest() != sha256: os.remove(partial); raise ValueError(f"empreinte inattendue pour {source}")
+    os.replace(partial, target)
+
+def list_snapshots():
+    """Noms des instantanés complets, du plus ancien au plus récent."""
+    directory = os.path.join(app.config['BACKUP_FOLDER'], 'snapshots')
+    if not os.path.isdir(directory): return []
+    return sorted(name for name in os.listdir(directory) if os.path.isfile(os.path.join(directory, name, 'manifest.json')))
+
+def _acquire_backup_lock():
+    """Verrou inter-processus (création atomique d'un dossier) : un seul instantané à la fois, tous workers confondus."""
+    lock = os.path.join(app.config['BACKUP_FOLDER'], '.lock'); os.makedirs(app.config['BACKUP_FOLDER'], exist_ok=True)
+    try: os.mkdir(lock); return lock
+    except FileExistsError:
+        if time.time() - os.path.getmtime(lock) < BACKUP_LOCK_STALE_SECONDS: return None
+        print(f"Verrou de sauvegarde abandonné supprimé : {lock}"); os.rmdir(lock)
+        return _acquire_backup_lock()
+
+def create_snapshot():
+    """Instantané : base copiée en ligne, puis chaque fichier référencé par la copie (table blobs) ajouté au magasin
+    s'il n'y est pas déjà. Renvoie le manifeste, ou None si un autre processus fait déjà une sauvegarde."""
+    lock = _acquire_backup_lock()
+    if lock is None: return None
+    try:
+        root = app.config['BACKUP_FOLDER']; name = datetime.datetime.now().strftime(SNAPSHOT_NAME_FORMAT)
+        directory = os.path.join(root, 'snapshots', name); partial = directory + '.partial'
+        os.makedirs(partial); started = time.perf_counter()
+        backup_database(os.path.join(partial, 'daycare.db')); database_seconds = time.perf_counter() - started
+        with closing(sqlite3.connect(os.path.join(partial, 'daycare.db'))) as snapshot:
+            blobs = snapshot.execute("SELECT path, sha256 FROM blobs WHERE refcount > 0 AND sha256 IS NOT NULL").fetchall()
+            # Archives des années clôturées : jamais modifiées, copiées dans le magasin comme les reçus (une fois par contenu)
+            archives = snapshot.execute("SELECT filename, sha256 FROM archives").fetchall() if snapshot.execute("SELECT 1 FROM sqlite_master WHERE name = 'archives'").fetchone() else []
+        files = {}; stored_archives = {}; copied = copied_bytes = 0
+        for folder, entries, rows in (('UPLOAD_FOLDER', files, blobs), ('ARCHIVE_FOLDER', stored_archives, archives)):
+            for path, sha256 in rows:
+                stored = backup_store_path(sha256, path); target = os.path.join(root, 'files', stored)
+                if not os.path.exists(target):
+                    try: copy_verified(os.path.join(app.config[folder], path), target, sha256); copied += 1; copied_bytes += os.path.getsize(target)
+                    except (OSError, ValueError) as e: print(f"Erreur sauvegarde du fichier {path} : {e}"); continue
+                entries[path] = stored
+        manifest = {"name": name, "created": datetime.datetime.now().isoformat(timespec='seconds'), "database_bytes": os.path.getsize(os.path.join(partial, 'daycare.db')),
+                    "database_seconds": round(database_seconds, 2), "files": files, "archives": stored_archives, "files_copied": copied, "bytes_copied": copied_bytes,
+                    "seconds": round(time.perf_counter() - started, 2)}
+        with open(os.path.join(partial, 'manifest.json'), 'w', encoding='utf-8') as output: json.dump(manifest, output, ensure_ascii=False, indent=1)
+        os.rename(partial, directory)
+        prune_snapshots()
+        print(f"Sauvegarde {name} : base de {manifest['database_bytes'] // (1024 * 1024)} Mo en {database_seconds:.1f} s, {copied} nouveau(x) fichier(s) sur {len(files) + len(stored_archives)}")
+        return manifest
+    finally: os.rmdir(lock)
+
+def prune_snapshots():
+    """Rétention : garde les BACKUP_KEEP instantanés les plus récents, supprime les instantanés interrompus
+    et les fichiers du magasin qui ne sont plus référencés (appelé sous le verrou de sauvegarde)."""
+    root = app.config['BACKUP_FOLDER']; keep = list_snapshots()[-app.config['BACKUP_KEEP']:]
+    for name in os.listdir(os.path.join(root, 'snapshots')):
+        if name not in keep: shutil.rmtree(os.path.join(root, 'snapshots', name), ignore_errors=True)
+    referenced = set()
+    for name in keep:
+        with open(os.path.join(root, 'snapshots', name, 'manifest.json'), encoding='utf-8') as manifest: manifest = json.load(manifest)
+        referenced.update(manifest['files'].values()); referenced.update(manifest.get('archives', {}).values())
+    store = os.path.join(root, 'files')
+    for directory, _, filenames in os.walk(store):
+        for filename in filenames:
+            if os.path.relpath(os.path.join(directory, filename), store).replace(os.sep, '/') not in referenced: os.remove(os.path.join(directory, filename))
+
+def _snapshot_if_due():
+    snapshots = list_snapshots()
+    latest = datetime.datetime.strptime(snapshots[-1], SNAPSHOT_NAME_FORMAT) if snapshots else None
+    if latest is None or (datetime.datetime.now() - latest).total_seconds() >= app.config['BACKUP_INTERVAL_HOURS'] * 3600: create_snapshot()
+
+def _backup_loop():
+    while True:
+        time.sleep(60)
+        run_for_each_tenant(_snapshot_if_due, "sauvegarde planifiée")
+
+def start_backup_scheduler():
+    """Démarre (une fois par processus) le fil des sauvegardes planifiées ; le verrou de sauvegarde évite les doublons entre workers."""
+    global _backup_scheduler
+    if not app.config['BACKUP_INTERVAL_HOURS']: return
+    with _backup_scheduler_lock:
+        if _backup_scheduler is None:
+            _backup_scheduler = threading.Thread(target=_backup_loop, name='sauvegardes', daemon=True); _backup_scheduler.start()
+
+@app.cli.command('backup')
+def backup_command():
+    """Fait un instantané maintenant (base en ligne + téléversements nouveaux) et applique la rétention."""
+    if create_snapshot() is None: print("Une sauvegarde est déjà en cours.")
+
+@app.cli.command('restore-backup')
+@click.argument('snapshot', required=False)
+@click.option('--yes', is_flag=True, help="Ne pas demander de confirmation.")
+def restore_backup_command(snapshot, yes):
+    """Restaure un instantané (nom, ou le plus récent) : vérifie la copie (PRAGMA integrity_check), remet les fichiers manquants,
+    recopie la base en place puis la revérifie. Les compteurs de version sont avancés pour invalider les ETag déjà servis."""
+    snapshots = list_snapshots()
+    if not snapshots: raise click.ClickException(f"Aucun instantané dans {app.config['BACKUP_FOLDER']}")
+    if snapshot in (None, 'latest'): snapshot = snapshots[-1]
+    if snapshot not in snapshots: raise click.ClickException(f"Instantané inconnu : {snapshot} (disponibles : {', '.join(snapshots)})")
+    directory = os.path.join(app.config['BACKUP_FOLDER'], 'snapshots', snapshot)
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as manifest: manifest = json.load(manifest)
+    with closing(sqlite3.connect(f"file:{os.path.abspath(os.path.join(directory, 'daycare.db'))}?mode=ro", uri=True)) as source:
+        check = [row[0] for row in source.execute("PRAGMA integrity_check")]
+        if check != ['ok']: raise click.ClickException(f"Instantané {snapshot} corrompu : {'; '.join(check[:10])}")
+        if not yes: click.confirm(f"Remplacer {app.config['DATABASE']} par l'instantané {snapshot} du {manifest['created']} ?", abort=True)
+        restored = 0
+        for folder, entries in (('UPLOAD_FOLDER', manifest['files']), ('ARCHIVE_FOLDER', manifest.get('archives', {}))):
+            for path, stored in entries.items():
+                if os.path.exists(os.path.join(app.config[folder], path)): continue
+                copy_verified(os.path.join(app.config['BACKUP_FOLDER'], 'files', stored), os.path.join(app.config[folder], path), os.path.basename(stored).split('.')[0])
+                restored += 1
+        # Versions déjà servies par la base actuelle : les compteurs restaurés sont décalés au-delà pour que ni les ETag
+        # ni les caches (paramètres, rapports) ne confondent l'ancien contenu avec le nouveau
+        db = get_db(); offset = 1 + db.execute("SELECT MAX(COALESCE((SELECT MAX(version) FROM table_versions), 0), COALESCE((SELECT MAX(version) FROM report_versions), 0))").fetchone()[0]
+        source.backup(db)
+    init_db()
+    db.execute("UPDATE table_versions SET version = version + ?", (offset,)); db.execute("UPDATE report_versions SET version = version + ?", (offset,))
+    # Miniatures dont le fichier n'existe plus : régénérées par « flask build-thumbnails »
+    for path, thumbnail in db.execute("SELECT path, thumbnail FROM blobs WHERE thumbnail <> ''").fetchall():
+        if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], thumbnail)): db.execute("UPDATE blobs SET thumbnail = NULL WHERE path = ?", (path,))
+    db.commit(); _settings_cache.pop(app.config['DATABASE'], None)
+    check = [row[0] for row in db.execute("PRAGMA integrity_check")]
+    print(f"Instantané {snapshot} restauré ({restored} fichier(s) remis en place) ; integrity_check : {'; '.join(check[:10])}")
+    if check != ['ok']: sys.exit(1)
+
 # --- Exécution principale ---
+# --- Démarrage : fabrique d'application et serveur de production ---
+
+def create_app(config=None):
+    """Configure l'application (dictionnaire `config`, par-dessus les variables d'environnement GARDERIE_*),
+    crée le dossier des téléversements et applique les migrations. Pour un serveur WSGI externe :
+    gunicorn --preload "app:create_app()" (migrations faites une fois dans le processus maître, avant les workers)."""
+    app.config.update(config or {})
+    # Multi-centres : chaque base est mise à niveau à sa première connexion (get_db), pas toutes au démarrage
+    if app.config['TENANTS_FOLDER']: os.makedirs(app.config['TENANTS_FOLDER'], exist_ok=True); return app
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Les bases existantes sont mises à niveau sur place à chaque démarrage
+    with app.app_context(): init_db()
+    # Aucune connexion du processus maître ne doit passer aux workers
+    pool.clear()
+    return app
+
+def reset_worker_state():
+    """Après le fork d'un worker : métriques propres au processus, pools de connexions et de miniatures recréés,
+    fils des alertes et des sauvegardes planifiées (les fils du processus maître ne survivent pas au fork)."""
+    global metrics, pool, _thumbnail_pool, _backup_scheduler, _alert_scheduler
+    metrics = Metrics(); pool = ConnectionPool(); _thumbnail_pool = None; _backup_scheduler = None; _alert_scheduler = None
+    start_background_tasks()
+
+def start_background_tasks():
+    """Fils d'arrière-plan du processus serveur : évaluation des alertes et sauvegardes planifiées."""
+    start_alert_scheduler(); start_backup_scheduler()
+
+def serve(host='127.0.0.1', port=5000, workers=None, threads=4):
+    """Sert l'application avec gunicorn (Linux, macOS : `workers` processus de `threads` fils) ou, sous Windows ou sans
+    gunicorn, avec waitress (un seul processus de workers × threads fils). Les migrations sont appliquées avant le démarrage
+    des workers. Avec plusieurs workers, /metrics décrit le processus qui a répondu."""
+    create_app(); workers = workers or min(2 * (os.cpu_count() or 1) + 1, 8)
+    if os.name == 'posix':
+        try: from gunicorn.app.base import BaseApplication
+        except ImportError: BaseApplication = None
+        if BaseApplication is not None:
+            class GarderieServer(BaseApplication):
+                def load_config(self):
+                    for key, value in options.items(): self.cfg.set(key, value)
+                def load(self): return app
+            options = {'bind': f"{host}:{port}", 'workers': workers, 'threads': threads, 'worker_class': 'gthread',
+                       'preload_app': True, 'post_fork': lambda server, worker: reset_worker_state()}
+            print(f"Serveur gunicorn sur http://{host}:{port} : {workers} processus × {threads} fils")
+            GarderieServer().run(); return
+    try: from waitress import serve as waitress_serve
+    except ImportError: raise click.ClickException("Aucun serveur de production installé : pip install gunicorn (Linux, macOS) ou waitress (Windows)")
+    start_background_tasks()
+    print(f"Serveur waitress sur http://{host}:{port} : 1 processus × {workers * threads} fils")
+    waitress_serve(app, host=host, port=port, threads=workers * threads)
+
+@click.command('serve')
+@click.option('--host', default='127.0.0.1', show_default=True, help="Adresse d'écoute (0.0.0.0 pour le réseau local)")
+@click.option('--port', default=5000, show_default=True)
+@click.option('--workers', type=int, help="Processus gunicorn (défaut : 2 × cœurs + 1, au plus 8)")
+@click.option('--threads', default=4, show_default=True, help="Fils par processus")
+def serve_command(host, port, workers, threads):
+    """Lance l'application sous un serveur WSGI de production (gunicorn ou waitress)."""
+    serve(host, port, workers, threads)
+
+app.cli.add_command(serve_command)
+
 if __name__ == '__main__':
-    if not os.path.exists(app.config['DATABASE']): print("Fichier de base de données non trouvé, initialisation..."); init_db()
-    app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file
+    # python app.py serve [--workers N] [--threads N] : serveur de production ; python app.py : serveur de développement
+    if sys.argv[1:2] == ['serve']: serve_command(sys.argv[2:], prog_name='app.py serve')
+    else:
+        if not os.path.exists(app.config['DATABASE']): print("Fichier de base de données non trouvé, initialisation...")
+        create_app()
+        # Le rechargeur de Werkzeug relance le module dans un processus enfant, le seul qui sert les requêtes :
+        # les fils d'arrière-plan n'y démarrent qu'une fois (sinon deux évaluations d'alertes et deux sauvegardes concurrentes)
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true': start_background_tasks()
+        app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file
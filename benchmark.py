@@ -0,0 +1,709 @@
+# benchmark.py (Bancs d'essai de l'application Garderie)
+#
+# Chaque banc travaille sur une base synthétique dans un dossier temporaire : daycare.db n'est jamais touchée.
+# Usage : python benchmark.py export [--rows 1000000]
+#         python benchmark.py uploads [--size-mb 50] [--repeat 20]
+#         python benchmark.py generate --output donnees.db [--seed 42] [--children 500] [--years 10] [--income-rows 500000] ...
+#         python benchmark.py routes [--database donnees.db] [--requests 50] [--output run.json]
+#         python benchmark.py compare avant.json apres.json [--threshold 10]
+#         python benchmark.py metrics [--requests 200]
+#         python benchmark.py import [--rows 100000]
+#         python benchmark.py backup [--size-gb 2]
+#         python benchmark.py alerts [--changes 20]
+#         python benchmark.py stats [--children 500] [--years 10]
+#         python benchmark.py archive [--years 10] [--repeat 20]
+#         python benchmark.py server [--workers 1,2,4] [--threads 4] [--clients 16] [--duration 15]
+#         python benchmark.py tenants [--tenants 200] [--sample 10] [--clients 8] [--duration 15]
+
+import argparse
+import concurrent.futures
+import datetime
+import http.client
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import statistics
+import threading
+import sys
+import tempfile
+import time
+import urllib.parse
+
+import app as garderie
+
+def setup_database(directory):
+    """Pointe l'application vers une base vide dans `directory` et applique les migrations."""
+    garderie.app.config['DATABASE'] = os.path.join(directory, 'daycare.db')
+    garderie.app.config['UPLOAD_FOLDER'] = os.path.join(directory, 'uploads')
+    garderie.app.config['BACKUP_FOLDER'] = os.path.join(directory, 'backups')
+    garderie.app.config['ARCHIVE_FOLDER'] = os.path.join(directory, 'archives')
+    os.makedirs(garderie.app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with garderie.app.app_context(): garderie.init_db()
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus (Mo)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def insert_income_rows(count, seed=42, batch_size=10000):
+    """Insère `count` revenus synthétiques par lots (executemany) sur 10 ans."""
+    rng = random.Random(seed); start = datetime.date(2015, 1, 1)
+    sources = ['parent_contribution', 'govt_support', 'late_fees', 'other']
+    with garderie.app.app_context():
+        db = garderie.get_db()
+        for offset in range(0, count, batch_size):
+            rows = [((start + datetime.timedelta(days=rng.randrange(3650))).isoformat(), rng.choice(sources),
+                     round(rng.uniform(5, 500), 2), f"Paiement {offset + i}") for i in range(min(batch_size, count - offset))]
+            db.executemany("INSERT INTO income(date, source, amount, description) VALUES(?,?,?,?)", rows)
+        db.commit()
+
+def bench_export(args):
+    """Export CSV en flux de `--rows` revenus : débit et croissance du pic mémoire pendant l'export."""
+    started = time.perf_counter(); insert_income_rows(args.rows)
+    generation_s = time.perf_counter() - started
+    client = garderie.app.test_client(); rss_before = peak_rss_mb()
+    started = time.perf_counter(); size = 0; lines = 0
+    response = client.get('/api/export/income', buffered=False)
+    for chunk in response.response:
+        size += len(chunk); lines += chunk.count(b'\n')
+    response.close()
+    export_s = time.perf_counter() - started
+    return {"rows": args.rows, "generation_s": round(generation_s, 2), "export_s": round(export_s, 2),
+            "rows_per_s": round(args.rows / export_s), "csv_mb": round(size / 1e6, 1), "csv_lines": lines,
+            "peak_rss_before_export_mb": round(rss_before, 1), "peak_rss_after_export_mb": round(peak_rss_mb(), 1)}
+
+def _timed_get(client, url, repeat, headers=None):
+    """Lit `repeat` fois la réponse en entier ; renvoie (secondes par requête, octets reçus par requête, statut)."""
+    started = time.perf_counter(); size = 0
+    for _ in range(repeat):
+        response = client.get(url, headers=headers, buffered=False)
+        size = sum(len(chunk) for chunk in response.response); status = response.status_code; response.close()
+    return (time.perf_counter() - started) / repeat, size, status
+
+def bench_uploads(args):
+    """Service d'un gros fichier téléversé : téléchargement complet, plage de 1 Mo (Range), revalidation 304
+    et délégation au proxy (X-Accel-Redirect, seul le temps de l'application est mesuré)."""
+    client = garderie.app.test_client(); payload = os.urandom(args.size_mb * 1024 * 1024)
+    created = client.post('/api/documents', data={'type': 'benchmark', 'document': (io.BytesIO(payload), 'scan.pdf')}).get_json()
+    url = '/uploads/' + created['filepath']; etag = client.get(url, buffered=False).headers['ETag']
+    results = {"size_mb": args.size_mb, "repeat": args.repeat}
+    for name, headers in (('full', None), ('range_1mb', {'Range': 'bytes=0-1048575'}), ('revalidate_304', {'If-None-Match': etag})):
+        seconds, size, status = _timed_get(client, url, args.repeat, headers)
+        results[name] = {"status": status, "ms": round(seconds * 1000, 2), "bytes": size, "mb_per_s": round(size / seconds / 1e6, 1) if size else None}
+    garderie.app.config['UPLOADS_X_ACCEL_PREFIX'] = '/protected-uploads/'
+    seconds, size, status = _timed_get(client, url, args.repeat)
+    results['x_accel_redirect'] = {"status": status, "ms": round(seconds * 1000, 2), "bytes": size}
+    garderie.app.config['UPLOADS_X_ACCEL_PREFIX'] = None
+    return results
+
+# --- Jeu de données synthétique (reproductible : même graine, mêmes lignes) ---
+FIRST_NAMES = ['Léa', 'Noah', 'Emma', 'William', 'Alice', 'Thomas', 'Florence', 'Liam', 'Rosalie', 'Jacob', 'Zoé', 'Félix', 'Charlie', 'Éloïse', 'Arthur']
+LAST_NAMES = ['Tremblay', 'Gagnon', 'Roy', 'Côté', 'Bouchard', 'Gauthier', 'Morin', 'Lavoie', 'Fortin', 'Gagné', 'Ouellet', 'Pelletier', 'Bélanger', 'Lévesque']
+INCOME_SOURCES = ['parent_contribution', 'govt_support', 'late_fees', 'other']
+EXPENSE_CATEGORIES = ['food', 'toys', 'insurance', 'supplies', 'maintenance', 'utilities', 'rent', 'car', 'other']
+VENDORS = ['Metro', 'IGA', 'Maxi', 'Costco', 'Canadian Tire', 'Hydro-Québec', 'Desjardins Assurances', 'Bureau en Gros', 'Toys R Us']
+ATTENDANCE_WEIGHTS = {'present_full': 80, 'present_am': 6, 'present_pm': 4, 'absent_justified': 7, 'absent_unjustified': 3}
+
+def generate_dataset(args, batch_size=10000):
+    """Remplit la base configurée : parents, enfants, présences quotidiennes (jours ouvrables), revenus, dépenses et documents
+    sur `args.years` années se terminant l'an dernier. Les triggers (cumuls, index de recherche, compteurs) s'exécutent comme en production."""
+    rng = random.Random(args.seed); last_year = datetime.date.today().year - 1
+    start = datetime.date(last_year - args.years + 1, 1, 1); end = datetime.date(last_year, 12, 31); span = (end - start).days + 1
+    random_date = lambda: (start + datetime.timedelta(days=rng.randrange(span))).isoformat()
+    counts = {}; started = time.perf_counter()
+    with garderie.app.app_context():
+        db = garderie.get_db()
+        parent_count = max(1, int(args.children * 0.7))
+        db.executemany("INSERT INTO parents(name, phone, email, address) VALUES(?,?,?,?)",
+                       [(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"514-555-{i % 10000:04d}", f"parent{i}@example.com", f"{i} rue Principale") for i in range(parent_count)])
+        children = [(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), random_date(), rng.randint(1, parent_count), rng.choice([None, 'arachides', 'lactose', 'gluten']),
+                     'active' if rng.random() < 0.8 else 'inactive') for _ in range(args.children)]
+        db.executemany("INSERT INTO children(first_name, last_name, dob, parent_id, allergies, status) VALUES(?,?,?,?,?,?)", children)
+        counts['parents'] = parent_count; counts['children'] = args.children
+        # Présences : chaque enfant actif, chaque jour ouvrable de la période
+        statuses = list(ATTENDANCE_WEIGHTS); weights = list(ATTENDANCE_WEIGHTS.values()); rows = []; counts['attendance'] = 0
+        active = [child_id for child_id, child in enumerate(children, start=1) if child[5] == 'active']
+        for offset in range(span):
+            day = start + datetime.timedelta(days=offset)
+            if day.weekday() >= 5: continue
+            rows.extend((day.isoformat(), child_id, status, None) for child_id, status in zip(active, rng.choices(statuses, weights, k=len(active))))
+            if len(rows) >= batch_size:
+                db.executemany("INSERT INTO attendance(date, child_id, status, notes) VALUES(?,?,?,?)", rows); counts['attendance'] += len(rows); rows = []
+        db.executemany("INSERT INTO attendance(date, child_id, status, notes) VALUES(?,?,?,?)", rows); counts['attendance'] += len(rows)
+        for offset in range(0, args.income_rows, batch_size):
+            rows = []
+            for _ in range(min(batch_size, args.income_rows - offset)):
+                child_id = rng.randint(1, args.children)
+                rows.append((random_date(), rng.choices(INCOME_SOURCES, [70, 20, 5, 5])[0], round(rng.uniform(10, 900), 2), child_id, children[child_id - 1][3], f"Paiement {children[child_id - 1][0]}"))
+            db.executemany("INSERT INTO income(date, source, amount, related_child_id, related_parent_id, description) VALUES(?,?,?,?,?,?)", rows)
+        for offset in range(0, args.expense_rows, batch_size):
+            rows = [(random_date(), rng.choice(EXPENSE_CATEGORIES), round(rng.uniform(5, 600), 2), rng.choice(VENDORS), f"Achat {offset + i}", int(rng.random() < 0.1))
+                    for i in range(min(batch_size, args.expense_rows - offset))]
+            db.executemany("INSERT INTO expenses(date, category, amount, vendor, description, is_personal) VALUES(?,?,?,?,?,?)", rows)
+        db.executemany("INSERT INTO documents(type, description, upload_date, filename, filepath) VALUES(?,?,?,?,?)",
+                       [(rng.choice(['contrat', 'assurance', 'facture', 'permis']), f"Document {i}", random_date(), f"doc_{i}.pdf", f"doc_{i}.pdf") for i in range(args.documents)])
+        counts.update(income=args.income_rows, expenses=args.expense_rows, documents=args.documents)
+        db.commit(); db.execute("PRAGMA optimize")
+    counts['generation_s'] = round(time.perf_counter() - started, 1)
+    return counts
+
+def bench_generate(args):
+    """Génère le jeu de données et copie la base obtenue vers `--output` (réutilisable par `routes --database`)."""
+    counts = generate_dataset(args)
+    with garderie.app.app_context(): garderie.get_db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    shutil.copy(garderie.app.config['DATABASE'], args.output)
+    return {**counts, "output": args.output, "size_mb": round(os.path.getsize(args.output) / 1e6, 1)}
+
+# --- Banc de toutes les routes (client de test Flask) ---
+CENTRES_SUMMARY_TENANTS = 10  # centres (vides) lus par le cas GET /api/centres/summary
+CENTRES_SUMMARY_TOKEN = 'banc-essai'
+
+def _uploaded_file(client):
+    """Image téléversée une fois pour les cas /uploads/ : (chemin du fichier, URL de sa miniature), miniature attendue au plus 30 s."""
+    if garderie.Image is None: content, name = b'%PDF-1.4 ' + b'banc' * 250_000, 'banc_fichier.pdf'
+    else: output = io.BytesIO(); garderie.Image.new('RGB', (1600, 1200), 'navy').save(output, 'JPEG', quality=90); content, name = output.getvalue(), 'banc_fichier.jpg'
+    document = client.post('/api/documents', data={'type': 'banc', 'document': (io.BytesIO(content), name)}).get_json()
+    for _ in range(300):
+        if document['thumbnail_url'] or garderie.Image is None: break
+        time.sleep(0.1); document = client.get(f"/api/documents/{document['id']}").get_json()
+    return document['filepath'], document['thumbnail_url']
+
+def _centres_summary(client, directory):
+    """Rapport consolidé : le mode multi-centres n'est activé que le temps de l'appel, sur CENTRES_SUMMARY_TENANTS centres créés au premier appel."""
+    config = garderie.app.config; root = os.path.join(directory, 'centres')
+    saved = {key: dict.get(config, key) for key in ('TENANTS_FOLDER', 'CENTRES_SUMMARY_TOKEN')}
+    config.update(TENANTS_FOLDER=root, CENTRES_SUMMARY_TOKEN=CENTRES_SUMMARY_TOKEN)
+    try:
+        if not os.path.isdir(root):
+            for index in range(CENTRES_SUMMARY_TENANTS):
+                with garderie.tenant_context(f"centre{index:02d}"), garderie.app.app_context(): os.makedirs(config['UPLOAD_FOLDER']); garderie.init_db()
+        return client.get('/api/centres/summary', headers={'Authorization': f'Bearer {CENTRES_SUMMARY_TOKEN}'})
+    finally: config.update(saved)
+
+def route_cases(year):
+    """(nom, fonction(client, i) -> réponse, écriture) pour chaque route de l'API ; les écritures créent, modifient puis suppriment
+    leurs propres lignes (sauf l'import réel, dont les 100 lignes par appel restent)."""
+    created = {'children': [], 'parents': [], 'income': [], 'expenses': [], 'documents': []}; etags = {}; uploaded = []
+    directory = os.path.dirname(garderie.app.config['DATABASE'])
+    def create(kind, response):
+        created[kind].append(response.get_json()['id']); return response
+    def revalidate(client, url):
+        # ETag relevé au premier appel (absorbé par l'échauffement) : seule la revalidation est mesurée ensuite
+        if url not in etags: etags[url] = client.get(url).headers['ETag']
+        return client.get(url, headers={'If-None-Match': etags[url]})
+    def upload(client, index):
+        if not uploaded: uploaded.extend(_uploaded_file(client))
+        return uploaded[index]
+    def import_csv(i, rows):
+        return "date,source,amount,description\n" + ''.join(f"{day.format(row % 28 + 1)},other,{i + row / 100:.2f},Banc import {i}-{row}\n" for row in range(rows))
+    day = f"{year}-06-{{:02d}}"
+    cases = [
+        ('GET /', lambda c, i: c.get('/')),
+        ('GET /api/bootstrap', lambda c, i: c.get('/api/bootstrap')),
+        ('GET /api/dashboard/summary', lambda c, i: c.get('/api/dashboard/summary')),
+        ('GET /api/dashboard/summary?from=year', lambda c, i: c.get(f'/api/dashboard/summary?from={year}')),
+        ('GET /api/children', lambda c, i: c.get('/api/children')),
+        ('GET /api/children (304)', lambda c, i: revalidate(c, '/api/children')),
+        ('GET /api/bootstrap (304)', lambda c, i: revalidate(c, '/api/bootstrap')),
+        ('GET /api/children/<id>', lambda c, i: c.get(f'/api/children/{i % 100 + 1}')),
+        ('GET /api/parents', lambda c, i: c.get('/api/parents')),
+        ('GET /api/parents/<id>', lambda c, i: c.get(f'/api/parents/{i % 100 + 1}')),
+        ('GET /api/income?limit=200', lambda c, i: c.get('/api/income?limit=200')),
+        ('GET /api/income?from&to (month)', lambda c, i: c.get(f'/api/income?from={year}-03-01&to={year}-03-31')),
+        ('GET /api/income/<id>', lambda c, i: c.get(f'/api/income/{i * 97 + 1}')),
+        ('GET /api/expenses?limit=200', lambda c, i: c.get('/api/expenses?limit=200')),
+        ('GET /api/expenses?category (year)', lambda c, i: c.get(f'/api/expenses?from={year}-01-01&to={year}-12-31&category=food&limit=200')),
+        ('GET /api/attendance?date', lambda c, i: c.get(f'/api/attendance?date={year}-03-{i % 28 + 1:02d}')),
+        ('GET /api/attendance?from&to (month)', lambda c, i: c.get(f'/api/attendance?from={year}-03-01&to={year}-03-31')),
+        ('GET /api/documents', lambda c, i: c.get('/api/documents')),
+        ('GET /api/settings', lambda c, i: c.get('/api/settings')),
+        ('GET /api/alerts', lambda c, i: c.get('/api/alerts')),
+        ('GET /api/alerts (304)', lambda c, i: revalidate(c, '/api/alerts')),
+        ('GET /api/search', lambda c, i: c.get(f'/api/search?q={LAST_NAMES[i % len(LAST_NAMES)][:4]}')),
+        ('GET /api/reports/<year>/taxes', lambda c, i: c.get(f'/api/reports/{year - i % 3}/taxes')),
+        ('GET /api/reports/<year>/receipts', lambda c, i: c.get(f'/api/reports/{year}/receipts')),
+        ('GET /api/export/income (month)', lambda c, i: c.get(f'/api/export/income?from={year}-03-01&to={year}-03-31')),
+        ('GET /api/export/fiscal-year/<year>', lambda c, i: c.get(f'/api/export/fiscal-year/{year}')),
+        ('GET /api/expenses/<id>', lambda c, i: c.get(f'/api/expenses/{i * 97 + 1}')),
+        ('GET /api/documents/<id>', lambda c, i: c.get(f'/api/documents/{i % 100 + 1}')),
+        ('GET /api/stats/children?year', lambda c, i: c.get(f'/api/stats/children?year={year - i % 2}')),
+        ('GET /api/stats/children (304)', lambda c, i: revalidate(c, f'/api/stats/children?year={year}')),
+        ('GET /api/centres/summary', lambda c, i: _centres_summary(c, directory)),
+        ('GET /metrics', lambda c, i: c.get('/metrics')),
+        ('GET /uploads/<file>', lambda c, i: c.get(f'/uploads/{upload(c, 0)}')),
+        ('GET /uploads/<file> (304)', lambda c, i: c.get(f'/uploads/{upload(c, 0)}', headers={'If-None-Match': f'"{os.path.basename(upload(c, 0)).split(".")[0]}"'})),
+        ('GET /uploads/<file> (Range)', lambda c, i: c.get(f'/uploads/{upload(c, 0)}', headers={'Range': 'bytes=0-65535'})),
+        ('GET /uploads/thumbs/<file>', lambda c, i: c.get(upload(c, 1) or f'/uploads/{upload(c, 0)}')),
+        ('POST /api/children', lambda c, i: create('children', c.post('/api/children', json={'firstName': 'Banc', 'lastName': f'Essai {i}'}))),
+        ('PUT /api/children/<id>', lambda c, i: c.put(f"/api/children/{created['children'][i]}", json={'firstName': 'Banc', 'lastName': f'Modifié {i}'})),
+        ('PUT /api/children/<id>/status', lambda c, i: c.put(f"/api/children/{created['children'][i]}/status", json={'status': 'inactive'})),
+        ('POST /api/parents', lambda c, i: create('parents', c.post('/api/parents', json={'name': f'Banc Parent {i}', 'email': f'banc{i}@example.com'}))),
+        ('PUT /api/parents/<id>', lambda c, i: c.put(f"/api/parents/{created['parents'][i]}", json={'name': f'Banc Modifié {i}', 'email': f'banc{i}@example.com'})),
+        ('DELETE /api/parents/<id>', lambda c, i: c.delete(f"/api/parents/{created['parents'][i]}")),
+        ('POST /api/income', lambda c, i: create('income', c.post('/api/income', json={'date': day.format(i % 28 + 1), 'source': 'other', 'amount': 10 + i}))),
+        ('PUT /api/income/<id>', lambda c, i: c.put(f"/api/income/{created['income'][i]}", json={'date': day.format(i % 28 + 1), 'source': 'other', 'amount': 20 + i})),
+        ('DELETE /api/income/<id>', lambda c, i: c.delete(f"/api/income/{created['income'][i]}")),
+        ('POST /api/expenses', lambda c, i: create('expenses', c.post('/api/expenses', data={'date': day.format(i % 28 + 1), 'category': 'food', 'amount': '12.5'}))),
+        ('PUT /api/expenses/<id>', lambda c, i: c.put(f"/api/expenses/{created['expenses'][i]}", json={'date': day.format(i % 28 + 1), 'category': 'toys', 'amount': 15 + i})),
+        ('DELETE /api/expenses/<id>', lambda c, i: c.delete(f"/api/expenses/{created['expenses'][i]}")),
+        ('POST /api/documents (upload)', lambda c, i: create('documents', c.post('/api/documents', data={'type': 'banc', 'document': (io.BytesIO(b'%PDF-1.4 ' + str(i).encode() * 1000), f'banc_{i}.pdf')}))),
+        ('PUT /api/documents/<id>', lambda c, i: c.put(f"/api/documents/{created['documents'][i]}", json={'type': 'banc', 'description': f'Modifié {i}'})),
+        ('DELETE /api/documents/<id>', lambda c, i: c.delete(f"/api/documents/{created['documents'][i]}")),
+        ('POST /api/attendance (day)', lambda c, i: c.post('/api/attendance', json={'date': day.format(i % 28 + 1), 'attendance': {str(child_id): {'status': 'present_full'} for child_id in range(1, 51)}})),
+        ('POST /api/attendance/bulk (month)', lambda c, i: c.post('/api/attendance/bulk', json={'records': [{'date': day.format(d), 'child_id': child_id, 'status': 'present_am' if i % 2 else 'present_pm'} for d in range(1, 29) for child_id in range(1, 21)]})),
+        ('POST /api/settings', lambda c, i: c.post('/api/settings', json={'daycare_name': f'Garderie {i}'})),
+        ('POST /api/import/income (1000 lignes, dry_run)', lambda c, i: c.post('/api/import/income?dry_run=1', data=import_csv(i, 1000), content_type='text/csv')),
+        ('POST /api/import/income (100 lignes)', lambda c, i: c.post('/api/import/income', data=import_csv(i, 100), content_type='text/csv')),
+        ('DELETE /api/children/<id>', lambda c, i: c.delete(f"/api/children/{created['children'][i]}")),
+    ]
+    return [(name, call, name.split()[0] != 'GET') for name, call in cases]
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def bench_routes(args):
+    """Appelle chaque route `--requests` fois (après `--warmup` appels) et mesure p50/p99, débit et mémoire."""
+    dataset = generate_dataset(args) if not args.database else {"database": args.database}
+    client = garderie.app.test_client(); year = datetime.date.today().year - 1; results = {}
+    for name, call, write in route_cases(year):
+        samples = []; statuses = {}; rss_before = peak_rss_mb()
+        for i in range(args.warmup + args.requests):
+            started = time.perf_counter(); response = call(client, i); response.get_data(); elapsed = time.perf_counter() - started
+            response.close(); statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if i >= args.warmup: samples.append(elapsed)
+        results[name] = {"write": write, "p50_ms": round(percentile(samples, 0.50) * 1000, 3), "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+                         "mean_ms": round(statistics.fmean(samples) * 1000, 3), "throughput_rps": round(len(samples) / sum(samples), 1),
+                         "statuses": statuses, "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1)}
+    return {"seed": args.seed, "requests": args.requests, "dataset": dataset, "peak_rss_mb": round(peak_rss_mb(), 1),
+            "python": sys.version.split()[0], "sqlite": garderie.sqlite3.sqlite_version, "routes": results}
+
+def compare_runs(args):
+    """Compare deux résultats de `routes` : écart de p50/p99 par route, régression au-delà de `--threshold` %."""
+    with open(args.before) as before_file, open(args.after) as after_file: before = json.load(before_file); after = json.load(after_file)
+    rows = []; regressions = []
+    for name, new in after['routes'].items():
+        old = before['routes'].get(name)
+        if old is None: rows.append(f"{name:<58} {'(nouvelle route)':>40}"); continue
+        changes = {metric: (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0 for metric in ('p50_ms', 'p99_ms')}
+        flag = ' RÉGRESSION' if any(change > args.threshold for change in changes.values()) else ''
+        if flag: regressions.append(name)
+        name = f"{name} [écriture]" if new.get('write') else name
+        rows.append(f"{name:<58} {old['p50_ms']:>9.2f} -> {new['p50_ms']:>9.2f} ({changes['p50_ms']:+6.1f} %)   p99 {old['p99_ms']:>9.2f} -> {new['p99_ms']:>9.2f} ({changes['p99_ms']:+6.1f} %){flag}")
+    print(f"{'route':<58} p50 (ms) avant -> après              p99 (ms) avant -> après"); print('\n'.join(rows))
+    print(f"Pic mémoire : {before['peak_rss_mb']} Mo -> {after['peak_rss_mb']} Mo")
+    return regressions
+
+def bench_metrics(args):
+    """Surcoût de l'instrumentation (METRICS_ENABLED) : routes de lecture appelées en alternance avec et sans métriques,
+    puis export CSV complet des revenus (chaque ligne lue passe par le curseur instrumenté)."""
+    dataset = generate_dataset(args); client = garderie.app.test_client(); year = datetime.date.today().year - 1
+    routes = {name: call for name, call in route_cases(year) if name.startswith('GET') and '304' not in name}
+    samples = {name: {True: [], False: []} for name in routes}
+    for i in range(args.requests):
+        for enabled in (True, False) if i % 2 else (False, True):
+            garderie.app.config['METRICS_ENABLED'] = enabled
+            for name, call in routes.items():
+                started = time.perf_counter(); response = call(client, i); response.get_data(); response.close()
+                samples[name][enabled].append(time.perf_counter() - started)
+    results = {}
+    for name, timings in samples.items():
+        on = statistics.median(timings[True]); off = statistics.median(timings[False])
+        results[name] = {"p50_off_ms": round(off * 1000, 3), "p50_on_ms": round(on * 1000, 3), "overhead_us": round((on - off) * 1e6, 1), "overhead_pct": round((on - off) / off * 100, 1)}
+    export = {}
+    for enabled in (False, True):
+        garderie.app.config['METRICS_ENABLED'] = enabled; started = time.perf_counter()
+        response = client.get('/api/export/income', buffered=False)
+        for _ in response.response: pass
+        response.close(); export['on' if enabled else 'off'] = round(time.perf_counter() - started, 3)
+    garderie.app.config['METRICS_ENABLED'] = True
+    overheads = [route['overhead_us'] for route in results.values()]
+    return {"dataset": dataset, "requests": args.requests, "median_overhead_us": round(statistics.median(overheads), 1),
+            "export_income_s": {**export, "rows": args.income_rows, "overhead_pct": round((export['on'] - export['off']) / export['off'] * 100, 1)},
+            "metrics_size_bytes": len(client.get('/metrics').data), "routes": results}
+
+def bench_import(args):
+    """Import d'un relevé bancaire CSV de `--rows` dépenses (séparateur ';', virgule décimale) dans une base déjà remplie,
+    puis réimport du même fichier (toutes les lignes sont des doublons), et comparaison avec un POST par ligne."""
+    dataset = generate_dataset(args); client = garderie.app.test_client(); rng = random.Random(args.seed); year = datetime.date.today().year
+    lines = ['date;amount;vendor;category;description']
+    for i in range(args.rows):
+        day = datetime.date(year, 1, 1) + datetime.timedelta(days=rng.randrange(365))
+        amount = f"{rng.randint(1, 30000) / 100:.2f}".replace('.', ',')
+        lines.append(f"{day.isoformat()};{amount};{rng.choice(VENDORS)};{rng.choice(EXPENSE_CATEGORIES)};Relevé {i}")
+    body = ('\n'.join(lines) + '\n').encode('utf-8'); results = {}
+    for run in ('import', 'reimport'):
+        started = time.perf_counter(); report = client.post('/api/import/expenses', data=body, content_type='text/csv').get_json()
+        results[run] = {"seconds": round(time.perf_counter() - started, 2), "rows_per_s": round(args.rows / (time.perf_counter() - started)),
+                        **{key: report[key] for key in ('inserted', 'duplicates', 'errors')}}
+    sample = min(args.rows, 2000); started = time.perf_counter()
+    for i in range(sample):
+        client.post('/api/expenses', data={'date': f"{year}-02-01", 'category': 'food', 'amount': '1.5', 'vendor': 'Banc'})
+    per_row = (time.perf_counter() - started) / sample
+    results['single_post'] = {"rows": sample, "rows_per_s": round(1 / per_row), "estimated_s_for_rows": round(per_row * args.rows, 1)}
+    return {"dataset": dataset, "rows": args.rows, "csv_mb": round(len(body) / 1e6, 1), "peak_rss_mb": round(peak_rss_mb(), 1), **results}
+
+def bench_backup(args):
+    """Sauvegarde en ligne d'une base de `--size-gb` Go (jeu de données + table de remplissage) pendant qu'un fil écrit et lit
+    en continu par l'API : latence de ces requêtes sans sauvegarde, pendant l'instantané par étapes, puis pendant une copie
+    en une seule étape (pages=-1) pour comparaison."""
+    dataset = generate_dataset(args); client = garderie.app.test_client(); year = datetime.date.today().year
+    with garderie.app.app_context():
+        db = garderie.get_db(); db.execute("CREATE TABLE bench_filler ( data BLOB )")
+        for _ in range(int(args.size_gb * 1024) // 256):
+            db.execute("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 256) INSERT INTO bench_filler SELECT randomblob(1024 * 1024) FROM n"); db.commit()
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    database_mb = os.path.getsize(garderie.app.config['DATABASE']) / (1024 * 1024)
+    def probe(samples, stop):
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            if i % 2: response = client.post('/api/income', json={'date': f"{year}-01-{i % 28 + 1:02d}", 'source': 'other', 'amount': 1})
+            else: response = client.get('/api/dashboard/summary')
+            samples.append((time.perf_counter() - started, response.status_code)); i += 1; time.sleep(0.005)
+    def measure(action):
+        samples = []; stop = threading.Event(); thread = threading.Thread(target=probe, args=(samples, stop)); thread.start()
+        started = time.perf_counter(); detail = action(); elapsed = time.perf_counter() - started
+        stop.set(); thread.join(); latencies = [latency for latency, _ in samples]
+        return {"seconds": round(elapsed, 2), "requests": len(samples), "errors": sum(1 for _, status in samples if status >= 400),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2), "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                "max_ms": round(max(latencies) * 1000, 2), **(detail or {})}
+    results = {"baseline": measure(lambda: time.sleep(5))}
+    snapshot = {}
+    results["snapshot_stepped"] = measure(lambda: snapshot.update(garderie.create_snapshot()) or {"pages_per_step": garderie.app.config['BACKUP_PAGES_PER_STEP']})
+    results["snapshot_stepped"]["mb_per_s"] = round(database_mb / snapshot['database_seconds'], 1)
+    single = os.path.join(os.path.dirname(garderie.app.config['DATABASE']), 'single_step.db')
+    results["single_step"] = measure(lambda: garderie.backup_database(single, pages=-1, sleep=0))
+    os.remove(single)
+    return {"dataset": dataset, "database_mb": round(database_mb), "cpus": os.cpu_count(), **results}
+
+def bench_alerts(args):
+    """Évaluation des alertes sur le jeu de données : première évaluation (tous les sujets), sans modification, après `--changes`
+    revenus ajoutés par l'API (seuls leurs enfants sont réévalués) et réévaluation complète ; puis coût de /api/alerts (200 et 304)."""
+    dataset = generate_dataset(args); client = garderie.app.test_client(); rng = random.Random(args.seed); results = {}
+    last_month = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+    with garderie.app.app_context():
+        db = garderie.get_db()
+        def evaluate(name, **kwargs):
+            started = time.perf_counter(); evaluated = garderie.evaluate_alerts(db, **kwargs)
+            results[name] = {"ms": round((time.perf_counter() - started) * 1000, 2), "subjects": sum(evaluated.values())}
+        evaluate('first'); evaluate('idle')
+        for _ in range(args.changes):
+            client.post('/api/income', json={'date': last_month.isoformat(), 'source': 'parent_contribution', 'amount': 10, 'relatedChildId': rng.randint(1, args.children)})
+        evaluate('incremental'); evaluate('full', full=True)
+    response = client.get('/api/alerts'); etag = response.headers['ETag']
+    for name, headers in (('get_alerts', None), ('get_alerts_304', {'If-None-Match': etag})):
+        seconds, size, status = _timed_get(client, '/api/alerts', args.repeat, headers)
+        results[name] = {"ms": round(seconds * 1000, 3), "bytes": size, "status": status}
+    return {"dataset": dataset, "alerts": len(response.get_json()), "changes": args.changes, **results}
+
+def bench_stats(args):
+    """/api/stats/children pour chaque année du jeu de données : calcul à froid (cache vidé) avec NumPy puis avec les boucles
+    Python de secours, réponse en cache et revalidation 304."""
+    dataset = generate_dataset(args); client = garderie.app.test_client(); last_year = datetime.date.today().year - 1
+    years = range(last_year - args.years + 1, last_year + 1); numpy_module = garderie.np; results = {}
+    for name, module in (('numpy', numpy_module), ('python', None)):
+        if name == 'numpy' and module is None: results[name] = "NumPy non installé"; continue
+        garderie.np = module; timings = []
+        try:
+            for year in years:
+                garderie._child_stats_cache.clear(); started = time.perf_counter()
+                client.get(f'/api/stats/children?year={year}').get_data(); timings.append(time.perf_counter() - started)
+        finally: garderie.np = numpy_module
+        results[name] = {"cold_ms_per_year": {str(year): round(seconds * 1000, 1) for year, seconds in zip(years, timings)},
+                         "cold_ms_max": round(max(timings) * 1000, 1), "cold_s_all_years": round(sum(timings), 2)}
+    url = f'/api/stats/children?year={last_year}'; response = client.get(url)
+    results['cached_ms'] = round(_timed_get(client, url, args.repeat)[0] * 1000, 2)
+    results['revalidate_304_ms'] = round(_timed_get(client, url, args.repeat, {'If-None-Match': response.headers['ETag']})[0] * 1000, 3)
+    return {"dataset": dataset, "children": len(response.get_json()['children']), "response_kb": round(len(response.get_data()) / 1024), **results}
+
+def bench_archive(args):
+    """Clôture de toutes les années du jeu de données sauf la dernière (flask close-year) : taille de la base active, durée et
+    taille d'un instantané, latence des routes courantes avant et après, puis requêtes qui lisent les archives (une année
+    clôturée, toute la période). Caches des rapports et statistiques vidés avant chaque requête : mesures à froid."""
+    dataset = generate_dataset(args); client = garderie.app.test_client(); last_year = datetime.date.today().year - 1
+    first_year = last_year - args.years + 1
+    hot = {'dashboard': '/api/dashboard/summary', 'income_page': '/api/income?limit=200', 'expenses_page': '/api/expenses?limit=200',
+           'income_open_month': f'/api/income?from={last_year}-03-01&to={last_year}-03-31&limit=200',
+           'attendance_open_month': f'/api/attendance?from={last_year}-03-01&to={last_year}-03-31',
+           'report_open_year': f'/api/reports/{last_year}/taxes', 'stats_open_year': f'/api/stats/children?year={last_year}'}
+    archived = {'income_closed_month': f'/api/income?from={first_year}-03-01&to={first_year}-03-31&limit=200',
+                'attendance_closed_month': f'/api/attendance?from={first_year}-03-01&to={first_year}-03-31',
+                'report_closed_year': f'/api/reports/{first_year}/taxes', 'stats_closed_year': f'/api/stats/children?year={first_year}',
+                'income_all_years': f'/api/income?from={first_year}-01-01&to={last_year}-12-31&limit=200',
+                'export_closed_year': f'/api/export/income?from={first_year}-01-01&to={first_year}-12-31'}
+    def measure(urls):
+        timings = {}
+        for name, url in urls.items():
+            samples = []
+            for _ in range(args.repeat):
+                garderie._report_cache.clear(); garderie._child_stats_cache.clear()
+                seconds, _, status = _timed_get(client, url, 1); samples.append(seconds)
+                if status != 200: raise RuntimeError(f"{url} : statut {status}")
+            timings[name] = {"p50_ms": round(percentile(samples, 0.50) * 1000, 2), "p99_ms": round(percentile(samples, 0.99) * 1000, 2)}
+        return timings
+    def state():
+        with garderie.app.app_context(): garderie.get_db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        snapshot = garderie.create_snapshot()
+        return {"database_mb": round(os.path.getsize(garderie.app.config['DATABASE']) / 1e6, 1), "snapshot_s": snapshot['seconds'],
+                "snapshot_database_mb": round(snapshot['database_bytes'] / 1e6, 1), "snapshot_copied_mb": round(snapshot['bytes_copied'] / 1e6, 1)}
+    before = {**state(), "routes": measure({**hot, **archived})}
+    started = time.perf_counter()
+    with garderie.app.app_context():
+        db = garderie.get_db()
+        for year in range(first_year, last_year): garderie.close_fiscal_year(db, year)
+        closed_s = time.perf_counter() - started; garderie.compact_database(db)
+    close = {"years": last_year - first_year, "seconds": round(closed_s, 1), "compact_s": round(time.perf_counter() - started - closed_s, 1),
+             "archives_mb": round(sum(os.path.getsize(os.path.join(garderie.app.config['ARCHIVE_FOLDER'], name)) for name in os.listdir(garderie.app.config['ARCHIVE_FOLDER'])) / 1e6, 1)}
+    after = {**state(), "routes": measure({**hot, **archived})}
+    # Instantané suivant : les archives sont déjà dans le magasin de sauvegarde, seule la base active est copiée
+    after_next = state(); after["next_snapshot_s"] = after_next["snapshot_s"]; after["next_snapshot_copied_mb"] = after_next["snapshot_copied_mb"]
+    return {"dataset": dataset, "close": close, "before": before, "after": after}
+
+def _load_client(port, duration, seed, write_ratio, year):
+    """Client de charge (processus séparé) : boucle de requêtes keep-alive, lectures et écritures mêlées, pendant `duration` s."""
+    rng = random.Random(seed); connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    reads = ['/api/dashboard/summary', '/api/children', '/api/income?limit=50', '/api/bootstrap', f'/api/attendance?date={year}-03-15',
+             f"/api/search?q={urllib.parse.quote(LAST_NAMES[seed % len(LAST_NAMES)][:4])}"]
+    latencies = []; statuses = {}; deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        day = f"{year}-06-{rng.randint(1, 28):02d}"
+        if rng.random() < write_ratio:
+            method, url, body = rng.choice([('POST', '/api/income', {'date': day, 'source': 'other', 'amount': rng.randint(10, 500)}),
+                                            ('POST', '/api/attendance', {'date': day, 'attendance': {str(rng.randint(1, 200)): {'status': 'present_full'} for _ in range(10)}})])
+        else: method, url, body = 'GET', rng.choice(reads), None
+        started = time.perf_counter()
+        try:
+            connection.request(method, url, body=json.dumps(body) if body else None, headers={'Content-Type': 'application/json'} if body else {})
+            response = connection.getresponse(); response.read(); status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close(); connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60); status = 'erreur'
+        latencies.append(time.perf_counter() - started); statuses[status] = statuses.get(status, 0) + 1
+    connection.close()
+    return latencies, statuses
+
+def bench_server(args):
+    """Démarre `python app.py serve` pour chaque nombre de workers et mesure débit, latence et erreurs (dont « database is locked »,
+    qui remonte en 500) sous une charge concurrente de lectures et d'écritures."""
+    dataset = generate_dataset(args)
+    with garderie.app.app_context(): garderie.get_db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    year = datetime.date.today().year - 1; results = {}
+    env = {**os.environ, 'GARDERIE_DATABASE': garderie.app.config['DATABASE'], 'GARDERIE_UPLOAD_FOLDER': garderie.app.config['UPLOAD_FOLDER']}
+    for workers in [int(value) for value in args.workers.split(',')]:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'), 'serve', '--port', str(args.port),
+                                   '--workers', str(workers), '--threads', str(args.threads)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                try:
+                    connection = http.client.HTTPConnection('127.0.0.1', args.port, timeout=5); connection.request('GET', '/api/settings')
+                    connection.getresponse().read(); connection.close(); break
+                except OSError: time.sleep(0.2)
+            else: raise RuntimeError(f"Le serveur ({workers} workers) n'a pas démarré")
+            with concurrent.futures.ProcessPoolExecutor(args.clients) as pool:
+                runs = list(pool.map(_load_client, [args.port] * args.clients, [args.duration] * args.clients, range(args.clients),
+                                     [args.write_ratio] * args.clients, [year] * args.clients))
+        finally:
+            server.terminate(); server.wait(30)
+        latencies = [latency for run, _ in runs for latency in run]; statuses = {}
+        for _, run_statuses in runs:
+            for status, count in run_statuses.items(): statuses[str(status)] = statuses.get(str(status), 0) + count
+        results[str(workers)] = {"throughput_rps": round(len(latencies) / args.duration, 1), "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                                 "p99_ms": round(percentile(latencies, 0.99) * 1000, 2), "statuses": statuses}
+    return {"dataset": dataset, "cpus": os.cpu_count(), "threads": args.threads, "clients": args.clients, "duration_s": args.duration,
+            "write_ratio": args.write_ratio, "workers": results}
+
+# --- Multi-centres : un processus pour tous les centres contre un processus par centre ---
+def _process_tree(pid):
+    """`pid` et ses descendants (maître gunicorn et workers)."""
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as children: pids.extend(int(child) for child in children.read().split())
+        except OSError: pass
+    return pids
+
+def _memory_mb(pids):
+    """Pss (pages partagées réparties entre les processus qui les partagent) et RSS cumulés, en Mo, lus dans /proc."""
+    totals = {"pss_mb": 0.0, "rss_mb": 0.0}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as rollup:
+                for line in rollup:
+                    key, value = line.split(':', 1)
+                    if key in ('Pss', 'Rss'): totals[f"{key.lower()}_mb"] += int(value.split()[0]) / 1024
+        except OSError: pass
+    return {key: round(value, 1) for key, value in totals.items()}
+
+def _start_server(port, threads, env):
+    return subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'), 'serve', '--port', str(port),
+                             '--workers', '1', '--threads', str(threads)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def _wait_ready(port, path):
+    for _ in range(150):
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5); connection.request('GET', path)
+            connection.getresponse().read(); connection.close(); return
+        except OSError: time.sleep(0.2)
+    raise RuntimeError(f"Le serveur du port {port} n'a pas démarré")
+
+def _tenant_client(targets, duration, seed, year):
+    """Client de charge : à chaque requête, un centre tiré au hasard parmi `targets` (port, préfixe d'URL) et une lecture
+    du premier écran ; une connexion keep-alive par port."""
+    rng = random.Random(seed); connections = {}
+    reads = ['/api/dashboard/summary', '/api/children', '/api/income?limit=50', '/api/bootstrap', f'/api/attendance?date={year}-03-15', '/api/alerts']
+    latencies = []; statuses = {}; deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        port, prefix = rng.choice(targets); started = time.perf_counter()
+        try:
+            connection = connections.get(port) or connections.setdefault(port, http.client.HTTPConnection('127.0.0.1', port, timeout=60))
+            connection.request('GET', prefix + rng.choice(reads)); response = connection.getresponse(); response.read(); status = response.status
+        except (OSError, http.client.HTTPException):
+            connections.pop(port).close(); status = 'erreur'
+        latencies.append(time.perf_counter() - started); statuses[status] = statuses.get(status, 0) + 1
+    for connection in connections.values(): connection.close()
+    return latencies, statuses
+
+def _run_tenant_load(targets, args, year):
+    with concurrent.futures.ProcessPoolExecutor(args.clients) as pool:
+        runs = list(pool.map(_tenant_client, [targets] * args.clients, [args.duration] * args.clients, range(args.clients), [year] * args.clients))
+    latencies = [latency for run, _ in runs for latency in run]; statuses = {}
+    for _, run_statuses in runs:
+        for status, count in run_statuses.items(): statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {"throughput_rps": round(len(latencies) / args.duration, 1), "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2), "statuses": statuses}
+
+def bench_tenants(args):
+    """Copie une base de centre dans `--tenants` dossiers, puis compare sous la même charge (lectures sur des centres tirés au
+    hasard) un seul « app.py serve » multi-centres, qui les sert tous, à un « app.py serve » par centre : mémoire (Pss du
+    maître et du worker) et latence. Pour la configuration un processus par centre, seuls `--sample` serveurs sont lancés ;
+    la mémoire pour tous les centres en est extrapolée."""
+    dataset = generate_dataset(args)
+    with garderie.app.app_context(): garderie.get_db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    year = datetime.date.today().year - 1; root = os.path.join(os.path.dirname(garderie.app.config['DATABASE']), 'centres')
+    names = [f"centre{index:03d}" for index in range(args.tenants)]
+    for name in names:
+        os.makedirs(os.path.join(root, name, 'uploads')); shutil.copy(garderie.app.config['DATABASE'], os.path.join(root, name, 'daycare.db'))
+    # Ni sauvegardes ni alertes planifiées : seules les requêtes sont mesurées, dans les deux configurations
+    env = {**os.environ, 'GARDERIE_BACKUP_INTERVAL_HOURS': '0', 'GARDERIE_ALERT_INTERVAL_SECONDS': '0'}
+    results = {}
+    server = _start_server(args.port, args.threads, {**env, 'GARDERIE_TENANTS_FOLDER': root, 'GARDERIE_DB_POOL_DATABASES': str(args.pool_databases)})
+    try:
+        _wait_ready(args.port, f"/t/{names[0]}/api/settings"); idle = _memory_mb(_process_tree(server.pid))
+        # Première requête de chaque centre : ouverture de la base (et migrations si la copie était ancienne)
+        started = time.perf_counter()
+        for name in names: _wait_ready(args.port, f"/t/{name}/api/dashboard/summary")
+        first_touch = (time.perf_counter() - started) / len(names)
+        load = _run_tenant_load([(args.port, f"/t/{name}") for name in names], args, year)
+        connection = http.client.HTTPConnection('127.0.0.1', args.port, timeout=5); connection.request('GET', '/metrics')
+        evictions = [line.split()[-1] for line in connection.getresponse().read().decode().splitlines() if line.startswith('sqlite_pool_evictions_total')]
+        connection.close()
+        results['one_process'] = {"processes": len(_process_tree(server.pid)), "idle": idle, "after_load": _memory_mb(_process_tree(server.pid)),
+                                  "first_request_ms": round(first_touch * 1000, 2), "pool_evictions": int(float(evictions[0])) if evictions else 0, **load}
+    finally:
+        server.terminate(); server.wait(30)
+    sample = names[:args.sample]; servers = []
+    try:
+        for index, name in enumerate(sample):
+            directory = os.path.join(root, name)
+            servers.append(_start_server(args.port + 1 + index, args.threads, {**env, 'GARDERIE_DATABASE': os.path.join(directory, 'daycare.db'),
+                                                                              'GARDERIE_UPLOAD_FOLDER': os.path.join(directory, 'uploads')}))
+        for index in range(len(sample)): _wait_ready(args.port + 1 + index, '/api/settings')
+        load = _run_tenant_load([(args.port + 1 + index, '') for index in range(len(sample))], args, year)
+        memory = _memory_mb([pid for server in servers for pid in _process_tree(server.pid)])
+        results['process_per_centre'] = {"processes_sampled": len(sample), "sampled": memory,
+                                         "extrapolated": {key: round(value * args.tenants / len(sample), 1) for key, value in memory.items()}, **load}
+    finally:
+        for server in servers: server.terminate()
+        for server in servers: server.wait(30)
+    return {"dataset": dataset, "tenants": args.tenants, "database_mb": round(os.path.getsize(garderie.app.config['DATABASE']) / 1e6, 1),
+            "pool_databases": args.pool_databases, "threads": args.threads, "clients": args.clients, "duration_s": args.duration, **results}
+
+BENCHMARKS = {'export': bench_export, 'uploads': bench_uploads, 'generate': bench_generate, 'routes': bench_routes, 'metrics': bench_metrics, 'server': bench_server, 'import': bench_import, 'backup': bench_backup, 'alerts': bench_alerts, 'stats': bench_stats, 'archive': bench_archive, 'tenants': bench_tenants}
+
+def add_dataset_arguments(parser, years=10, rows=500_000):
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--children', type=int, default=500)
+    parser.add_argument('--years', type=int, default=years)
+    parser.add_argument('--income-rows', type=int, default=rows)
+    parser.add_argument('--expense-rows', type=int, default=rows)
+    parser.add_argument('--documents', type=int, default=2000)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bancs d'essai de l'application Garderie")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    export_parser = subparsers.add_parser('export', help="export CSV en flux d'un grand nombre de revenus")
+    export_parser.add_argument('--rows', type=int, default=1_000_000)
+    uploads_parser = subparsers.add_parser('uploads', help="service d'un gros fichier : complet, Range, 304, X-Accel-Redirect")
+    uploads_parser.add_argument('--size-mb', type=int, default=50)
+    uploads_parser.add_argument('--repeat', type=int, default=20)
+    generate_parser = subparsers.add_parser('generate', help="génère un jeu de données synthétique reproductible dans une base SQLite")
+    generate_parser.add_argument('--output', required=True)
+    add_dataset_arguments(generate_parser)
+    routes_parser = subparsers.add_parser('routes', help="latence p50/p99, débit et mémoire de chaque route de l'API")
+    routes_parser.add_argument('--database', help="base produite par 'generate' (copiée, jamais modifiée) ; sinon générée")
+    routes_parser.add_argument('--requests', type=int, default=50)
+    routes_parser.add_argument('--warmup', type=int, default=3)
+    routes_parser.add_argument('--output', help="fichier JSON du résultat (sinon affiché)")
+    add_dataset_arguments(routes_parser)
+    compare_parser = subparsers.add_parser('compare', help="compare deux résultats de 'routes'")
+    compare_parser.add_argument('before'); compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help="hausse de p50/p99 (%%) signalée comme régression")
+    metrics_parser = subparsers.add_parser('metrics', help="surcoût de l'instrumentation /metrics par route et sur un export")
+    metrics_parser.add_argument('--requests', type=int, default=200)
+    add_dataset_arguments(metrics_parser, years=2, rows=100_000)
+    import_parser = subparsers.add_parser('import', help="import CSV en lot d'un relevé bancaire, réimport (doublons) et comparaison avec un POST par ligne")
+    import_parser.add_argument('--rows', type=int, default=100_000)
+    add_dataset_arguments(import_parser, years=2, rows=100_000)
+    backup_parser = subparsers.add_parser('backup', help="blocage de l'application pendant la sauvegarde en ligne d'une grosse base")
+    backup_parser.add_argument('--size-gb', type=float, default=2.0, help="taille ajoutée par une table de remplissage")
+    add_dataset_arguments(backup_parser, years=1, rows=20_000)
+    alerts_parser = subparsers.add_parser('alerts', help="évaluation incrémentale des alertes et coût de /api/alerts")
+    alerts_parser.add_argument('--changes', type=int, default=20, help="revenus ajoutés entre deux évaluations")
+    alerts_parser.add_argument('--repeat', type=int, default=200)
+    add_dataset_arguments(alerts_parser, years=2, rows=100_000)
+    stats_parser = subparsers.add_parser('stats', help="statistiques mensuelles par enfant : calcul à froid par année (NumPy et sans NumPy), cache, 304")
+    stats_parser.add_argument('--repeat', type=int, default=50)
+    add_dataset_arguments(stats_parser)
+    archive_parser = subparsers.add_parser('archive', help="clôture des années terminées : taille de la base et des sauvegardes, latence avant et après")
+    archive_parser.add_argument('--repeat', type=int, default=20)
+    add_dataset_arguments(archive_parser)
+    server_parser = subparsers.add_parser('server', help="débit du serveur de production (python app.py serve) selon le nombre de workers")
+    server_parser.add_argument('--workers', default='1,2,4', help="nombres de workers à comparer, séparés par des virgules")
+    server_parser.add_argument('--threads', type=int, default=4)
+    server_parser.add_argument('--clients', type=int, default=16, help="processus clients simultanés")
+    server_parser.add_argument('--duration', type=float, default=15.0, help="durée de chaque mesure (s)")
+    server_parser.add_argument('--write-ratio', type=float, default=0.2, help="part des requêtes qui écrivent")
+    server_parser.add_argument('--port', type=int, default=5099)
+    add_dataset_arguments(server_parser, years=2, rows=50_000)
+    tenants_parser = subparsers.add_parser('tenants', help="multi-centres : mémoire et latence d'un processus pour tous les centres contre un processus par centre")
+    tenants_parser.add_argument('--tenants', type=int, default=200)
+    tenants_parser.add_argument('--sample', type=int, default=10, help="serveurs lancés pour la configuration un processus par centre")
+    tenants_parser.add_argument('--pool-databases', type=int, default=32, help="DB_POOL_DATABASES du serveur multi-centres")
+    tenants_parser.add_argument('--threads', type=int, default=4)
+    tenants_parser.add_argument('--clients', type=int, default=8, help="processus clients simultanés")
+    tenants_parser.add_argument('--duration', type=float, default=15.0, help="durée de chaque mesure (s)")
+    tenants_parser.add_argument('--port', type=int, default=5199)
+    add_dataset_arguments(tenants_parser, years=2, rows=5_000)
+    tenants_parser.set_defaults(children=20, documents=50)  # taille d'un service de garde en milieu familial
+    args = parser.parse_args()
+    if args.benchmark == 'compare': sys.exit(1 if compare_runs(args) else 0)
+    directory = tempfile.mkdtemp(prefix='garderie_bench_')
+    try:
+        if getattr(args, 'database', None): shutil.copy(args.database, os.path.join(directory, 'daycare.db'))
+        setup_database(directory)
+        result = json.dumps(BENCHMARKS[args.benchmark](args), indent=2)
+        if getattr(args, 'output', None) and args.benchmark == 'routes':
+            with open(args.output, 'w') as output: output.write(result)
+            print(f"Résultat écrit dans {args.output}")
+        else: print(result)
+    finally:
+        # Les miniatures en cours écrivent encore dans le dossier temporaire
+        if garderie._thumbnail_pool: garderie._thumbnail_pool.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
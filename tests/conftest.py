@@ -0,0 +1,31 @@
+# Fixtures communes : chaque test travaille sur une base vide dans un dossier temporaire (daycare.db n'est jamais touchée)
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as garderie
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Application pointée vers tmp_path, schéma à jour ; miniatures générées dans un fil plutôt qu'un processus."""
+    for key, name in garderie.TENANT_PATHS.items(): monkeypatch.setitem(garderie.app.config, key, str(tmp_path / name))
+    monkeypatch.setitem(garderie.app.config, 'TESTING', True)
+    os.makedirs(garderie.app.config['UPLOAD_FOLDER'])
+    thumbnails = ThreadPoolExecutor(1); monkeypatch.setattr(garderie, '_thumbnail_pool', thumbnails)
+    with garderie.app.app_context(): garderie.init_db()
+    yield garderie.app
+    thumbnails.shutdown(wait=True); garderie.pool.clear()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def db(app):
+    """Connexion propre au test (hors pool), sur la même base que le client."""
+    connection = garderie._connect()
+    yield connection
+    connection.close()
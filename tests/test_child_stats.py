@@ -0,0 +1,46 @@
+import pytest
+
+import app as garderie
+
+@pytest.fixture(params=['numpy', 'python'])
+def stats_path(request, monkeypatch):
+    """Les deux calculs de compute_child_stats : tableaux NumPy et boucles Python."""
+    if request.param == 'numpy':
+        if garderie.np is None: pytest.skip("NumPy n'est pas installé")
+    else: monkeypatch.setattr(garderie, 'np', None)
+    return request.param
+
+def add_child(client, first_name):
+    return client.post('/api/children', json={'firstName': first_name, 'lastName': 'Test', 'dob': '2022-01-01'}).get_json()['id']
+
+def test_closed_year_with_deleted_child(app, client, stats_path):
+    kept, deleted = add_child(client, 'Alice'), add_child(client, 'Bruno')
+    for day in ('2024-03-04', '2024-03-05'):
+        response = client.post('/api/attendance', json={'date': day, 'attendance': {str(kept): {'status': 'present_full'}, str(deleted): {'status': 'present_full'}}})
+        assert response.status_code == 200
+    client.post('/api/income', json={'date': '2024-03-31', 'source': 'parent_contribution', 'amount': 50, 'relatedChildId': deleted})
+    with app.app_context(): garderie.close_fiscal_year(garderie.get_db(), 2024)
+    assert client.delete(f'/api/children/{deleted}').status_code == 200
+    # Les présences de l'enfant supprimé restent dans l'archive : ignorées, sans erreur
+    response = client.get('/api/stats/children?year=2024')
+    assert response.status_code == 200
+    children = response.get_json()['children']
+    assert [child['id'] for child in children] == [kept]
+    assert children[0]['attended_days'][2] == 2 and children[0]['year']['attended_days'] == 2
+
+def test_attendance_edited_after_close(app, client, stats_path):
+    child = add_child(client, 'Alice'); day = '2023-03-06'
+    for date in ('2023-03-06', '2023-03-07'):
+        assert client.post('/api/attendance', json={'date': date, 'attendance': {str(child): {'status': 'present_full'}}}).status_code == 200
+    with app.app_context(): garderie.close_fiscal_year(garderie.get_db(), 2023)
+    # Correction d'un jour archivé : la ligne active remplace l'archivée dans toutes les lectures
+    response = client.post('/api/attendance', json={'date': day, 'attendance': {str(child): {'status': 'absent_justified', 'notes': 'malade'}}})
+    assert response.status_code == 200 and response.get_json()['saved'] == 1
+    assert client.get(f'/api/attendance?date={day}').get_json() == {str(child): {'child_id': child, 'status': 'absent_justified', 'notes': 'malade'}}
+    matrix = client.get('/api/attendance?from=2023-03-06&to=2023-03-07').get_json()
+    assert matrix['children'] == {str(child): ['absent_justified', 'present_full']} and matrix['notes'] == {str(child): {day: 'malade'}}
+    stats = client.get('/api/stats/children?year=2023').get_json()['children'][0]
+    assert stats['year']['attended_days'] == 1 and stats['attended_days'][2] == 1
+    # Nouvelle clôture : même résultat une fois la correction déplacée dans l'archive
+    with app.app_context(): garderie.close_fiscal_year(garderie.get_db(), 2023)
+    assert client.get('/api/stats/children?year=2023').get_json()['children'][0] == stats
@@ -0,0 +1,36 @@
+import pytest
+
+import app as garderie
+
+VERSIONED_URLS = ['/api/dashboard/summary', '/api/bootstrap', '/api/children', '/api/parents', '/api/income?limit=10', '/api/expenses',
+                  '/api/attendance?date=2025-03-04', '/api/documents', '/api/settings', '/api/alerts', '/api/search?q=alice', '/api/stats/children?year=2025']
+
+@pytest.fixture
+def traced(app, client):
+    """Instructions SQL exécutées par les connexions du pool (celles que le client de test réutilise d'une requête à l'autre)."""
+    statements = []
+    def start():
+        for connection in garderie.pool.databases[app.config['DATABASE']]: connection.set_trace_callback(statements.append)
+    return start, statements
+
+@pytest.fixture
+def filled(client):
+    child = client.post('/api/children', json={'firstName': 'Alice', 'lastName': 'Test', 'dob': '2022-01-01'}).get_json()['id']
+    client.post('/api/income', json={'date': '2025-03-04', 'source': 'parent_contribution', 'amount': 100, 'relatedChildId': child})
+    client.post('/api/attendance', json={'date': '2025-03-04', 'attendance': {str(child): {'status': 'present_full'}}})
+    return child
+
+@pytest.mark.parametrize('url', VERSIONED_URLS)
+def test_304_reads_only_table_versions(client, filled, traced, url):
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers['ETag'].startswith('W/')
+    start, statements = traced; start()
+    response = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304 and response.headers['ETag'] == first.headers['ETag']
+    assert len(statements) == 1 and statements[0].startswith('SELECT name, version FROM table_versions')
+
+def test_write_changes_etag(client, filled):
+    first = client.get('/api/children')
+    client.post('/api/children', json={'firstName': 'Bruno', 'lastName': 'Test', 'dob': '2022-01-01'})
+    response = client.get('/api/children', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200 and response.headers['ETag'] != first.headers['ETag'] and len(response.get_json()) == 2
@@ -0,0 +1,64 @@
+# Réponses des écritures (INSERT/UPDATE ... RETURNING) : identiques à celles d'avant la réécriture, qui relisaient la ligne
+# avec get_*_by_id après le commit, et aux lignes des listes
+import io
+
+import pytest
+
+import app as garderie
+
+def legacy_payload(app, getter, row_id):
+    """Réponse d'avant RETURNING : la ligne relue par get_*_by_id."""
+    with app.app_context(): return getattr(garderie, getter)(row_id)
+
+def check(app, client, response, getter, list_url, status=201):
+    assert response.status_code == status
+    payload = response.get_json()
+    assert payload == legacy_payload(app, getter, payload['id'])
+    assert payload == client.get(f"{list_url}/{payload['id']}").get_json()
+    # Les listes ajoutent parfois des colonnes jointes (nom de l'enfant des revenus) : comparées sur les colonnes de la ligne
+    listed = next(item for item in client.get(list_url).get_json() if item['id'] == payload['id'])
+    assert {key: listed[key] for key in payload} == payload
+    return payload
+
+@pytest.fixture
+def parent(app, client):
+    return check(app, client, client.post('/api/parents', json={'name': 'Marie Test', 'phone': '514-555-0000', 'email': 'marie@example.com'}), 'get_parent_by_id', '/api/parents')
+
+@pytest.fixture
+def child(app, client, parent):
+    return check(app, client, client.post('/api/children', json={'firstName': 'Alice', 'lastName': 'Test', 'dob': '2022-01-01', 'parentId': parent['id'], 'allergies': 'arachides'}),
+                 'get_child_by_id', '/api/children')
+
+def test_children(app, client, child, parent):
+    updated = check(app, client, client.put(f"/api/children/{child['id']}", json={'firstName': 'Alicia', 'lastName': 'Test', 'dob': '2022-01-02', 'parentId': parent['id']}),
+                    'get_child_by_id', '/api/children', 200)
+    assert updated['first_name'] == 'Alicia'
+    assert client.put(f"/api/children/{child['id']}/status", json={'status': 'inactive'}).status_code == 200
+    assert legacy_payload(app, 'get_child_by_id', child['id'])['status'] == 'inactive'
+
+def test_parents(app, client, parent):
+    updated = check(app, client, client.put(f"/api/parents/{parent['id']}", json={'name': 'Marie Autre', 'email': 'marie@example.com'}), 'get_parent_by_id', '/api/parents', 200)
+    assert updated['name'] == 'Marie Autre'
+
+def test_income(app, client, child):
+    # Montant entier : renvoyé en REAL (10.0) comme la ligne relue, pas en entier
+    income = check(app, client, client.post('/api/income', json={'date': '2025-03-04', 'source': 'parent_contribution', 'amount': 10, 'relatedChildId': child['id']}),
+                   'get_income_by_id', '/api/income')
+    assert isinstance(income['amount'], float)
+    check(app, client, client.put(f"/api/income/{income['id']}", json={'date': '2025-03-05', 'source': 'govt_support', 'amount': 25, 'relatedChildId': child['id']}),
+          'get_income_by_id', '/api/income', 200)
+
+def test_expenses(app, client):
+    expense = check(app, client, client.post('/api/expenses', data={'date': '2025-03-04', 'category': 'food', 'amount': '12', 'vendor': 'Épicerie', 'is_personal': 'true',
+                                                                   'receipt': (io.BytesIO(b'%PDF-1.4 recu'), 'recu.pdf')}), 'get_expense_by_id', '/api/expenses')
+    assert expense['receipt_filename'] and expense['is_personal'] == 1
+    check(app, client, client.put(f"/api/expenses/{expense['id']}", json={'date': '2025-03-06', 'category': 'toys', 'amount': 8, 'is_personal': False}),
+          'get_expense_by_id', '/api/expenses', 200)
+
+def test_documents(app, client):
+    document = check(app, client, client.post('/api/documents', data={'type': 'Assurance', 'description': 'Police 2025', 'document': (io.BytesIO(b'%PDF-1.4 police'), 'police.pdf')}),
+                     'get_document_by_id', '/api/documents')
+    check(app, client, client.put(f"/api/documents/{document['id']}", json={'type': 'Assurance', 'description': 'Police 2026'}), 'get_document_by_id', '/api/documents', 200)
+
+def test_missing_row(client):
+    assert client.put('/api/income/999', json={'date': '2025-03-04', 'source': 'other', 'amount': 1}).status_code == 404
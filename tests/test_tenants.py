@@ -0,0 +1,51 @@
+import pytest
+
+import app as garderie
+
+TOKEN = 'secret-admin'
+
+@pytest.fixture
+def tenants(app, tmp_path, monkeypatch):
+    """Mode multi-centres avec trois centres migrés et un pool limité à une base."""
+    monkeypatch.setitem(app.config, 'TENANTS_FOLDER', str(tmp_path / 'centres'))
+    monkeypatch.setitem(app.config, 'DB_POOL_DATABASES', 1)
+    names = ['alpha', 'beta', 'gamma']
+    for name in names:
+        with garderie.tenant_context(name), app.app_context():
+            (tmp_path / 'centres' / name / 'uploads').mkdir(parents=True); garderie.init_db()
+    garderie.pool.clear()
+    for name in names:
+        with garderie.tenant_context(name): garderie.forget_database(app.config['DATABASE'])
+    return names
+
+def database(app, tenant):
+    with garderie.tenant_context(tenant): return app.config['DATABASE']
+
+def test_prefix_routing(client, tenants):
+    assert client.post('/t/alpha/api/children', json={'firstName': 'Ana', 'lastName': 'A', 'dob': '2022-01-01'}).status_code == 201
+    assert len(client.get('/t/alpha/api/children').get_json()) == 1 and client.get('/t/beta/api/children').get_json() == []
+    assert client.get('/api/children').status_code == 404 and client.get('/t/inconnu/api/children').status_code == 404
+
+def test_background_tasks_leave_caches_bounded(app, client, tenants):
+    client.get('/t/alpha/api/settings')
+    seen = []
+    def task():
+        with garderie.closing(garderie._connect()) as db: garderie.load_settings(db); seen.append(garderie.current_tenant())
+    garderie.run_for_each_tenant(task, 'test')
+    assert seen == tenants
+    # Seul le centre résident (dans le pool) garde ses entrées ; les autres sont oubliés après leur passage
+    resident = [database(app, 'alpha')]
+    assert list(garderie.pool.databases) == resident
+    assert [key for key in garderie._settings_cache if key in map(lambda name: database(app, name), tenants)] == resident
+    assert not {database(app, name) for name in tenants[1:]} & garderie._wal_configured
+
+def test_summary_requires_admin_token(app, client, tenants, monkeypatch):
+    client.post('/t/beta/api/income', json={'date': '2025-03-04', 'source': 'other', 'amount': 40})
+    assert client.get('/api/centres/summary?from=2025').status_code == 403
+    monkeypatch.setitem(app.config, 'CENTRES_SUMMARY_TOKEN', TOKEN)
+    assert client.get('/api/centres/summary?from=2025').status_code == 401
+    assert client.get('/api/centres/summary?from=2025', headers={'Authorization': 'Bearer autre'}).status_code == 401
+    response = client.get('/api/centres/summary?from=2025', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert [centre['centre'] for centre in summary['centres']] == tenants and summary['totals']['monthly_income'] == 40
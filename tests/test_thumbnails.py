@@ -0,0 +1,33 @@
+import io
+
+import pytest
+
+import app as garderie
+
+@pytest.fixture
+def png():
+    if garderie.Image is None: pytest.skip("Pillow n'est pas installé")
+    output = io.BytesIO(); garderie.Image.new('RGB', (640, 480), 'red').save(output, 'PNG')
+    return output.getvalue()
+
+def wait_for_thumbnails():
+    # Un seul fil dans le pool de test : une tâche vide passe après les miniatures (et leur enregistrement) en attente
+    garderie._thumbnail_pool.submit(lambda: None).result()
+
+def test_created_expense_has_thumbnail_url(client, png):
+    form = lambda: {'date': '2025-03-04', 'category': 'food', 'amount': '12.5', 'receipt': (io.BytesIO(png), 'recu.png')}
+    first = client.post('/api/expenses', data=form()).get_json(); wait_for_thumbnails()
+    assert first['thumbnail_url'] is None
+    # Même contenu : le fichier et sa miniature existent déjà, la réponse de création les donne comme le détail et la liste
+    second = client.post('/api/expenses', data=form()).get_json()
+    assert second['thumbnail_url'] and second['thumbnail_url'].endswith('.webp')
+    assert second == client.get(f"/api/expenses/{second['id']}").get_json()
+    assert second in client.get('/api/expenses').get_json()
+    assert client.get(second['thumbnail_url']).status_code == 200
+
+def test_created_document_has_thumbnail_url(client, png):
+    first = client.post('/api/documents', data={'type': 'Photo', 'document': (io.BytesIO(png), 'photo.png')}).get_json(); wait_for_thumbnails()
+    second = client.post('/api/documents', data={'type': 'Photo', 'document': (io.BytesIO(png), 'copie.png')}).get_json()
+    assert first['thumbnail_url'] is None and second['thumbnail_url'].endswith('.webp')
+    assert second == client.get(f"/api/documents/{second['id']}").get_json()
+    assert second in client.get('/api/documents').get_json()
@@ -0,0 +1,72 @@
+# Validation des entrées : les modifications (PUT) suivent les mêmes règles que les ajouts et l'import,
+# et le corps d'un import est plafonné comme un fichier téléversé
+import io
+import os
+
+import pytest
+
+@pytest.fixture
+def child(client):
+    response = client.post('/api/children', json={'firstName': 'Alice', 'lastName': 'Test', 'dob': '2022-01-01'})
+    assert response.status_code == 201; return response.get_json()
+
+@pytest.fixture
+def income(client):
+    response = client.post('/api/income', json={'date': '2024-03-04', 'source': 'Frais de garde', 'amount': 50})
+    assert response.status_code == 201; return response.get_json()
+
+@pytest.fixture
+def expense(client):
+    response = client.post('/api/expenses', data={'date': '2024-03-04', 'category': 'Nourriture', 'amount': '12.50', 'is_personal': 'true'})
+    assert response.status_code == 201; return response.get_json()
+
+@pytest.mark.parametrize('changes', [{'parentId': 'abc'}, {'parentId': [1]}, {'dob': '2022-02-30'}, {'dob': '01/01/2022'}, {'firstName': ''}])
+def test_update_child_rejects_bad_values(client, child, changes):
+    response = client.put(f"/api/children/{child['id']}", json={'firstName': 'Alicia', 'lastName': 'Test', 'dob': '2022-01-02', **changes})
+    assert response.status_code == 400 and response.get_json()['error']
+    assert client.get(f"/api/children/{child['id']}").get_json() == child
+
+def test_update_child_keeps_status(client, child):
+    assert client.put(f"/api/children/{child['id']}/status", json={'status': 'inactive'}).status_code == 200
+    response = client.put(f"/api/children/{child['id']}", json={'firstName': 'Alicia', 'lastName': 'Test', 'dob': '2022-01-02', 'parentId': ''})
+    assert response.status_code == 200
+    updated = response.get_json()
+    assert (updated['first_name'], updated['dob'], updated['parent_id'], updated['status']) == ('Alicia', '2022-01-02', None, 'inactive')
+
+@pytest.mark.parametrize('date', ['2024-13-01', '04/03/2024', 'hier', None])
+def test_update_income_rejects_bad_date(client, income, date):
+    response = client.put(f"/api/income/{income['id']}", json={'date': date, 'source': 'Frais de garde', 'amount': 50})
+    assert response.status_code == 400
+    assert client.get(f"/api/income/{income['id']}").get_json()['date'] == '2024-03-04'
+
+@pytest.mark.parametrize('date', ['2024-02-30', '2024/03/04', '', None])
+def test_update_expense_rejects_bad_date(client, expense, date):
+    response = client.put(f"/api/expenses/{expense['id']}", json={'date': date, 'category': 'Nourriture', 'amount': 12.5})
+    assert response.status_code == 400
+    assert client.get(f"/api/expenses/{expense['id']}").get_json()['date'] == '2024-03-04'
+
+def test_update_expense_keeps_receipt_and_validates(client, expense):
+    response = client.put(f"/api/expenses/{expense['id']}", json={'date': '2024-03-05', 'category': 'Nourriture', 'amount': '-1'})
+    assert response.status_code == 400
+    response = client.put(f"/api/expenses/{expense['id']}", json={'date': '2024-03-05', 'category': 'Nourriture', 'amount': 20, 'is_personal': False})
+    assert response.status_code == 200
+    updated = response.get_json()
+    assert (updated['date'], updated['amount'], updated['is_personal'], updated['receipt_filename']) == ('2024-03-05', 20.0, 0, expense['receipt_filename'])
+
+def csv_body(rows):
+    return 'date,source,amount\n' + ''.join(f"2024-03-{day % 28 + 1:02d},Frais de garde,{day}\n" for day in range(rows))
+
+def test_import_body_within_limit(client):
+    response = client.post('/api/import/income?dry_run=1', data=csv_body(100), content_type='text/csv')
+    assert response.status_code == 200 and response.get_json()['dry_run']
+
+def test_import_body_too_large(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_UPLOAD_MB', 1)
+    body = csv_body(60000); assert len(body) > 1024 * 1024
+    response = client.post('/api/import/income', data=body, content_type='text/csv')
+    assert response.status_code == 413 and 'Mo' in response.get_json()['error']
+    # Corps sans Content-Length (transfert par blocs) : coupé au fil de la copie, sans fichier temporaire laissé derrière
+    response = client.post('/api/import/income', input_stream=io.BytesIO(body.encode()), content_type='text/csv', headers={'Transfer-Encoding': 'chunked'}, environ_base={'wsgi.input_terminated': True})
+    assert response.status_code == 413
+    assert client.get('/api/income').get_json() == []
+    assert not any(name.endswith('.part') for name in os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], 'tmp')))